@@ -3,25 +3,30 @@ from __future__ import print_function
 
 import argparse
 import base64
+import json
 import os
 import sys
 import logging
 
-import keyring
+from importlib import import_module
+
 from six import print_ as print
-from tzlocal import get_localzone
 
 from aws_google_auth import _version
-from aws_google_auth import amazon
-from aws_google_auth import configuration
-from aws_google_auth import google
-from aws_google_auth import util
+from aws_google_auth import errors
+from aws_google_auth import status
+
+# The login code and its dependencies (requests, BeautifulSoup, botocore,
+# keyring) take a few hundred milliseconds to import, so the functions below
+# import them when they need them: `aws-google-auth status` runs from shell
+# prompts and must not pay for them.
 
 
 def parse_args(args):
     parser = argparse.ArgumentParser(
         prog="aws-google-auth",
         description="Acquire temporary AWS credentials via Google SSO",
+        epilog="commands: " + ", ".join(sorted(COMMANDS)) + " (see aws-google-auth COMMAND -h)",
     )
 
     parser.add_argument('-u', '--username', help='Google Apps username ($GOOGLE_USERNAME)')
@@ -35,18 +40,26 @@ def parse_args(args):
     parser.add_argument('-A', '--account', help='Filter for specific AWS account.')
     parser.add_argument('-D', '--disable-u2f', action='store_true', help='Disable U2F functionality.')
     parser.add_argument('-q', '--quiet', action='store_true', help='Quiet output')
+    parser.add_argument('--non-interactive', action='store_true', help='Never prompt: fail with a distinct exit code when an answer would be needed, and print the outcome as JSON (implies --quiet).')
     parser.add_argument('--bg-response', help='Override default bgresponse challenge token.')
     parser.add_argument('--saml-assertion', dest="saml_assertion", help='Base64 encoded SAML assertion to use.')
     parser.add_argument('--no-cache', dest="saml_cache", action='store_false', help='Do not cache the SAML Assertion.')
     parser.add_argument('--print-creds', action='store_true', help='Print Credentials.')
     parser.add_argument('--resolve-aliases', action='store_true', help='Resolve AWS account aliases.')
+    parser.add_argument('--alias-role', help='Resolve account names with this role\'s organizations:ListAccounts instead of one call per account ($AWS_ALIAS_ROLE_ARN)')
+    parser.add_argument('--alias-file', help='JSON file mapping account IDs to names, used before any other way of resolving aliases ($AWS_ALIAS_FILE)')
     parser.add_argument('--save-failure-html', action='store_true', help='Write HTML failure responses to file for troubleshooting.')
-    parser.add_argument('--save-saml-flow', action='store_true', help='Write all GET and PUT requests and HTML responses to/from Google to files for troubleshooting.')
+    parser.add_argument('--save-saml-flow', action='store_true', help='Write all GET and PUT requests and HTML responses to/from Google to a compressed file for troubleshooting.')
+    parser.add_argument('--timings', nargs='?', const='text', choices=['text', 'json'], help='Print how long each step took to stderr, as a table or as JSON (default: text).')
+    parser.add_argument('--probe-sts', action='store_true', help='Use the STS endpoint with the lowest latency from this network (probed, then cached per network) instead of the region\'s.')
+    parser.add_argument('--metrics', help='Send login and STS metrics to statsd://host:port[/prefix] or file:///path ($AWS_GOOGLE_AUTH_METRICS).')
 
     role_group = parser.add_mutually_exclusive_group()
     role_group.add_argument('-a', '--ask-role', action='store_true', help='Set true to always pick the role')
-    role_group.add_argument('-r', '--role-arn', help='The ARN of the role to assume')
+    role_group.add_argument('-r', '--role-arn', help='The ARN of the role to assume, or a glob (*:role/admin) or /regex/ matching it')
+    parser.add_argument('--chain-role', action='append', metavar='[PROFILE=]ROLE_ARN', help='After assuming the role, assume this role with its credentials and store them as PROFILE (default: <profile>-<account>-<role name>). Repeat for several roles; they replace the ones remembered in the profile.')
     parser.add_argument('-k', '--keyring', action='store_true', help='Use keyring for storing the password.')
+    parser.add_argument('--totp-keyring', action='store_true', help='Answer MFA token challenges with codes generated from a TOTP secret kept in the keyring (asked for on first use).')
     parser.add_argument('-l', '--log', dest='log_level', choices=['debug',
                         'info', 'warn'], default='warn', help='Select log level (default: %(default)s)')
     parser.add_argument('-V', '--version', action='version',
@@ -55,6 +68,26 @@ def parse_args(args):
     return parser.parse_args(args)
 
 
+def _command(module):
+    """The main() of `module`, imported only when the command is run."""
+    def main(cli_args):
+        return import_module('aws_google_auth.' + module).main(cli_args)
+    return main
+
+
+# Sub-commands, dispatched on the first command line argument. Each one takes
+# the remaining arguments and parses them itself.
+COMMANDS = {
+    'broker': _command('broker'),
+    'credential-process': _command('process'),
+    'eks-token': _command('eks'),
+    'exec': _command('execute'),
+    'generate-profiles': _command('profiles'),
+    'scheduler': _command('scheduler'),
+    'status': status.main,
+}
+
+
 def exit_if_unsupported_python():
     if sys.version_info.major == 2 and sys.version_info.minor < 7:
         logging.critical("%s requires Python 2.7 or higher. Please consider "
@@ -70,23 +103,62 @@ def exit_if_unsupported_python():
 
 
 def cli(cli_args):
+    # Needs none of the imports below
+    if cli_args and cli_args[0] == 'status':
+        COMMANDS['status'](cli_args[1:])
+        return
+
+    from aws_google_auth import metrics
+    from aws_google_auth import timings
+    from aws_google_auth import util
+
+    args = None
     try:
         exit_if_unsupported_python()
 
+        if cli_args and cli_args[0] in COMMANDS:
+            COMMANDS[cli_args[0]](cli_args[1:])
+            return
+
         args = parse_args(args=cli_args)
 
-        config = resolve_config(args)
-        process_auth(args, config)
-    except google.ExpectedGoogleException as ex:
-        print(ex)
-        sys.exit(1)
+        run_timings = timings.Timings(sink=metrics.sink_from_url(
+            util.Util.coalesce(args.metrics, os.getenv('AWS_GOOGLE_AUTH_METRICS'))))
+        try:
+            with run_timings.phase('read config'):
+                config = resolve_config(args)
+            amazon_client = process_auth(args, config, run_timings)
+        finally:
+            if args.timings:
+                print(run_timings.report(args.timings), file=sys.stderr)
+            run_timings.close()
+
+        if args.non_interactive:
+            print_result(status='ok', exit_code=errors.EXIT_OK, profile=config.profile, role_arn=config.role_arn,
+                         expiration=amazon_client.expiration.isoformat())
+    except errors.ExpectedGoogleException as ex:
+        if args is not None and args.non_interactive:
+            print_result(status='error', exit_code=ex.exit_code, error=ex.kind, message=str(ex))
+        else:
+            print(ex)
+        sys.exit(ex.exit_code)
     except KeyboardInterrupt:
         pass
     except Exception as ex:
         logging.exception(ex)
+        if args is not None and args.non_interactive:
+            print_result(status='error', exit_code=errors.EXIT_FAILURE, error='unexpected', message=str(ex))
+        sys.exit(errors.EXIT_FAILURE)
+
+
+def print_result(**result):
+    """Print the outcome of a --non-interactive run as one line of JSON."""
+    print(json.dumps(result, sort_keys=True))
 
 
 def resolve_config(args):
+    from aws_google_auth import configuration
+    from aws_google_auth import util
 
     # Shortening Convenience functions
     coalesce = util.Util.coalesce
@@ -119,8 +191,8 @@ def resolve_config(args):
 
     # Automatic duration (Option priority = ARGS, ENV_VAR, DEFAULT)
     config.auto_duration = coalesce(
-        args.auto_duration,
-        os.getenv('AUTO_DURATION'),
+        args.auto_duration or None,
+        util.Util.parse_bool(os.getenv('AUTO_DURATION')),
         config.auto_duration
     )
 
@@ -160,6 +232,22 @@ def resolve_config(args):
         os.getenv('RESOLVE_AWS_ALIASES'),
         config.resolve_aliases)
 
+    # Alias role (Option priority = ARGS, ENV_VAR, DEFAULT)
+    config.alias_role = coalesce(
+        args.alias_role,
+        os.getenv('AWS_ALIAS_ROLE_ARN'),
+        config.alias_role)
+
+    # Alias file (Option priority = ARGS, ENV_VAR, DEFAULT)
+    config.alias_file = coalesce(
+        args.alias_file,
+        os.getenv('AWS_ALIAS_FILE'),
+        config.alias_file)
+
+    # Chained roles (Option priority = ARGS, DEFAULT)
+    if args.chain_role:
+        config.chain_roles = configuration.parse_chain_roles(args.chain_role, config.profile)
+
     # Username (Option priority = ARGS, ENV_VAR, DEFAULT)
     config.username = coalesce(
         args.username,
@@ -176,13 +264,21 @@ def resolve_config(args):
         args.keyring,
         config.keyring)
 
+    config.totp_keyring = coalesce(
+        args.totp_keyring or None,
+        config.totp_keyring)
+
+    config.probe_sts = coalesce(
+        args.probe_sts or None,
+        config.probe_sts)
+
     config.print_creds = coalesce(
         args.print_creds,
         config.print_creds)
 
     # Quiet
     config.quiet = coalesce(
-        args.quiet,
+        args.quiet or args.non_interactive,
         config.quiet)
 
     config.bg_response = coalesce(
@@ -193,12 +289,32 @@ def resolve_config(args):
     return config
 
 
-def process_auth(args, config):
+def process_auth(args, config, run_timings=None):
+    import keyring
+    from tzlocal import get_localzone
+
+    from aws_google_auth import amazon
+    from aws_google_auth import endpoints
+    from aws_google_auth import google
+    from aws_google_auth import picker
+    from aws_google_auth import ratelimit
+    from aws_google_auth import timings
+    from aws_google_auth import totp
+    from aws_google_auth import util
+
     # Set up logging
     logging.getLogger().setLevel(getattr(logging, args.log_level.upper(), None))
 
+    if run_timings is None:
+        run_timings = timings.Timings()
+    config.timings = run_timings
+
+    # Headless runs fail with an errors.InputRequired wherever they would
+    # otherwise prompt.
+    interactive = not args.non_interactive
+
     if config.region is None:
-        config.region = util.Util.get_input("AWS Region: ")
+        config.region = util.Util.get_input("AWS Region: ", interactive)
         logging.debug('%s: region is: %s', __name__, config.region)
 
     # If there is a valid cache and the user opted to use it, use that instead
@@ -206,48 +322,82 @@ def process_auth(args, config):
     # such as username or sp_id and idp_id, as those are built into the SAML
     # response). The user does not need to be prompted for a password if the
     # SAML cache is used.
+    sts_client = None
     if args.saml_assertion:
         saml_xml = base64.b64decode(args.saml_assertion)
     elif args.saml_cache and config.saml_cache:
         saml_xml = config.saml_cache
         logging.info('%s: SAML cache found', __name__)
+        run_timings.incr('saml_cache.hit')
     else:
         # No cache, continue without.
         logging.info('%s: SAML cache not found', __name__)
+        if args.saml_cache:
+            run_timings.incr('saml_cache.miss')
         if config.username is None:
-            config.username = util.Util.get_input("Google username: ")
+            config.username = util.Util.get_input("Google username: ", interactive)
             logging.debug('%s: username is: %s', __name__, config.username)
         if config.idp_id is None:
-            config.idp_id = util.Util.get_input("Google IDP ID: ")
+            config.idp_id = util.Util.get_input("Google IDP ID: ", interactive)
             logging.debug('%s: idp is: %s', __name__, config.idp_id)
         if config.sp_id is None:
-            config.sp_id = util.Util.get_input("Google SP ID: ")
+            config.sp_id = util.Util.get_input("Google SP ID: ", interactive)
             logging.debug('%s: sp is: %s', __name__, config.sp_id)
 
+        # Validate Options before anything is sent to Google or STS (the
+        # password and TOTP secret are checked again once they are known)
+        config.raise_if_invalid()
+
+        # Everything up to the password POST needs no password: fetch and
+        # parse the login page, submit the username, pick (with --probe-sts)
+        # and connect to the STS endpoint, and import boto3 (for the aliases)
+        # while the user types it.
+        google_client = google.Google(config, save_failure=args.save_failure_html, save_flow=args.save_saml_flow,
+                                      timings=run_timings, interactive=interactive,
+                                      limiter=ratelimit.login_limiter())
+        google_client.prefetch()
+        sts_client = util.Background(endpoints.warm_sts_client, config)
+        if config.resolve_aliases:
+            util.Background(import_module, 'boto3')
+
         # There is no way (intentional) to pass in the password via the command
         # line nor environment variables. This prevents password leakage.
         keyring_password = None
         if config.keyring:
             keyring_password = keyring.get_password("aws-google-auth", config.username)
-            if keyring_password:
-                config.password = keyring_password
-            else:
-                config.password = util.Util.get_password("Google Password: ")
+        if keyring_password:
+            config.password = keyring_password
+        elif args.non_interactive:
+            raise errors.LoginRequired("There is no cached SAML assertion for profile {}, and no password in the "
+                                       "keyring to log in with.".format(config.profile))
         else:
-            config.password = util.Util.get_password("Google Password: ")
+            config.password = util.Util.get_password("Google Password: ", interactive)
+
+        # The TOTP secret, when MFA tokens are generated here rather than typed
+        keyring_totp_secret = None
+        if config.totp_keyring:
+            keyring_totp_secret = keyring.get_password(totp.KEYRING_SERVICE, config.username)
+            config.totp_secret = keyring_totp_secret or util.Util.get_password("TOTP secret (base32): ", interactive)
 
-        # Validate Options
         config.raise_if_invalid()
 
-        google_client = google.Google(config, save_failure=args.save_failure_html, save_flow=args.save_saml_flow)
-        google_client.do_login()
-        saml_xml = google_client.parse_saml()
+        try:
+            with run_timings.phase('google login', metric='login.duration'):
+                google_client.do_login()
+            with run_timings.phase('parse saml'):
+                saml_xml = google_client.parse_saml()
+        except Exception:
+            run_timings.incr('login.failure')
+            raise
+        run_timings.incr('login.success')
         logging.debug('%s: saml assertion is: %s', __name__, saml_xml)
 
         # If we logged in correctly and we are using keyring then store the password
         if config.keyring and keyring_password is None:
             keyring.set_password(
                 "aws-google-auth", config.username, config.password)
+        if config.totp_keyring and keyring_totp_secret is None:
+            keyring.set_password(totp.KEYRING_SERVICE, config.username, config.totp_secret)
 
     # We now have a new SAML value that can get cached (If the user asked
     # for it to be)
@@ -257,32 +407,70 @@ def process_auth(args, config):
     # The amazon_client now has the SAML assertion it needed (Either via the
     # cache or freshly generated). From here, we can get the roles and continue
     # the rest of the workflow regardless of cache.
-    amazon_client = amazon.Amazon(config, saml_xml)
+    if sts_client is not None:
+        sts_client = sts_client.result()
+    amazon_client = amazon.Amazon(config, saml_xml, timings=run_timings, sts_client=sts_client)
     roles = amazon_client.roles
 
+    # A glob or /regex/ role ARN narrows the roles down, and only prompts if
+    # more than one matches.
+    if picker.is_pattern(config.role_arn):
+        roles = picker.match_roles(roles, config.role_arn)
+        if not roles:
+            raise google.ExpectedGoogleException("No role in the SAML assertion matches {}".format(config.role_arn))
+
     # Determine the provider and the role arn (if the the user provided isn't an option)
+    history = picker.History(config.role_history_file)
     if config.role_arn in roles and not config.ask_role:
         config.provider = roles[config.role_arn]
+    elif len(roles) == 1 and picker.is_pattern(config.role_arn) and not config.ask_role:
+        config.role_arn, config.provider = list(roles.items())[0]
     else:
+        # Filter by account first, so that aliases are only resolved for the
+        # accounts that can still be picked.
+        if config.account:
+            roles = {role: principal for role, principal in roles.items() if config.account in role}
+            if not roles:
+                raise google.ExpectedGoogleException("No role in the SAML assertion matches account {}".format(config.account))
+
         if config.account and config.resolve_aliases:
             aliases = amazon_client.resolve_aws_aliases(roles)
-            config.role_arn, config.provider = util.Util.pick_a_role(roles, aliases, config.account)
+            config.role_arn, config.provider = util.Util.pick_a_role(roles, aliases, config.account, history=history, interactive=interactive)
         elif config.account:
-            config.role_arn, config.provider = util.Util.pick_a_role(roles, account=config.account)
+            config.role_arn, config.provider = util.Util.pick_a_role(roles, account=config.account, history=history, interactive=interactive)
         elif config.resolve_aliases:
             aliases = amazon_client.resolve_aws_aliases(roles)
-            config.role_arn, config.provider = util.Util.pick_a_role(roles, aliases)
+            config.role_arn, config.provider = util.Util.pick_a_role(roles, aliases, history=history, interactive=interactive)
         else:
-            config.role_arn, config.provider = util.Util.pick_a_role(roles)
+            config.role_arn, config.provider = util.Util.pick_a_role(roles, history=history, interactive=interactive)
     if not config.quiet:
         print("Assuming " + config.role_arn)
         print("Credentials Expiration: " + format(amazon_client.expiration.astimezone(get_localzone())))
 
+    # Roles chained from this one, assumed all at once with its credentials
+    chained, failed = {}, {}
+    if config.chain_roles:
+        chained, failed = amazon_client.assume_chained_roles(config.chain_roles)
+        if not config.quiet:
+            for profile in sorted(chained):
+                print("Assuming {} as profile {}".format(chained[profile].role_arn, profile))
+
     if config.print_creds:
         amazon_client.print_export_line()
 
     if config.profile:
-        config.write(amazon_client)
+        with run_timings.phase('write config'):
+            config.write(amazon_client, chained)
+
+    # The roles that could be assumed are written; report the others
+    if failed:
+        message = "Could not assume chained roles: " + "; ".join(
+            "{} ({}): {}".format(profile, config.chain_roles[profile], failed[profile]) for profile in sorted(failed))
+        if all(isinstance(ex, errors.STSThrottled) for ex in failed.values()):
+            raise errors.STSThrottled(message)
+        raise google.ExpectedGoogleException(message)
+
+    return amazon_client
 
 
 def main():
@@ -1,38 +1,108 @@
 #!/usr/bin/env python
 
 import base64
-import boto3
+import json
+import logging
 import os
 import re
 
 from datetime import datetime
-from threading import Thread
+from threading import RLock, Thread
 
-from botocore.exceptions import ClientError, ProfileNotFound
+from botocore.exceptions import ClientError
 from lxml import etree
 
-from aws_google_auth.google import ExpectedGoogleException
+from aws_google_auth import endpoints
+from aws_google_auth import errors
+from aws_google_auth import sts
+from aws_google_auth.timings import Timings
+
+# Error codes STS answers with when it is rate limiting the caller.
+THROTTLING_ERROR_CODES = ('Throttling', 'ThrottlingException', 'RequestLimitExceeded')
+
+# AWS caps the sessions of chained roles at one hour, whatever the role allows
+CHAINED_MAX_DURATION = 3600
+
+
+class AssumedRole(object):
+    """The credentials of a role assumed with another role's credentials
+    (see Amazon.assume_chained_roles). They have the same properties as an
+    Amazon object, so Configuration.write can store them."""
+
+    def __init__(self, role_arn, token):
+        self.role_arn = role_arn
+        self.token = token
+
+    @property
+    def access_key_id(self):
+        return self.token['Credentials']['AccessKeyId']
+
+    @property
+    def secret_access_key(self):
+        return self.token['Credentials']['SecretAccessKey']
+
+    @property
+    def session_token(self):
+        return self.token['Credentials']['SessionToken']
+
+    @property
+    def expiration(self):
+        return self.token['Credentials']['Expiration']
+
+
+def max_duration_from_error(err):
+    """The longest duration the role allows, as told by the ValidationError
+    `err` (a ClientError) of a call asking for more, or None."""
+    error = err.response.get('Error', {})
+    if error.get('Code') != 'ValidationError' or not error.get('Message'):
+        return None
+    m = re.search('Member must have value less than or equal to ([0-9]{3,5})', error['Message'])
+    return int(m.group(1)) if m is not None else None
 
 
 class Amazon:
 
-    def __init__(self, config, saml_xml):
+    def __init__(self, config, saml_xml, timings=None, sts_client=None):
         self.config = config
         self.saml_xml = saml_xml
+        self.timings = Timings() if timings is None else timings
+        self.__sts_client = sts_client
         self.__token = None
+        self.__chained = {}
+        self.__chain_client = None
+        # The client and the token are created once, whichever thread asks first
+        self._lock = RLock()
 
     @property
     def sts_client(self):
-        try:
-            profile = os.environ.get('AWS_PROFILE')
-            if profile is not None:
-                del os.environ['AWS_PROFILE']
-            client = boto3.client('sts', region_name=self.config.region)
-            if profile is not None:
-                os.environ['AWS_PROFILE'] = profile
+        """The client AssumeRoleWithSAML is called on.
+
+        Unless one was passed in, this is the requests-based sts.STSClient:
+        the call is unsigned, so it needs neither boto3 nor an AWS profile.
+        Its endpoint is the region's, or the fastest one with
+        `config.probe_sts` (see endpoints.sts_client).
+        """
+        with self._lock:
+            if self.__sts_client is None:
+                with self.timings.phase('create sts client'):
+                    self.__sts_client = endpoints.sts_client(self.config)
+            return self.__sts_client
+
+    @property
+    def chain_client(self):
+        """The sts.STSClient AssumeRole is called on for chained roles.
+
+        That is the sts_client when it is one. A client passed in that is
+        not (a boto3 one) cannot sign with the credentials of the role, so
+        chained roles get an sts.STSClient of their own.
+        """
+        client = self.sts_client
+        if isinstance(client, sts.STSClient):
             return client
-        except ProfileNotFound as ex:
-            raise ExpectedGoogleException("Error : {}.".format(ex))
+        with self._lock:
+            if self.__chain_client is None:
+                self.__chain_client = endpoints.sts_client(self.config)
+            return self.__chain_client
 
     @property
     def base64_encoded_saml(self):
@@ -40,12 +110,13 @@ class Amazon:
 
     @property
     def token(self):
-        if self.__token is None:
-            self.__token = self.assume_role(self.config.role_arn,
-                                            self.config.provider,
-                                            self.base64_encoded_saml,
-                                            self.config.duration)
-        return self.__token
+        with self._lock:
+            if self.__token is None:
+                self.__token = self.assume_role(self.config.role_arn,
+                                                self.config.provider,
+                                                self.base64_encoded_saml,
+                                                self.config.duration)
+            return self.__token
 
     @property
     def access_key_id(self):
@@ -96,36 +167,183 @@ class Amazon:
         if self.config.auto_duration and auto_duration:
             sts_call_vars['DurationSeconds'] = self.config.max_duration
             try:
-                res = self.sts_client.assume_role_with_saml(**sts_call_vars)
+                return self._assume_role_with_saml(sts_call_vars)
             except ClientError as err:
-                if (err.response.get('Error', []).get('Code') == 'ValidationError' and err.response.get('Error', []).get('Message')):
-                    m = re.search(
-                        'Member must have value less than or equal to ([0-9]{3,5})',
-                        err.response['Error']['Message']
-                    )
-                    if m is not None and m.group(1):
-                        new_duration = int(m.group(1))
-                        return self.assume_role(role, principal,
-                                                saml_assertion,
-                                                duration=new_duration,
-                                                auto_duration=False)
+                new_duration = max_duration_from_error(err)
+                if new_duration is not None:
+                    return self.assume_role(role, principal,
+                                            saml_assertion,
+                                            duration=new_duration,
+                                            auto_duration=False)
                 # Unknown error or no max time returned in error message
                 raise
         elif duration:
             sts_call_vars['DurationSeconds'] = duration
 
-        res = self.sts_client.assume_role_with_saml(**sts_call_vars)
+        res = self._assume_role_with_saml(sts_call_vars)
 
         return res
 
-    def resolve_aws_aliases(self, roles):
+    def _assume_role_with_saml(self, sts_call_vars):
+        sts_client = self.sts_client
+        try:
+            with self.timings.phase('AssumeRoleWithSAML', metric='sts.assume_role_with_saml'):
+                return sts_client.assume_role_with_saml(**sts_call_vars)
+        except ClientError as err:
+            self._raise_if_throttled(err, 'AssumeRoleWithSAML')
+            raise
+
+    def _raise_if_throttled(self, err, operation):
+        if err.response.get('Error', {}).get('Code') in THROTTLING_ERROR_CODES:
+            self.timings.incr('sts.throttled')
+            raise errors.STSThrottled("STS is throttling {}, try again later: {}".format(
+                operation, err.response['Error'].get('Message')))
+
+    @property
+    def session_name(self):
+        """The RoleSessionName of chained roles: the federated user's, so
+        that CloudTrail shows who assumed them."""
+        assumed_role_id = (self.token.get('AssumedRoleUser') or {}).get('AssumedRoleId') or ''
+        name = re.sub(r'[^\w+=,.@-]', '-', assumed_role_id.split(':')[-1])[:64]
+        return name if len(name) >= 2 else 'aws-google-auth'
+
+    def assume_chained_roles(self, chain_roles):
+        """Assume every role of `chain_roles` (a dict mapping profile names to
+        role ARNs) with this role's credentials, all at once.
+
+        Returns two dicts keyed by profile name: the AssumedRole of each role
+        assumed, and the exception of each role that could not be (an
+        errors.STSThrottled if STS was throttling). Roles are only assumed
+        once per Amazon object, whose credentials they are chained from; the
+        next run has new ones and assumes them again, and the results are
+        kept as the profiles the caller writes. Their sessions last
+        `config.duration`, up to the one hour AWS allows chained roles.
+
+        The calls are signed by the sts.STSClient (see chain_client).
+        """
+        credentials = self.token['Credentials']
+        client = self.chain_client
+        session_name = self.session_name
+        duration = min(self.config.duration, CHAINED_MAX_DURATION)
+        assumed = {}
+        failed = {}
+
+        def assume(profile, role_arn):
+            try:
+                with self._lock:
+                    role = self.__chained.get(role_arn)
+                if role is None:
+                    with self.timings.phase('AssumeRole', metric='sts.assume_role'):
+                        token = client.assume_role(RoleArn=role_arn, RoleSessionName=session_name,
+                                                   Credentials=credentials, DurationSeconds=duration)
+                    role = AssumedRole(role_arn, token)
+                    with self._lock:
+                        self.__chained[role_arn] = role
+                assumed[profile] = role
+            except ClientError as err:
+                try:
+                    self._raise_if_throttled(err, 'AssumeRole')
+                    failed[profile] = err
+                except errors.STSThrottled as throttled:
+                    failed[profile] = throttled
+            except Exception as err:
+                # requests' connection errors and timeouts, and anything
+                # unexpected: reported with the other failures
+                logging.debug('%s: could not assume %s', __name__, role_arn, exc_info=True)
+                failed[profile] = err
+
+        threads = []
+        with self.timings.phase('chain roles', metric='sts.chain_roles'):
+            for profile, role_arn in chain_roles.items():
+                t = Thread(target=assume, args=(profile, role_arn))
+                t.start()
+                threads.append(t)
+
+            for t in threads:
+                t.join()
+
+        return assumed, failed
+
+    def resolve_aws_aliases(self, roles, per_account=True, known=None):
+        """Map the account ID of every role in `roles` to a readable name.
+
+        Names come from the static mapping file (`config.alias_file`), then
+        from AWS Organizations through `config.alias_role`, then from `known`
+        (names looked up before, by account ID), and only the accounts none
+        of those knows are looked up one by one (or left out, without
+        `per_account`).
+        """
+        accounts = set(role.split(':')[4] for role in roles)
+        aws_id_alias = {}
+        with self.timings.phase('resolve aliases', metric='sts.resolve_aliases'):
+            if self.config.alias_file:
+                aws_id_alias.update(self.read_alias_file(self.config.alias_file, accounts))
+            if self.config.alias_role and accounts - set(aws_id_alias):
+                organization_aliases = self.resolve_organization_aliases(self.config.alias_role)
+                aws_id_alias.update((account, name) for account, name in organization_aliases.items()
+                                    if account in accounts and account not in aws_id_alias)
+            if known:
+                aws_id_alias.update((account, name) for account, name in known.items()
+                                    if account in accounts and account not in aws_id_alias)
+
+            remaining = {role: principal for role, principal in roles.items() if role.split(':')[4] not in aws_id_alias}
+            if remaining and per_account:
+                aws_id_alias.update(self._resolve_aws_aliases_per_account(remaining))
+
+        return aws_id_alias
+
+    @staticmethod
+    def read_alias_file(path, accounts):
+        """Names of `accounts` from a JSON file mapping account IDs to names."""
+        try:
+            with open(os.path.expanduser(path)) as f:
+                mapping = json.load(f)
+        except (IOError, OSError, ValueError) as ex:
+            logging.warning('%s: could not read alias file %s: %s', __name__, path, ex)
+            return {}
+        return {str(account): str(name) for account, name in mapping.items() if str(account) in accounts}
+
+    def resolve_organization_aliases(self, alias_role):
+        """Names of every account in the organization, listed with `alias_role`.
+
+        The role must be in the SAML assertion and allow
+        organizations:ListAccounts. Returns {} (after logging why) otherwise.
+        """
+        principal = self.roles.get(alias_role)
+        if principal is None:
+            logging.warning('%s: alias role %s is not in the SAML assertion', __name__, alias_role)
+            return {}
+
+        try:
+            saml = self._assume_role_with_saml({'RoleArn': alias_role,
+                                                'PrincipalArn': principal,
+                                                'SAMLAssertion': self.base64_encoded_saml})
+            import boto3
+            session = boto3.session.Session(region_name=self.config.region)
+            organizations = session.client('organizations',
+                                           aws_access_key_id=saml['Credentials']['AccessKeyId'],
+                                           aws_secret_access_key=saml['Credentials']['SecretAccessKey'],
+                                           aws_session_token=saml['Credentials']['SessionToken'])
+            aliases = {}
+            for page in organizations.get_paginator('list_accounts').paginate():
+                for account in page['Accounts']:
+                    aliases[account['Id']] = account['Name']
+            return aliases
+        except ClientError as ex:
+            logging.warning('%s: could not list accounts with %s: %s', __name__, alias_role, ex)
+            return {}
+
+    def _resolve_aws_aliases_per_account(self, roles):
+        import boto3
+
         def resolve_aws_alias(role, principal, aws_dict):
             session = boto3.session.Session(region_name=self.config.region)
 
-            sts = session.client('sts')
-            saml = sts.assume_role_with_saml(RoleArn=role,
-                                             PrincipalArn=principal,
-                                             SAMLAssertion=self.base64_encoded_saml)
+            # The shared client: the same (possibly probed) endpoint and
+            # connection pool as the role's own AssumeRoleWithSAML
+            saml = self.sts_client.assume_role_with_saml(RoleArn=role,
+                                                         PrincipalArn=principal,
+                                                         SAMLAssertion=self.base64_encoded_saml)
 
             iam = session.client('iam',
                                  aws_access_key_id=saml['Credentials']['AccessKeyId'],
@@ -136,17 +354,18 @@ class Amazon:
                 account_alias = response['AccountAliases'][0]
                 aws_dict[role.split(':')[4]] = account_alias
             except:
-                sts = session.client('sts',
-                                     aws_access_key_id=saml['Credentials']['AccessKeyId'],
-                                     aws_secret_access_key=saml['Credentials']['SecretAccessKey'],
-                                     aws_session_token=saml['Credentials']['SessionToken'])
+                # No alias (or no permission to read it): the account ID,
+                # which the role ARN already has
+                aws_dict[role.split(':')[4]] = role.split(':')[4]
 
-                account_id = sts.get_caller_identity().get('Account')
-                aws_dict[role.split(':')[4]] = '{}'.format(account_id)
+        # One role is enough to look up an account's alias
+        account_roles = {}
+        for role, principal in roles.items():
+            account_roles.setdefault(role.split(':')[4], (role, principal))
 
         threads = []
         aws_id_alias = {}
-        for number, (role, principal) in enumerate(roles.items()):
+        for role, principal in account_roles.values():
             t = Thread(target=resolve_aws_alias, args=(role, principal, aws_id_alias))
             t.start()
             threads.append(t)
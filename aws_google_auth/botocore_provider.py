@@ -0,0 +1,67 @@
+#!/usr/bin/env python
+
+import logging
+
+from botocore.credentials import CredentialProvider, RefreshableCredentials
+
+from aws_google_auth import credentials
+
+
+class GoogleCredentialProvider(CredentialProvider):
+    """A botocore credential provider backed by aws-google-auth.
+
+    Credentials are RefreshableCredentials: botocore refreshes them ahead of
+    their expiration (15 minutes before by default, see `advisory_timeout`),
+    by assuming `config.role_arn` again with the cached SAML assertion.
+    `login(config)` is only called when that assertion is missing or no
+    longer valid; by default it prompts for the Google password.
+
+    Use `register()` to install it on a session.
+    """
+
+    METHOD = 'aws-google-auth'
+    CANONICAL_NAME = 'aws-google-auth'
+
+    def __init__(self, config, login=credentials.interactive_login, session=None, sts_client=None,
+                 advisory_timeout=None, mandatory_timeout=None):
+        super(GoogleCredentialProvider, self).__init__()
+        self.config = config
+        self.login = login
+        self.session = session
+        self.sts_client = sts_client
+        self.timeouts = {}
+        if advisory_timeout is not None:
+            self.timeouts['advisory_timeout'] = advisory_timeout
+        if mandatory_timeout is not None:
+            self.timeouts['mandatory_timeout'] = mandatory_timeout
+
+    def load(self):
+        return RefreshableCredentials.create_from_metadata(
+            metadata=self.refresh(),
+            refresh_using=self.refresh,
+            method=self.METHOD,
+            **self.timeouts)
+
+    def refresh(self):
+        if self.config.saml_cache is None:
+            logging.info('%s: SAML assertion expired, logging in to Google', __name__)
+            self.login(self.config)
+
+        creds = credentials.get_credentials(self.config, session=self.session, sts_client=self.sts_client)
+        return {
+            'access_key': creds.access_key_id,
+            'secret_key': creds.secret_access_key,
+            'token': creds.session_token,
+            'expiry_time': creds.expiration.isoformat(),
+        }
+
+
+def register(botocore_session, config, **kwargs):
+    """Make `botocore_session` get its credentials from aws-google-auth.
+
+    The provider is consulted before every other credential source. For
+    boto3, build the session with `boto3.Session(botocore_session=...)`.
+    """
+    provider = GoogleCredentialProvider(config, **kwargs)
+    botocore_session.get_component('credential_provider').insert_before('env', provider)
+    return provider
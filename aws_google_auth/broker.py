@@ -0,0 +1,386 @@
+#!/usr/bin/env python
+from __future__ import print_function
+
+import argparse
+import base64
+import binascii
+import json
+import logging
+import os
+import socket
+import stat
+import struct
+import threading
+import time
+from datetime import datetime
+
+from dateutil.tz import tzutc
+from six import print_ as print
+from six.moves import socketserver
+
+from aws_google_auth import amazon
+from aws_google_auth import configuration
+from aws_google_auth import credentials
+from aws_google_auth import endpoints
+from aws_google_auth import errors
+from aws_google_auth import util
+
+# Where the broker listens, unless --socket or $AWS_GOOGLE_AUTH_BROKER_SOCKET
+# say otherwise. Its directory must only be writable by the broker's user:
+# whoever can create the socket receives everyone's SAML assertions.
+DEFAULT_SOCKET = '/run/aws-google-auth/broker.sock'
+SOCKET_VARIABLE = 'AWS_GOOGLE_AUTH_BROKER_SOCKET'
+
+# A user's session is dropped once it has not been used for this long.
+DEFAULT_TTL = 3600
+
+# AssumeRoleWithSAML calls in flight at once, whatever the number of clients.
+DEFAULT_WORKERS = 8
+
+# Cached credentials are handed out while they are valid for at least this
+# many seconds; after that the role is assumed again.
+MIN_REMAINING = 300
+
+# Longest request accepted (a SAML assertion is a few tens of KB), and how
+# long a client may take to send it.
+MAX_REQUEST = 1024 * 1024
+TIMEOUT = 30
+
+# Linux's value, for Pythons whose socket module does not define it
+SO_PEERCRED = getattr(socket, 'SO_PEERCRED', 17)
+
+EPOCH = datetime(1970, 1, 1, tzinfo=tzutc())
+
+
+def socket_path(path=None):
+    return util.Util.coalesce(path, os.getenv(SOCKET_VARIABLE), DEFAULT_SOCKET)
+
+
+def peer_uid(sock):
+    """The uid of the process at the other end of the Unix socket `sock`, as
+    reported by the kernel (Linux only)."""
+    creds = sock.getsockopt(socket.SOL_SOCKET, SO_PEERCRED, struct.calcsize('3i'))
+    _, uid, _ = struct.unpack('3i', creds)
+    return uid
+
+
+class Session(object):
+    """What the broker keeps for one user: their SAML assertion, the roles in
+    it, and the credentials assumed with it by (role ARN, duration)."""
+
+    def __init__(self, saml_xml, roles, now):
+        self.saml_xml = saml_xml
+        self.roles = roles
+        self.last_used = now
+        self.credentials = {}
+        # Held while the user's credentials are looked up or assumed, so that
+        # concurrent requests for the same role make a single STS call.
+        self.lock = threading.Lock()
+
+
+class SessionCache(object):
+    """Sessions by uid, dropped `ttl` seconds after they were last used."""
+
+    def __init__(self, ttl=DEFAULT_TTL, clock=time.time):
+        self.ttl = ttl
+        self.clock = clock
+        self._sessions = {}
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        with self._lock:
+            return len(self._sessions)
+
+    def put(self, uid, session):
+        with self._lock:
+            self._evict()
+            self._sessions[uid] = session
+
+    def get(self, uid):
+        """The session of `uid`, or None. Using a session keeps it alive."""
+        with self._lock:
+            self._evict()
+            session = self._sessions.get(uid)
+            if session is not None:
+                session.last_used = self.clock()
+            return session
+
+    def drop(self, uid, session=None):
+        """Forget the session of `uid` (only if it is still `session`, when given)."""
+        with self._lock:
+            if session is None or self._sessions.get(uid) is session:
+                self._sessions.pop(uid, None)
+
+    def evict(self):
+        with self._lock:
+            self._evict()
+
+    def _evict(self):
+        now = self.clock()
+        for uid in [uid for uid, session in self._sessions.items() if now - session.last_used >= self.ttl]:
+            logging.info('%s: session of uid %s expired', __name__, uid)
+            del self._sessions[uid]
+
+
+class Broker(object):
+    """Hand out credentials to local users from their cached SAML assertions.
+
+    Users log in to Google themselves (`aws-google-auth broker login`), with
+    the usual prompts, and hand the assertion over; their tools then ask for
+    credentials of any role in it, which are cached until shortly before
+    they expire. Users are told apart by the uid the kernel reports for the
+    socket peer, never by anything they send, so each one only sees their
+    own session.
+
+    At most `workers` AssumeRoleWithSAML calls are in flight at once, however
+    many users are connected. `config` provides the STS settings (region,
+    default duration).
+    """
+
+    def __init__(self, config, sessions=None, workers=DEFAULT_WORKERS, sts_client=None, clock=time.time):
+        self.config = config
+        self.sessions = SessionCache(clock=clock) if sessions is None else sessions
+        self.sts_client = endpoints.sts_client(config) if sts_client is None else sts_client
+        self.workers = threading.BoundedSemaphore(workers)
+        self.clock = clock
+
+    def handle(self, uid, request):
+        """The response to `request` (a dict) from the user `uid`.
+
+        Responses have the shape of `aws-google-auth --non-interactive`
+        results: a status, an exit code and, for errors, their kind.
+        """
+        try:
+            action = request.get('action')
+            if action == 'login':
+                result = self.login(uid, request.get('saml_assertion'))
+            elif action == 'credentials':
+                result = self.credentials(uid, request.get('role_arn'), request.get('duration'))
+            elif action == 'logout':
+                self.sessions.drop(uid)
+                result = {}
+            else:
+                raise errors.ExpectedGoogleException("Unknown action: {}".format(action))
+        except errors.ExpectedGoogleException as ex:
+            return {'status': 'error', 'exit_code': ex.exit_code, 'error': ex.kind, 'message': str(ex)}
+        except Exception as ex:
+            logging.exception('%s: request of uid %s failed', __name__, uid)
+            return {'status': 'error', 'exit_code': errors.EXIT_FAILURE, 'error': 'unexpected', 'message': str(ex)}
+
+        result.update(status='ok', exit_code=errors.EXIT_OK)
+        return result
+
+    def login(self, uid, saml_assertion):
+        """Start a session for `uid` with a base64 encoded SAML assertion."""
+        try:
+            saml_xml = base64.b64decode(saml_assertion)
+        except (TypeError, ValueError, binascii.Error):
+            raise errors.ExpectedGoogleException("The SAML assertion is not base64 encoded")
+        if not amazon.Amazon.is_valid_saml_assertion(saml_xml):
+            raise errors.LoginRequired("The SAML assertion is invalid or has expired, log in to Google again.")
+
+        roles = amazon.Amazon(self.config, saml_xml).roles
+        self.sessions.put(uid, Session(saml_xml, roles, self.clock()))
+        logging.info('%s: session of uid %s started with %d roles', __name__, uid, len(roles))
+        return {'roles': sorted(roles)}
+
+    def credentials(self, uid, role_arn, duration=None):
+        """The credentials of `role_arn` for `uid`, as credential_process output."""
+        if duration is not None and not isinstance(duration, int):
+            raise errors.ExpectedGoogleException("The duration must be a number of seconds")
+
+        session = self.sessions.get(uid)
+        if session is None:
+            raise errors.LoginRequired("There is no broker session, run aws-google-auth broker login first.")
+        if role_arn not in session.roles:
+            raise errors.ExpectedGoogleException(
+                "Role {} is not in the SAML assertion. Available roles: {}".format(
+                    role_arn, ", ".join(sorted(session.roles))))
+
+        key = (role_arn, duration)
+        with session.lock:
+            creds = session.credentials.get(key)
+            if creds is None or self._remaining(creds) < MIN_REMAINING:
+                if not amazon.Amazon.is_valid_saml_assertion(session.saml_xml):
+                    self.sessions.drop(uid, session)
+                    raise errors.LoginRequired("The SAML assertion has expired, run aws-google-auth broker login again.")
+                creds = self._assume_role(session, role_arn, duration)
+                session.credentials[key] = creds
+        return {'credentials': creds.process_output}
+
+    def _assume_role(self, session, role_arn, duration):
+        amazon_client = amazon.Amazon(self.config, session.saml_xml, sts_client=self.sts_client)
+        with self.workers:
+            token = amazon_client.assume_role(role_arn, session.roles[role_arn], amazon_client.base64_encoded_saml,
+                                              duration, auto_duration=duration is None)
+        return credentials.Credentials(access_key_id=token['Credentials']['AccessKeyId'],
+                                       secret_access_key=token['Credentials']['SecretAccessKey'],
+                                       session_token=token['Credentials']['SessionToken'],
+                                       expiration=token['Credentials']['Expiration'],
+                                       role_arn=role_arn)
+
+    def _remaining(self, creds):
+        return (creds.expiration - EPOCH).total_seconds() - self.clock()
+
+
+class RequestHandler(socketserver.StreamRequestHandler):
+    """One connection: JSON requests and responses, one per line."""
+
+    timeout = TIMEOUT
+
+    def handle(self):
+        uid = peer_uid(self.request)
+        try:
+            for line in iter(lambda: self.rfile.readline(MAX_REQUEST), b''):
+                if not line.endswith(b'\n'):
+                    self._respond({'status': 'error', 'exit_code': errors.EXIT_FAILURE, 'error': 'error',
+                                   'message': 'The request is too long'})
+                    return
+                try:
+                    request = json.loads(line.decode('utf-8'))
+                    if not isinstance(request, dict):
+                        raise ValueError('not an object')
+                except ValueError as ex:
+                    self._respond({'status': 'error', 'exit_code': errors.EXIT_FAILURE, 'error': 'error',
+                                   'message': 'Invalid request: {}'.format(ex)})
+                    continue
+                self._respond(self.server.broker.handle(uid, request))
+        except socket.timeout:
+            logging.debug('%s: connection of uid %s timed out', __name__, uid)
+
+    def _respond(self, response):
+        self.wfile.write((json.dumps(response, sort_keys=True) + '\n').encode('utf-8'))
+
+
+class BrokerServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    """Serve `broker` on the Unix socket `path`, which any local user may
+    connect to (they only ever get at their own session).
+
+    The socket is made world writable (0666): that is only safe because every
+    request is answered for the uid the kernel reports for the connection
+    (SO_PEERCRED, see peer_uid), never for one named in the request.
+
+    A socket already at `path` is replaced; anything else there raises an
+    errors.ExpectedGoogleException rather than being deleted.
+    """
+
+    daemon_threads = True
+
+    def __init__(self, path, broker):
+        self.broker = broker
+        try:
+            mode = os.lstat(path).st_mode
+        except OSError:
+            mode = None
+        if mode is not None:
+            if not stat.S_ISSOCK(mode):
+                raise errors.ExpectedGoogleException(
+                    "{} exists and is not a socket; remove it or choose another --socket".format(path))
+            # Left behind by a broker that did not shut down cleanly
+            os.unlink(path)
+        socketserver.UnixStreamServer.__init__(self, path, RequestHandler)
+        os.chmod(path, 0o666)
+
+    def service_actions(self):
+        # Called between requests by serve_forever: drop idle sessions even
+        # when nobody asks for anything.
+        self.broker.sessions.evict()
+
+    def server_close(self):
+        socketserver.UnixStreamServer.server_close(self)
+        try:
+            os.unlink(self.server_address)
+        except OSError:
+            pass
+
+
+def request(path, payload, timeout=TIMEOUT):
+    """Send `payload` to the broker at `path` and return its response, or
+    raise the error it answered with."""
+    sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    sock.settimeout(timeout)
+    try:
+        sock.connect(path)
+        sock.sendall((json.dumps(payload) + '\n').encode('utf-8'))
+        line = sock.makefile('rb').readline(MAX_REQUEST)
+    except (socket.error, socket.timeout) as ex:
+        raise errors.NetworkError("Could not reach the broker at {}: {}".format(path, ex))
+    finally:
+        sock.close()
+
+    try:
+        response = json.loads(line.decode('utf-8'))
+    except ValueError:
+        raise errors.NetworkError("The broker at {} sent an invalid response".format(path))
+    if response.get('status') != 'ok':
+        raise errors.for_kind(response.get('error'), response.get('message'))
+    return response
+
+
+def parse_args(args):
+    parser = argparse.ArgumentParser(
+        prog="aws-google-auth broker",
+        description="Share Google logins between the users of a machine: a broker keeps each user's SAML assertion in memory and hands out their credentials over a local socket",
+    )
+    parser.add_argument('--socket', help='Path of the broker\'s socket (${}, default: {})'.format(SOCKET_VARIABLE, DEFAULT_SOCKET))
+    parser.add_argument('-l', '--log', dest='log_level', choices=['debug',
+                        'info', 'warn'], default='warn', help='Select log level (default: %(default)s)')
+    subparsers = parser.add_subparsers(dest='action', metavar='ACTION')
+    subparsers.required = True
+
+    serve = subparsers.add_parser('serve', help='Run the broker')
+    serve.add_argument('-R', '--region', help='AWS region of the STS endpoint ($AWS_DEFAULT_REGION)')
+    serve.add_argument('--workers', type=int, default=DEFAULT_WORKERS, help='AssumeRoleWithSAML calls made at once (default: %(default)s)')
+    serve.add_argument('--ttl', type=int, default=DEFAULT_TTL, help='Forget a user\'s session once it has not been used for this many seconds (default: %(default)s)')
+
+    login = subparsers.add_parser('login', help='Log in to Google and hand the SAML assertion to the broker')
+    login.add_argument('-p', '--profile', help='AWS profile whose Google settings are used (defaults to value of $AWS_PROFILE, then falls back to \'sts\')')
+
+    creds = subparsers.add_parser('credentials', help='Print credentials from the broker, as credential_process output')
+    creds.add_argument('-p', '--profile', help='AWS profile whose role is assumed (defaults to value of $AWS_PROFILE, then falls back to \'sts\')')
+    creds.add_argument('-r', '--role-arn', help='The ARN of the role to assume (defaults to the role of the profile)')
+    creds.add_argument('-d', '--duration', type=int, help='Credential duration in seconds (default: the longest the role allows)')
+
+    subparsers.add_parser('logout', help='Make the broker forget your session')
+
+    return parser.parse_args(args)
+
+
+def read_profile(profile):
+    config = configuration.Configuration()
+    config.profile = util.Util.coalesce(profile, os.getenv('AWS_PROFILE'), config.profile)
+    config.read(config.profile)
+    return config
+
+
+def main(cli_args):
+    args = parse_args(cli_args)
+    logging.getLogger().setLevel(getattr(logging, args.log_level.upper(), None))
+    path = socket_path(args.socket)
+
+    if args.action == 'serve':
+        config = configuration.Configuration()
+        config.region = util.Util.coalesce(args.region, os.getenv('AWS_DEFAULT_REGION'))
+        config.auto_duration = True
+        server = BrokerServer(path, Broker(config, sessions=SessionCache(ttl=args.ttl), workers=args.workers))
+        logging.info('%s: listening on %s', __name__, path)
+        try:
+            server.serve_forever()
+        finally:
+            server.server_close()
+
+    elif args.action == 'login':
+        config = read_profile(args.profile)
+        if config.saml_cache is None:
+            credentials.interactive_login(config)
+        response = request(path, {'action': 'login',
+                                  'saml_assertion': base64.b64encode(config.saml_cache).decode('utf-8')})
+        print("Broker session started, {} roles available".format(len(response['roles'])))
+
+    elif args.action == 'credentials':
+        role_arn = args.role_arn or read_profile(args.profile).role_arn
+        response = request(path, {'action': 'credentials', 'role_arn': role_arn, 'duration': args.duration})
+        print(json.dumps(response['credentials'], indent=2))
+
+    elif args.action == 'logout':
+        request(path, {'action': 'logout'})
@@ -0,0 +1,77 @@
+#!/usr/bin/env python
+
+import copy
+import gzip
+import json
+import logging
+import threading
+
+from six.moves import queue
+
+
+class FlowCapture(object):
+    """Stream the HTTP exchanges of a login into a gzip'ed NDJSON file.
+
+    Recording only queues the request or response; serialisation, redaction
+    of `secrets` and compression all happen on a background thread, so a
+    capture taken for a bug report does not slow down the login it is meant
+    to debug. Call `close()` to flush the file once the flow is over.
+
+    Every line is a JSON object with a "type" of either "request" (method,
+    url, data, json) or "response" (method, url, status, response_url, body).
+    """
+
+    def __init__(self, path, secrets=()):
+        self.path = path
+        self._secrets = []
+        for secret in secrets:
+            self.add_secret(secret)
+        self._queue = queue.Queue()
+        self._thread = threading.Thread(target=self._run, name='aws-google-auth-capture')
+        self._thread.daemon = True
+        self._thread.start()
+
+    def add_secret(self, secret):
+        """Redact `secret` from the exchanges recorded from now on."""
+        # Secrets are matched against the serialised line, so they have to be
+        # escaped the same way json.dumps() escapes them.
+        if isinstance(secret, str) and secret:
+            self._secrets.append(json.dumps(secret)[1:-1])
+
+    def request(self, method, url, data=None, json_data=None):
+        # Copied now: callers go on changing their payload dicts once posted
+        self._queue.put(('request', method, url, copy.deepcopy(data), copy.deepcopy(json_data)))
+
+    def response(self, method, url, response):
+        self._queue.put(('response', method, url, response, None))
+
+    def close(self):
+        if self._thread.is_alive():
+            self._queue.put(None)
+            self._thread.join()
+
+    @staticmethod
+    def _record(kind, method, url, payload, json_data):
+        if kind == 'request':
+            return {'type': kind, 'method': method, 'url': url, 'data': payload, 'json': json_data}
+
+        return {'type': kind, 'method': method, 'url': url,
+                'status': payload.status_code,
+                'response_url': payload.url,
+                'body': payload.text}
+
+    def _redact(self, line):
+        for secret in self._secrets:
+            line = line.replace(secret, '<PASSWORD>')
+        return line
+
+    def _run(self):
+        with gzip.open(self.path, 'wt', encoding='utf-8') as out:
+            while True:
+                item = self._queue.get()
+                if item is None:
+                    break
+                try:
+                    out.write(self._redact(json.dumps(self._record(*item))) + "\n")
+                except Exception:
+                    logging.exception('Failed to capture %s %s', item[1], item[2])
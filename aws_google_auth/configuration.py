@@ -1,9 +1,13 @@
 #!/usr/bin/env python
 
 import os
+import re
+import threading
+from contextlib import contextmanager
 
 import botocore.session
 import filelock
+from six.moves import shlex_quote
 
 try:
     from backports import configparser
@@ -12,17 +16,71 @@ except ImportError:
 
 from aws_google_auth import util
 from aws_google_auth import amazon
+from aws_google_auth import picker
+from aws_google_auth import timings
+from aws_google_auth import totp
+
+
+# Threads of one process writing the same file queue on one of these before
+# taking the file lock, rather than polling it.
+_thread_locks = {}
+_thread_locks_lock = threading.Lock()
+
+
+def _thread_lock(path):
+    with _thread_locks_lock:
+        return _thread_locks.setdefault(os.path.abspath(path), threading.Lock())
+
+
+def parse_chain_roles(entries, profile):
+    """Map profile names to role ARNs, from `entries` of the form
+    "[PROFILE=]ROLE_ARN". The profile name defaults to
+    <profile>-<account>-<role name>."""
+    chain_roles = {}
+    for entry in entries:
+        entry = entry.strip()
+        if not entry:
+            continue
+        name, _, role_arn = entry.rpartition('=')
+        role_arn = role_arn.strip()
+        if not name.strip():
+            parts = role_arn.split(':')
+            name = '{}-{}-{}'.format(profile, parts[4] if len(parts) > 5 else '', role_arn.split('/')[-1])
+        chain_roles[name.strip()] = role_arn
+    return chain_roles
+
+
+def format_chain_roles(chain_roles):
+    return ','.join('{}={}'.format(name, role_arn) for name, role_arn in sorted(chain_roles.items()))
+
+
+# Set in the profiles written by write_process_profiles, to the profile they
+# were generated from.
+GENERATED_FROM = 'google_config.generated_from'
+
+
+def process_command(profile, role_arn, executable='aws-google-auth'):
+    """The credential_process command printing credentials for `role_arn`
+    with the Google settings (and SAML cache) of `profile`."""
+    return ' '.join(shlex_quote(arg) for arg in [executable, 'credential-process', '-p', profile, '-r', role_arn])
 
 
 class Configuration(object):
 
     def __init__(self, **kwargs):
         self.options = {}
+        # botocore sessions are not thread safe, and the SAML cache is
+        # validated (and cleared) on read.
+        self._lock = threading.RLock()
         self.__boto_session = botocore.session.Session()
+        self.timings = timings.Timings()
 
         # Set up some defaults. These can be overridden as fit.
         self.ask_role = False
         self.keyring = False
+        self.totp_keyring = False
+        self.probe_sts = False
+        self.totp_secret = None
         self.duration = self.max_duration
         self.auto_duration = False
         self.idp_id = None
@@ -34,6 +92,9 @@ class Configuration(object):
         self.sp_id = None
         self.u2f_disabled = False
         self.resolve_aliases = False
+        self.alias_role = None
+        self.alias_file = None
+        self.chain_roles = {}
         self.username = None
         self.print_creds = False
         self.quiet = False
@@ -57,21 +118,31 @@ class Configuration(object):
 
     @property
     def credentials_file(self):
-        return os.path.expanduser(self.__boto_session.get_config_variable('credentials_file'))
+        with self._lock:
+            return os.path.expanduser(self.__boto_session.get_config_variable('credentials_file'))
 
     @property
     def config_file(self):
-        return os.path.expanduser(self.__boto_session.get_config_variable('config_file'))
+        with self._lock:
+            return os.path.expanduser(self.__boto_session.get_config_variable('config_file'))
 
     @property
     def saml_cache_file(self):
         return self.credentials_file.replace('credentials', 'saml_cache_%s.xml' % self.idp_id)
 
+    @property
+    def role_history_file(self):
+        return self.credentials_file.replace('credentials', 'role_history.json')
+
     def ensure_config_files_exist(self):
         for file in [self.config_file, self.credentials_file]:
             directory = os.path.dirname(file)
-            if not os.path.exists(directory):
+            try:
                 os.mkdir(directory, 0o700)
+            except OSError:
+                # Most likely there already (or just created by another thread)
+                if not os.path.isdir(directory):
+                    raise
             if not os.path.exists(file):
                 util.Util.touch(file)
 
@@ -80,14 +151,16 @@ class Configuration(object):
     # in-memory object. On the next write(), it will be purged from disk.
     @property
     def saml_cache(self):
-        if not amazon.Amazon.is_valid_saml_assertion(self.__saml_cache):
-            self.__saml_cache = None
+        with self._lock:
+            if not amazon.Amazon.is_valid_saml_assertion(self.__saml_cache):
+                self.__saml_cache = None
 
-        return self.__saml_cache
+            return self.__saml_cache
 
     @saml_cache.setter
     def saml_cache(self, value):
-        self.__saml_cache = value
+        with self._lock:
+            self.__saml_cache = value
 
     # Will raise exceptions if the configuration is invalid, otherwise returns
     # None. Use this at any point to validate the configuration is in a good
@@ -101,6 +174,19 @@ class Configuration(object):
         # keyring
         assert (self.keyring.__class__ is bool), "Expected keyring to be a boolean. Got {}.".format(self.keyring.__class__)
 
+        # totp_keyring
+        assert (self.totp_keyring.__class__ is bool), "Expected totp_keyring to be a boolean. Got {}.".format(self.totp_keyring.__class__)
+
+        # probe_sts
+        assert (self.probe_sts.__class__ is bool), "Expected probe_sts to be a boolean. Got {}.".format(self.probe_sts.__class__)
+
+        # totp_secret
+        if self.totp_secret is not None:
+            try:
+                totp.decode_secret(self.totp_secret)
+            except ValueError as ex:
+                raise AssertionError("Expected totp_secret to be a base32 TOTP secret: {}.".format(ex))
+
         # duration
         assert (self.duration.__class__ is int), "Expected duration to be an integer. Got {}.".format(self.duration.__class__)
         assert (self.duration >= 900), "Expected duration to be greater than or equal to 900. Got {}.".format(self.duration)
@@ -132,10 +218,27 @@ class Configuration(object):
             assert (type(self.password) is str), "Expected password to be a string. Got {}.".format(
                 type(self.password))
 
-        # role_arn (Can be blank, we'll just prompt)
+        # role_arn (Can be blank, we'll just prompt; can be a glob or /regex/ to narrow the prompt down)
         if self.role_arn is not None:
             assert (self.role_arn.__class__ is str), "Expected role_arn to be None or a string. Got {}.".format(self.role_arn.__class__)
-            assert ("arn:aws:iam::" in self.role_arn or "arn:aws-us-gov:iam::" in self.role_arn), "Expected role_arn to contain 'arn:aws:iam::'. Got '{}'.".format(self.role_arn)
+            if picker.is_pattern(self.role_arn):
+                try:
+                    picker.compile_pattern(self.role_arn)
+                except re.error as ex:
+                    raise AssertionError("Expected role_arn to be a valid regular expression. Got '{}': {}.".format(self.role_arn, ex))
+            else:
+                assert ("arn:aws:iam::" in self.role_arn or "arn:aws-us-gov:iam::" in self.role_arn), "Expected role_arn to contain 'arn:aws:iam::'. Got '{}'.".format(self.role_arn)
+
+        # alias_role (Optional role allowed to list the organization's accounts)
+        if self.alias_role is not None:
+            assert (self.alias_role.__class__ is str), "Expected alias_role to be None or a string. Got {}.".format(self.alias_role.__class__)
+            assert ("arn:aws:iam::" in self.alias_role or "arn:aws-us-gov:iam::" in self.alias_role), "Expected alias_role to contain 'arn:aws:iam::'. Got '{}'.".format(self.alias_role)
+
+        # chain_roles (Optional roles assumed with the role's credentials, by profile name)
+        assert (self.chain_roles.__class__ is dict), "Expected chain_roles to be a dict. Got {}.".format(self.chain_roles.__class__)
+        for name, chain_role in self.chain_roles.items():
+            assert (re.match(r'^[^\[\]=,\s]+$', name) and name != self.profile), "Expected chain_roles to have valid profile names, other than the profile's own. Got '{}'.".format(name)
+            assert ("arn:aws:iam::" in chain_role or "arn:aws-us-gov:iam::" in chain_role), "Expected chain_roles to contain 'arn:aws:iam::'. Got '{}'.".format(chain_role)
 
         # u2f_disabled
         assert (self.u2f_disabled.__class__ is bool), "Expected u2f_disabled to be a boolean. Got {}.".format(self.u2f_disabled.__class__)
@@ -146,17 +249,35 @@ class Configuration(object):
         # account
         assert (self.account.__class__ is str), "Expected account to be string. Got {}".format(self.account.__class__)
 
+    @contextmanager
+    def _locked(self, path):
+        """Hold the lock of `path`, against other threads and other processes."""
+        thread_lock = _thread_lock(path)
+        file_lock = filelock.FileLock(path + '.lock')
+        with self.timings.phase('lock wait', metric='config.lock_wait'):
+            thread_lock.acquire()
+            try:
+                file_lock.acquire()
+            except BaseException:
+                thread_lock.release()
+                raise
+        try:
+            yield
+        finally:
+            file_lock.release()
+            thread_lock.release()
+
     # Write the configuration (and credentials) out to disk. This allows for
     # regular AWS tooling (aws cli and boto) to use the credentials in the
-    # profile the user specified.
-    def write(self, amazon_object):
+    # profile the user specified. The credentials of chained roles
+    # (amazon.AssumedRole objects by profile name) are written along with
+    # them, in the same update of the credentials file.
+    def write(self, amazon_object, chained=None):
         self.ensure_config_files_exist()
 
         assert (self.profile is not None), "Can not store config/credentials if the AWS_PROFILE is None."
 
-        config_file_lock = filelock.FileLock(self.config_file + '.lock')
-        config_file_lock.acquire()
-        try:
+        with self._locked(self.config_file):
             # Write to the configuration file
             profile = Configuration.config_profile(self.profile)
             config_parser = configparser.RawConfigParser()
@@ -166,6 +287,8 @@ class Configuration(object):
             config_parser.set(profile, 'region', self.region)
             config_parser.set(profile, 'google_config.ask_role', self.ask_role)
             config_parser.set(profile, 'google_config.keyring', self.keyring)
+            config_parser.set(profile, 'google_config.totp_keyring', self.totp_keyring)
+            config_parser.set(profile, 'google_config.probe_sts', self.probe_sts)
             config_parser.set(profile, 'google_config.duration', self.duration)
             config_parser.set(profile, 'google_config.google_idp_id', self.idp_id)
             config_parser.set(profile, 'google_config.role_arn', self.role_arn)
@@ -173,40 +296,87 @@ class Configuration(object):
             config_parser.set(profile, 'google_config.u2f_disabled', self.u2f_disabled)
             config_parser.set(profile, 'google_config.google_username', self.username)
             config_parser.set(profile, 'google_config.bg_response', self.bg_response)
+            for option, value in [('google_config.alias_role', self.alias_role),
+                                  ('google_config.alias_file', self.alias_file),
+                                  ('google_config.chain_roles', format_chain_roles(self.chain_roles) or None)]:
+                if value is None:
+                    config_parser.remove_option(profile, option)
+                else:
+                    config_parser.set(profile, option, value)
+
+            with util.atomic_write(self.config_file) as f:
+                config_parser.write(f)
+
+        # Write to the credentials file (only if we have credentials)
+        if amazon_object is not None:
+            with self._locked(self.credentials_file):
+                credentials_parser = configparser.RawConfigParser()
+                credentials_parser.read(self.credentials_file)
+                for profile, credentials in [(self.profile, amazon_object)] + sorted((chained or {}).items()):
+                    if not credentials_parser.has_section(profile):
+                        credentials_parser.add_section(profile)
+                    credentials_parser.set(profile, 'aws_access_key_id', credentials.access_key_id)
+                    credentials_parser.set(profile, 'aws_secret_access_key', credentials.secret_access_key)
+                    credentials_parser.set(profile, 'aws_security_token', credentials.session_token)
+                    credentials_parser.set(profile, 'aws_session_expiration', credentials.expiration.strftime('%Y-%m-%dT%H:%M:%S%z'))
+                    credentials_parser.set(profile, 'aws_session_token', credentials.session_token)
+
+                with util.atomic_write(self.credentials_file) as f:
+                    credentials_parser.write(f)
+
+        self.write_saml_cache()
+
+    # Write the SAML assertion to its cache file. The file is replaced whole,
+    # so readers never need the lock; without `lock`, concurrent writers do
+    # not wait for each other either, and the last assertion written wins
+    # (any of them is valid).
+    def write_saml_cache(self, lock=True):
+        saml_cache = self.__saml_cache
+        if saml_cache is None:
+            return
+        if not lock:
+            with util.atomic_write(self.saml_cache_file) as f:
+                f.write(saml_cache.decode("utf-8"))
+            return
+        with self._locked(self.saml_cache_file):
+            self.write_saml_cache(lock=False)
+
+    # Write a profile per role (role ARNs by profile name) that gets its
+    # credentials from `aws-google-auth credential-process`, with this
+    # profile's Google settings. Profiles generated from this profile
+    # earlier, whose role is no longer listed, are removed. Other existing
+    # profiles are left alone: their names are returned, and not written.
+    def write_process_profiles(self, profiles, executable='aws-google-auth'):
+        self.ensure_config_files_exist()
+
+        assert (self.profile is not None), "Can not generate profiles if the AWS_PROFILE is None."
+
+        skipped = []
+        with self._locked(self.config_file):
+            config_parser = configparser.RawConfigParser()
+            config_parser.read(self.config_file)
 
-            with open(self.config_file, 'w+') as f:
+            wanted = set(Configuration.config_profile(name) for name in profiles)
+            for section in config_parser.sections():
+                if section not in wanted and config_parser.get(section, GENERATED_FROM, fallback=None) == self.profile:
+                    config_parser.remove_section(section)
+
+            for name, role_arn in sorted(profiles.items()):
+                section = Configuration.config_profile(name)
+                if not config_parser.has_section(section):
+                    config_parser.add_section(section)
+                elif config_parser.get(section, GENERATED_FROM, fallback=None) != self.profile:
+                    skipped.append(name)
+                    continue
+                config_parser.set(section, 'credential_process', process_command(self.profile, role_arn, executable))
+                if self.region is not None:
+                    config_parser.set(section, 'region', self.region)
+                config_parser.set(section, GENERATED_FROM, self.profile)
+
+            with util.atomic_write(self.config_file) as f:
                 config_parser.write(f)
-        finally:
-            config_file_lock.release()
 
-            # Write to the credentials file (only if we have credentials)
-            if amazon_object is not None:
-                credentials_file_lock = filelock.FileLock(self.credentials_file + '.lock')
-                credentials_file_lock.acquire()
-                try:
-                    credentials_parser = configparser.RawConfigParser()
-                    credentials_parser.read(self.credentials_file)
-                    if not credentials_parser.has_section(self.profile):
-                        credentials_parser.add_section(self.profile)
-                    credentials_parser.set(self.profile, 'aws_access_key_id', amazon_object.access_key_id)
-                    credentials_parser.set(self.profile, 'aws_secret_access_key', amazon_object.secret_access_key)
-                    credentials_parser.set(self.profile, 'aws_security_token', amazon_object.session_token)
-                    credentials_parser.set(self.profile, 'aws_session_expiration', amazon_object.expiration.strftime('%Y-%m-%dT%H:%M:%S%z'))
-                    credentials_parser.set(self.profile, 'aws_session_token', amazon_object.session_token)
-
-                    with open(self.credentials_file, 'w+') as f:
-                        credentials_parser.write(f)
-                finally:
-                    credentials_file_lock.release()
-
-            if self.__saml_cache is not None:
-                saml_cache_file_lock = filelock.FileLock(self.saml_cache_file + '.lock')
-                saml_cache_file_lock.acquire()
-                try:
-                    with open(self.saml_cache_file, 'w') as f:
-                        f.write(self.__saml_cache.decode("utf-8"))
-                finally:
-                    saml_cache_file_lock.release()
+        return skipped
 
     # Read from the configuration file and override ALL values currently stored
     # in the configuration object. As this is potentially destructive, it's
@@ -235,6 +405,14 @@ class Configuration(object):
             read_keyring = config_parser[profile_string].getboolean('google_config.keyring', None)
             self.keyring = coalesce(read_keyring, self.keyring)
 
+            # TOTP secret in the keyring
+            read_totp_keyring = config_parser[profile_string].getboolean('google_config.totp_keyring', None)
+            self.totp_keyring = coalesce(read_totp_keyring, self.totp_keyring)
+
+            # Fastest STS endpoint
+            read_probe_sts = config_parser[profile_string].getboolean('google_config.probe_sts', None)
+            self.probe_sts = coalesce(read_probe_sts, self.probe_sts)
+
             # Duration
             read_duration = config_parser[profile_string].getint('google_config.duration', None)
             self.duration = coalesce(read_duration, self.duration)
@@ -267,6 +445,19 @@ class Configuration(object):
             read_bg_response = unicode_to_string(config_parser[profile_string].get('google_config.bg_response', None))
             self.bg_response = coalesce(read_bg_response, self.bg_response)
 
+            # Alias role
+            read_alias_role = unicode_to_string(config_parser[profile_string].get('google_config.alias_role', None))
+            self.alias_role = coalesce(read_alias_role, self.alias_role)
+
+            # Alias file
+            read_alias_file = unicode_to_string(config_parser[profile_string].get('google_config.alias_file', None))
+            self.alias_file = coalesce(read_alias_file, self.alias_file)
+
+            # Chained roles
+            read_chain_roles = unicode_to_string(config_parser[profile_string].get('google_config.chain_roles', None))
+            if read_chain_roles is not None:
+                self.chain_roles = parse_chain_roles(read_chain_roles.split(','), profile)
+
             # Account
             read_account = unicode_to_string(config_parser[profile_string].get('account', None))
             self.account = coalesce(read_account, self.account)
@@ -274,6 +465,6 @@ class Configuration(object):
         # SAML Cache
         try:
             with open(self.saml_cache_file, 'r') as f:
-                self.__saml_cache = f.read().encode("utf-8")
+                self.saml_cache = f.read().encode("utf-8")
         except IOError:
             pass
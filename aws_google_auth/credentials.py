@@ -0,0 +1,140 @@
+#!/usr/bin/env python
+
+from collections import namedtuple
+from datetime import datetime
+
+import keyring
+
+try:
+    from backports import configparser
+except ImportError:
+    import configparser
+
+from aws_google_auth import amazon
+from aws_google_auth import google
+from aws_google_auth import ratelimit
+from aws_google_auth import totp
+from aws_google_auth import util
+
+# Format of the aws_session_expiration entries written by Configuration.write
+EXPIRATION_FORMAT = '%Y-%m-%dT%H:%M:%S%z'
+
+
+class Credentials(namedtuple('Credentials', ['access_key_id', 'secret_access_key', 'session_token',
+                                             'expiration', 'role_arn'])):
+    """Temporary AWS credentials for a role. `expiration` is a timezone aware datetime."""
+
+    @property
+    def environment(self):
+        """The credentials as the environment variables AWS SDKs and the CLI read."""
+        return {
+            'AWS_ACCESS_KEY_ID': self.access_key_id,
+            'AWS_SECRET_ACCESS_KEY': self.secret_access_key,
+            'AWS_SESSION_TOKEN': self.session_token,
+            'AWS_SECURITY_TOKEN': self.session_token,
+        }
+
+    @property
+    def process_output(self):
+        """The credentials as the JSON object credential_process commands print."""
+        return {
+            'Version': 1,
+            'AccessKeyId': self.access_key_id,
+            'SecretAccessKey': self.secret_access_key,
+            'SessionToken': self.session_token,
+            'Expiration': self.expiration.isoformat(),
+        }
+
+
+def get_credentials(config, session=None, sts_client=None, timings=None):
+    """Return Credentials for `config.role_arn`, without prompting or writing to disk.
+
+    `config` is a Configuration (or any object with the same attributes). Its
+    valid SAML cache is used when present; otherwise a Google login is
+    performed with `config.username`/`config.password` and the resulting
+    assertion is kept in `config.saml_cache`, in memory only, for the next
+    call. Challenges that need a human (MFA tokens, captchas) still prompt.
+
+    Long running callers can pass a requests.Session for the Google login and
+    an STS client (sts.STSClient, or a boto3 one), so connections are reused
+    across calls.
+
+    Raises ExpectedGoogleException if the role is not in the SAML assertion.
+    """
+    saml_xml = config.saml_cache
+    if saml_xml is None:
+        config.raise_if_invalid()
+        google_client = google.Google(config, save_failure=False, timings=timings, session=session,
+                                      limiter=ratelimit.login_limiter())
+        google_client.do_login()
+        saml_xml = google_client.parse_saml()
+        config.saml_cache = saml_xml
+
+    amazon_client = amazon.Amazon(config, saml_xml, timings=timings, sts_client=sts_client)
+    roles = amazon_client.roles
+    if config.role_arn not in roles:
+        raise google.ExpectedGoogleException(
+            "Role {} is not in the SAML assertion. Available roles: {}".format(
+                config.role_arn, ", ".join(sorted(roles))))
+    config.provider = roles[config.role_arn]
+
+    return Credentials(access_key_id=amazon_client.access_key_id,
+                       secret_access_key=amazon_client.secret_access_key,
+                       session_token=amazon_client.session_token,
+                       expiration=amazon_client.expiration,
+                       role_arn=config.role_arn)
+
+
+def read_credentials(credentials_file, profile, role_arn=None):
+    """Return the Credentials stored for `profile` in `credentials_file`, or
+    None if there are none (or they have no usable expiration).
+
+    The file is only read, without taking its lock: a concurrent write
+    replaces it whole, so the worst case is reading the previous credentials.
+    """
+    credentials_parser = configparser.RawConfigParser()
+    credentials_parser.read(credentials_file)
+    if not credentials_parser.has_section(profile):
+        return None
+
+    section = credentials_parser[profile]
+    try:
+        expiration = datetime.strptime(section.get('aws_session_expiration'), EXPIRATION_FORMAT)
+    except (TypeError, ValueError):
+        return None
+
+    return Credentials(access_key_id=section.get('aws_access_key_id'),
+                       secret_access_key=section.get('aws_secret_access_key'),
+                       session_token=section.get('aws_session_token'),
+                       expiration=expiration,
+                       role_arn=role_arn)
+
+
+def interactive_login(config, interactive=True):
+    """Log in to Google and keep the fresh SAML assertion in config.saml_cache.
+
+    The password comes from the keyring when `config.keyring` is set, and is
+    prompted for otherwise. With `config.totp_keyring`, MFA tokens are
+    generated from the TOTP secret stored in the keyring (if there is one),
+    so no one needs to be around. Neither is kept once the login is done.
+    When not `interactive`, anything that would prompt raises an
+    errors.InputRequired instead.
+    """
+    password = None
+    if config.keyring:
+        password = keyring.get_password("aws-google-auth", config.username)
+    if not password:
+        password = util.Util.get_password("Google Password: ", interactive)
+
+    config.password = password
+    if config.totp_keyring:
+        config.totp_secret = keyring.get_password(totp.KEYRING_SERVICE, config.username)
+    try:
+        config.raise_if_invalid()
+        google_client = google.Google(config, save_failure=False, limiter=ratelimit.login_limiter(),
+                                      interactive=interactive)
+        google_client.do_login()
+        config.saml_cache = google_client.parse_saml()
+    finally:
+        config.password = None
+        config.totp_secret = None
@@ -0,0 +1,198 @@
+#!/usr/bin/env python
+from __future__ import print_function
+
+import argparse
+import base64
+import json
+import logging
+import os
+import sys
+import time
+from contextlib import contextmanager
+
+from six import print_ as print
+
+from aws_google_auth import status
+
+# kubectl runs its credential plugin before every command, so a token still in
+# the cache is printed without importing boto, requests or the login code
+# (the same constraint as the status module). Only a cache miss reads the
+# profile, resolves credentials and signs a new token.
+
+API_VERSION = 'client.authentication.k8s.io/v1beta1'
+API_VERSIONS = (API_VERSION, 'client.authentication.k8s.io/v1')
+
+# An EKS token is a presigned sts:GetCallerIdentity URL, bound to the cluster
+# by a signed header. EKS accepts it for 15 minutes after signing; kubectl is
+# told it expires a minute earlier, or when the credentials do if sooner.
+TOKEN_PREFIX = 'k8s-aws-v1.'
+CLUSTER_HEADER = 'x-k8s-aws-id'
+TOKEN_LIFETIME = 14 * 60
+URL_EXPIRES = 60
+
+# Cached tokens are handed out while they are valid for at least this long
+MIN_REMAINING = 60
+
+
+def parse_args(args):
+    parser = argparse.ArgumentParser(
+        prog="aws-google-auth eks-token",
+        description="Print an EKS token as a Kubernetes ExecCredential, for kubectl's exec credential plugins",
+    )
+
+    parser.add_argument('-c', '--cluster', required=True, help='Name of the EKS cluster')
+    parser.add_argument('-p', '--profile', help='AWS profile (defaults to value of $AWS_PROFILE, then falls back to \'sts\')')
+    parser.add_argument('-r', '--role-arn', help='The ARN of the role to assume (defaults to the role of the profile)')
+    parser.add_argument('-R', '--region', help='Region of the STS endpoint the token is signed for (defaults to the region of the profile)')
+    parser.add_argument('-l', '--log', dest='log_level', choices=['debug',
+                        'info', 'warn'], default='warn', help='Select log level (default: %(default)s)')
+
+    return parser.parse_args(args)
+
+
+def cache_file():
+    """Where tokens are cached: next to the credentials file."""
+    return os.path.join(os.path.dirname(status.credentials_file()), 'eks_token_cache.json')
+
+
+def exec_info(environ=None):
+    """The ExecCredential kubectl passes in $KUBERNETES_EXEC_INFO, or {} if there is none."""
+    try:
+        return json.loads((os.environ if environ is None else environ).get('KUBERNETES_EXEC_INFO', '{}'))
+    except ValueError:
+        return {}
+
+
+def exec_credential(token, api_version=API_VERSION):
+    """The ExecCredential printing `token` (a dict with 'token' and 'expiration', in epoch seconds)."""
+    return {
+        'kind': 'ExecCredential',
+        'apiVersion': api_version if api_version in API_VERSIONS else API_VERSION,
+        'spec': {},
+        'status': {
+            'expirationTimestamp': time.strftime('%Y-%m-%dT%H:%M:%SZ', time.gmtime(token['expiration'])),
+            'token': token['token'],
+        },
+    }
+
+
+class TokenCache(object):
+    """Tokens kept in the JSON file `path`, by profile, role, cluster and region.
+
+    Reads take no lock: writes replace the file whole. A missing or
+    unreadable file is an empty cache.
+    """
+
+    def __init__(self, path, clock=time.time):
+        self.path = path
+        self.clock = clock
+
+    @staticmethod
+    def key(profile, cluster, role_arn=None, region=None):
+        return json.dumps([profile, cluster, role_arn, region])
+
+    def _read(self):
+        try:
+            with open(self.path) as f:
+                entries = json.load(f)
+        except (IOError, OSError, ValueError):
+            return {}
+        return entries if isinstance(entries, dict) else {}
+
+    def _fresh(self, token, now):
+        try:
+            return bool(token['token']) and float(token['expiration']) - now >= MIN_REMAINING
+        except (TypeError, KeyError, ValueError):
+            return False
+
+    def get(self, key):
+        """The cached token for `key`, or None if there is none valid for MIN_REMAINING seconds."""
+        token = self._read().get(key)
+        return token if self._fresh(token, self.clock()) else None
+
+    def put(self, key, token):
+        """Cache `token`, dropping the entries that are no longer fresh."""
+        import filelock
+        from aws_google_auth import util
+
+        now = self.clock()
+        try:
+            with filelock.FileLock(self.path + '.lock'):
+                entries = dict((k, v) for k, v in self._read().items() if self._fresh(v, now))
+                entries[key] = token
+                with util.atomic_write(self.path) as f:
+                    json.dump(entries, f)
+        except (IOError, OSError) as ex:
+            logging.warning('%s: could not cache the token in %s: %s', __name__, self.path, ex)
+
+
+def presigned_token(creds, cluster, region=None):
+    """An EKS token for `cluster`, signed with `creds` (credentials.Credentials)."""
+    from botocore.auth import SigV4QueryAuth
+    from botocore.awsrequest import AWSRequest
+    from botocore.credentials import Credentials as BotocoreCredentials
+    from aws_google_auth import sts
+
+    request = AWSRequest(method='GET', url=sts.endpoint_for_region(region) + '/',
+                         params={'Action': 'GetCallerIdentity', 'Version': sts.API_VERSION},
+                         headers={CLUSTER_HEADER: cluster})
+    signer = SigV4QueryAuth(BotocoreCredentials(creds.access_key_id, creds.secret_access_key, creds.session_token),
+                            'sts', region or 'us-east-1', expires=URL_EXPIRES)
+    signer.add_auth(request)
+    return TOKEN_PREFIX + base64.urlsafe_b64encode(request.url.encode('utf-8')).decode('utf-8').rstrip('=')
+
+
+@contextmanager
+def _prompts_on_stderr():
+    """Send prompts to stderr: kubectl reads the plugin's stdout as the ExecCredential."""
+    stdout, sys.stdout = sys.stdout, sys.stderr
+    try:
+        yield
+    finally:
+        sys.stdout = stdout
+
+
+def new_token(profile, cluster, role_arn=None, region=None, interactive=True):
+    """Resolve credentials for `profile` the way exec does, and sign a token with them."""
+    import calendar
+    import functools
+    from aws_google_auth import configuration
+    from aws_google_auth import credentials
+    from aws_google_auth import execute
+    from aws_google_auth import util
+
+    config = configuration.Configuration()
+    config.profile = profile
+    config.read(profile)
+    profile_role_arn = config.role_arn
+    config.role_arn = util.Util.coalesce(role_arn, config.role_arn)
+
+    with _prompts_on_stderr():
+        # The stored credentials are for the profile's role, not for --role-arn
+        creds = execute.resolve_credentials(config, TOKEN_LIFETIME, reuse_stored=config.role_arn == profile_role_arn,
+                                            login=functools.partial(credentials.interactive_login, interactive=interactive))
+
+    signed_at = time.time()
+    region = util.Util.coalesce(region, config.region)
+    return {'token': presigned_token(creds, cluster, region),
+            'expiration': min(calendar.timegm(creds.expiration.utctimetuple()), int(signed_at) + TOKEN_LIFETIME)}
+
+
+def main(cli_args):
+    args = parse_args(cli_args)
+    logging.getLogger().setLevel(getattr(logging, args.log_level.upper(), None))
+
+    # Configuration's default profile, without loading it
+    profile = args.profile or os.getenv('AWS_PROFILE') or 'sts'
+    info = exec_info()
+
+    cache = TokenCache(cache_file())
+    key = TokenCache.key(profile, args.cluster, args.role_arn, args.region)
+    token = cache.get(key)
+    if token is None:
+        logging.info('%s: no cached token for %s, signing a new one', __name__, args.cluster)
+        token = new_token(profile, args.cluster, args.role_arn, args.region,
+                          interactive=info.get('spec', {}).get('interactive', True))
+        cache.put(key, token)
+
+    print(json.dumps(exec_credential(token, info.get('apiVersion', API_VERSION))))
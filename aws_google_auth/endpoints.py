@@ -0,0 +1,240 @@
+#!/usr/bin/env python
+
+import json
+import logging
+import os
+import socket
+import threading
+import time
+
+import filelock
+from botocore.exceptions import ClientError
+
+from aws_google_auth import status
+from aws_google_auth import sts
+from aws_google_auth import util
+
+# With config.probe_sts, STS calls go to the regional endpoint with the
+# fastest TCP handshake instead of the profile's region (or us-east-1). The
+# choice is cached per network, keyed by the local address used to reach
+# AWS, so a laptop moving between offices probes again in each of them.
+
+# Regions whose STS endpoint is active by default. Opt-in regions need
+# activating per account, so they are only probed when listed in
+# $AWS_GOOGLE_AUTH_STS_REGIONS (comma separated).
+CANDIDATE_REGIONS = (
+    'us-east-1', 'us-east-2', 'us-west-1', 'us-west-2', 'ca-central-1', 'sa-east-1',
+    'eu-west-1', 'eu-west-2', 'eu-west-3', 'eu-central-1', 'eu-north-1',
+    'ap-south-1', 'ap-southeast-1', 'ap-southeast-2', 'ap-northeast-1', 'ap-northeast-2', 'ap-northeast-3',
+)
+REGIONS_VARIABLE = 'AWS_GOOGLE_AUTH_STS_REGIONS'
+
+# Connections opened to each endpoint; the fastest one counts. No endpoint
+# is waited for longer than PROBE_TIMEOUT seconds.
+PROBES = 2
+PROBE_TIMEOUT = 1.0
+
+# How long a choice is kept before the network is probed again
+CACHE_TTL = 24 * 3600
+
+
+def default_path():
+    """The cache file: next to the credentials file."""
+    return os.path.join(os.path.dirname(status.credentials_file()), 'sts_endpoints.json')
+
+
+def candidate_regions():
+    regions = os.getenv(REGIONS_VARIABLE)
+    if regions:
+        return [region.strip() for region in regions.split(',') if region.strip()]
+    return list(CANDIDATE_REGIONS)
+
+
+def network_id():
+    """The local address this host reaches AWS from, or 'unknown'.
+
+    Connecting a UDP socket only picks the route; nothing is sent.
+    """
+    sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    try:
+        sock.connect(('sts.amazonaws.com', 443))
+        return sock.getsockname()[0]
+    except (IOError, OSError) as ex:
+        logging.debug('%s: could not tell the network apart: %s', __name__, ex)
+        return 'unknown'
+    finally:
+        sock.close()
+
+
+def probe(endpoint, timeout=PROBE_TIMEOUT, probes=PROBES):
+    """Seconds to open a TCP connection to `endpoint` (best of `probes`), or None if it cannot be reached."""
+    host = endpoint.split('://', 1)[-1].split('/', 1)[0]
+    port = 443
+    if ':' in host:
+        host, port = host.rsplit(':', 1)
+        port = int(port)
+    try:
+        address = socket.getaddrinfo(host, port, 0, socket.SOCK_STREAM)[0][4]
+    except (IOError, OSError) as ex:
+        logging.debug('%s: could not resolve %s: %s', __name__, host, ex)
+        return None
+
+    best = None
+    for _ in range(probes):
+        start = time.time()
+        try:
+            socket.create_connection(address[:2], timeout=timeout).close()
+        except (IOError, OSError) as ex:
+            logging.debug('%s: could not connect to %s: %s', __name__, endpoint, ex)
+            continue
+        elapsed = time.time() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best
+
+
+def fastest_region(regions, probe=probe):
+    """The region of `regions` whose STS endpoint answered fastest, and its
+    latency in seconds, or (None, None) if none answered.
+
+    Every endpoint is probed at once, so this takes as long as the slowest
+    probe (at most PROBE_TIMEOUT per probe).
+    """
+    latencies = {}
+
+    def run(region):
+        latency = probe(sts.endpoint_for_region(region))
+        if latency is not None:
+            latencies[region] = latency
+
+    threads = [threading.Thread(target=run, args=(region,)) for region in regions]
+    for thread in threads:
+        thread.daemon = True
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    if not latencies:
+        return None, None
+    region = min(latencies, key=latencies.get)
+    logging.info('%s: fastest STS endpoint is %s (%.0fms)', __name__, region, latencies[region] * 1000)
+    return region, latencies[region]
+
+
+class EndpointCache(object):
+    """The region picked for each network, kept in the JSON file `path`.
+
+    A region of None stands for the global endpoint (nothing answered).
+    Reads take no lock: writes replace the file whole. A missing or
+    unreadable file is an empty cache.
+    """
+
+    def __init__(self, path, ttl=CACHE_TTL, clock=time.time):
+        self.path = path
+        self.ttl = ttl
+        self.clock = clock
+
+    def _read(self):
+        try:
+            with open(self.path) as f:
+                entries = json.load(f)
+        except (IOError, OSError, ValueError):
+            return {}
+        return entries if isinstance(entries, dict) else {}
+
+    def get(self, network):
+        """(True, region) if a region is cached for `network`, (False, None) if not."""
+        entry = self._read().get(network)
+        try:
+            if self.clock() - float(entry['probed']) < self.ttl:
+                return True, entry['region']
+        except (TypeError, KeyError, ValueError):
+            pass
+        return False, None
+
+    def _update(self, network, entry):
+        try:
+            with filelock.FileLock(self.path + '.lock'):
+                entries = self._read()
+                if entry is None:
+                    entries.pop(network, None)
+                else:
+                    entries[network] = entry
+                with util.atomic_write(self.path) as f:
+                    json.dump(entries, f)
+        except (IOError, OSError) as ex:
+            logging.warning('%s: could not update %s: %s', __name__, self.path, ex)
+
+    def put(self, network, region, latency=None):
+        self._update(network, {'region': region, 'latency': latency, 'probed': self.clock()})
+
+    def forget(self, network):
+        self._update(network, None)
+
+
+def sts_client(config, cache=None, network=None, probe=probe):
+    """The sts.STSClient to use for `config`.
+
+    Without `config.probe_sts` (or with the endpoint set in the
+    environment), that is the client for `config.region`. Otherwise it is
+    the client for the fastest regional endpoint on this network, probed
+    unless the cache knows it, or for the global endpoint if none answered.
+    A probed regional endpoint falls back to the global one when it turns
+    out to be disabled or unreachable.
+    """
+    if not config.probe_sts or sts.endpoint_for_region(None) != sts.GLOBAL_ENDPOINT:
+        return sts.STSClient(region=config.region)
+
+    cache = EndpointCache(default_path()) if cache is None else cache
+    network = network_id() if network is None else network
+    found, region = cache.get(network)
+    if not found:
+        with config.timings.phase('probe sts endpoints', metric='sts.probe'):
+            region, latency = fastest_region(candidate_regions(), probe=probe)
+        cache.put(network, region, latency)
+
+    if region is None:
+        return sts.STSClient()
+    return ProbedSTSClient(region, cache, network)
+
+
+def warm_sts_client(config):
+    """sts_client(config), with a connection to its endpoint already open."""
+    client = sts_client(config)
+    client.warm_up()
+    return client
+
+
+class ProbedSTSClient(sts.STSClient):
+    """An STSClient for a probed region, which switches to the global
+    endpoint (and drops the cached choice) if the region fails it."""
+
+    # STS answers with this when the account has deactivated the region
+    REGION_DISABLED = 'RegionDisabledException'
+
+    def __init__(self, region, cache, network, **kwargs):
+        super(ProbedSTSClient, self).__init__(region=region, **kwargs)
+        self.cache = cache
+        self.network = network
+        self._lock = threading.Lock()
+
+    def assume_role_with_saml(self, **kwargs):
+        endpoint = self.endpoint
+        try:
+            return super(ProbedSTSClient, self).assume_role_with_saml(**kwargs)
+        except ClientError as err:
+            if endpoint == sts.GLOBAL_ENDPOINT or err.response.get('Error', {}).get('Code') != self.REGION_DISABLED:
+                raise
+            reason = err
+        except IOError as err:
+            # requests' connection errors and timeouts
+            if endpoint == sts.GLOBAL_ENDPOINT:
+                raise
+            reason = err
+
+        logging.warning('%s: STS endpoint %s failed, falling back to %s: %s', __name__, endpoint, sts.GLOBAL_ENDPOINT, reason)
+        with self._lock:
+            if self.endpoint != sts.GLOBAL_ENDPOINT:
+                self.endpoint = sts.GLOBAL_ENDPOINT
+                self.region = 'us-east-1'
+                self.cache.forget(self.network)
+        return super(ProbedSTSClient, self).assume_role_with_saml(**kwargs)
@@ -0,0 +1,74 @@
+#!/usr/bin/env python
+
+# Exit statuses of the command line tool, one per kind of failure, so that
+# scripts running it with --non-interactive can tell what went wrong (and
+# what is worth retrying) without parsing messages. 2 is argparse's usage
+# error.
+EXIT_OK = 0
+EXIT_FAILURE = 1
+EXIT_INPUT_REQUIRED = 3
+EXIT_CACHE_MISS = 4
+EXIT_MFA_REQUIRED = 5
+EXIT_CAPTCHA = 6
+EXIT_STS_THROTTLED = 7
+EXIT_NETWORK = 8
+
+
+class ExpectedGoogleException(Exception):
+    """A failure reported to the user as a message rather than a traceback."""
+
+    exit_code = EXIT_FAILURE
+    kind = 'error'
+
+    def __init__(self, *args):
+        super(ExpectedGoogleException, self).__init__(*args)
+
+
+class InputRequired(ExpectedGoogleException):
+    """The run needs an answer from the user, but prompts are disabled."""
+
+    exit_code = EXIT_INPUT_REQUIRED
+    kind = 'input_required'
+
+
+class LoginRequired(InputRequired):
+    """There is no valid cached SAML assertion, and no stored password to log in with."""
+
+    exit_code = EXIT_CACHE_MISS
+    kind = 'cache_miss'
+
+
+class MFARequired(InputRequired):
+    """Google asked for a second factor that cannot be answered unattended."""
+
+    exit_code = EXIT_MFA_REQUIRED
+    kind = 'mfa_required'
+
+
+class CaptchaRequired(InputRequired):
+    """Google asked for a captcha."""
+
+    exit_code = EXIT_CAPTCHA
+    kind = 'captcha'
+
+
+class STSThrottled(ExpectedGoogleException):
+    """STS is rate limiting AssumeRoleWithSAML calls."""
+
+    exit_code = EXIT_STS_THROTTLED
+    kind = 'sts_throttled'
+
+
+class NetworkError(ExpectedGoogleException):
+    """Google could not be reached (connection error, timeout, redirect loop)."""
+
+    exit_code = EXIT_NETWORK
+    kind = 'network_error'
+
+
+def for_kind(kind, message):
+    """The exception of `kind` (as reported in JSON results), with `message`."""
+    for cls in (InputRequired, LoginRequired, MFARequired, CaptchaRequired, STSThrottled, NetworkError):
+        if cls.kind == kind:
+            return cls(message)
+    return ExpectedGoogleException(message)
@@ -0,0 +1,101 @@
+#!/usr/bin/env python
+
+import argparse
+import logging
+import os
+import subprocess
+import sys
+from datetime import datetime, timedelta
+
+from dateutil.tz import tzutc
+
+from aws_google_auth import configuration
+from aws_google_auth import credentials
+from aws_google_auth import google
+from aws_google_auth import util
+
+# Variables that make AWS SDKs ignore credentials passed in the environment
+# (or pick another profile's), so they are not passed on to the command.
+PROFILE_VARIABLES = ('AWS_PROFILE', 'AWS_DEFAULT_PROFILE')
+
+
+def parse_args(args):
+    parser = argparse.ArgumentParser(
+        prog="aws-google-auth exec",
+        description="Run a command with temporary AWS credentials in its environment",
+        usage="%(prog)s [-h] [-p PROFILE] [-r ROLE_ARN] [--min-remaining SECONDS] [-l {debug,info,warn}] -- COMMAND [ARGS ...]",
+    )
+
+    parser.add_argument('-p', '--profile', help='AWS profile (defaults to value of $AWS_PROFILE, then falls back to \'sts\')')
+    parser.add_argument('-r', '--role-arn', help='The ARN of the role to assume (defaults to the role of the profile)')
+    parser.add_argument('--min-remaining', type=int, default=300, metavar='SECONDS', help='Reuse the profile\'s stored credentials if they are valid for at least this long (default: %(default)s)')
+    parser.add_argument('-l', '--log', dest='log_level', choices=['debug',
+                        'info', 'warn'], default='warn', help='Select log level (default: %(default)s)')
+    parser.add_argument('command', nargs=argparse.REMAINDER, help='The command to run, after --')
+
+    args = parser.parse_args(args)
+    if args.command and args.command[0] == '--':
+        args.command = args.command[1:]
+    if not args.command:
+        parser.error('a command to run is required')
+    return args
+
+
+def resolve_credentials(config, min_remaining, reuse_stored=True, login=credentials.interactive_login):
+    """Credentials for `config.role_arn` that are valid for at least
+    `min_remaining` seconds, without writing anything to disk.
+
+    With `reuse_stored`, the profile's stored credentials are returned when
+    they are fresh enough. Otherwise the role is assumed again, with the
+    cached SAML assertion when it is valid and after logging in to Google if
+    not. A new assertion is saved to the SAML cache file (not the
+    credentials file) for the next run.
+    """
+    if not config.role_arn:
+        raise google.ExpectedGoogleException(
+            "No role configured for profile {}. Pass --role-arn, or run "
+            "aws-google-auth -p {} once to set one up.".format(config.profile, config.profile))
+
+    if reuse_stored:
+        stored = credentials.read_credentials(config.credentials_file, config.profile, config.role_arn)
+        if stored is not None and stored.expiration - datetime.now(tzutc()) >= timedelta(seconds=min_remaining):
+            logging.info('%s: using stored credentials for profile %s', __name__, config.profile)
+            return stored
+
+    if config.saml_cache is None:
+        login(config)
+        # Replaced whole: a run logging in at the same time cannot leave
+        # it half written, so there is no lock to wait for
+        config.write_saml_cache(lock=False)
+    return credentials.get_credentials(config)
+
+
+def child_environment(creds, region=None, environ=None):
+    env = dict(os.environ if environ is None else environ)
+    for variable in PROFILE_VARIABLES:
+        env.pop(variable, None)
+    env.update(creds.environment)
+    env['AWS_SESSION_EXPIRATION'] = creds.expiration.strftime(credentials.EXPIRATION_FORMAT)
+    if region:
+        env.setdefault('AWS_DEFAULT_REGION', region)
+        env.setdefault('AWS_REGION', region)
+    return env
+
+
+def main(cli_args):
+    args = parse_args(cli_args)
+    logging.getLogger().setLevel(getattr(logging, args.log_level.upper(), None))
+
+    config = configuration.Configuration()
+    config.profile = util.Util.coalesce(args.profile, os.getenv('AWS_PROFILE'), config.profile)
+    config.read(config.profile)
+    profile_role_arn = config.role_arn
+    config.role_arn = util.Util.coalesce(args.role_arn, config.role_arn)
+
+    # The stored credentials are for the profile's role, not for --role-arn
+    creds = resolve_credentials(config, args.min_remaining, reuse_stored=config.role_arn == profile_role_arn)
+    try:
+        returncode = subprocess.call(args.command, env=child_environment(creds, config.region))
+    except OSError as ex:
+        raise google.ExpectedGoogleException("Could not run {}: {}".format(args.command[0], ex))
+    sys.exit(returncode)
@@ -9,6 +9,7 @@ import logging
 import os
 import re
 import sys
+import time
 
 import requests
 from PIL import Image
@@ -16,10 +17,25 @@ from datetime import datetime
 from distutils.spawn import find_executable
 from bs4 import BeautifulSoup
 from requests import HTTPError
-from six import print_ as print
+from six import print_ as print, string_types
 from six.moves import urllib_parse, input
 
 from aws_google_auth import _version
+from aws_google_auth import capture
+from aws_google_auth import errors
+from aws_google_auth import totp
+from aws_google_auth import util
+from aws_google_auth.errors import ExpectedGoogleException
+from aws_google_auth.timings import Timings
+
+# How many codes generated from config.totp_secret are tried before giving up
+# (each in a new time step, so this also covers a little clock skew).
+TOTP_ATTEMPTS = 3
+
+# Base64, as key handles are sent in challenge pages: standard with its
+# padding, or URL-safe (where the padding is optional)
+KEY_HANDLE_SHAPE = re.compile(r'^(?:[A-Za-z0-9+/]{4})+(?:[A-Za-z0-9+/]{2}==|[A-Za-z0-9+/]{3}=)?$'
+                              r'|^(?:[A-Za-z0-9_-]{4})+(?:[A-Za-z0-9_-]{2}(?:==)?|[A-Za-z0-9_-]{3}=?)?$')
 
 # The U2F USB Library is optional, if it's there, include it.
 try:
@@ -29,13 +45,11 @@ except ImportError:
                  "Other methods can still continue.")
 
 
-class ExpectedGoogleException(Exception):
-    def __init__(self, *args):
-        super(ExpectedGoogleException, self).__init__(*args)
-
-
 class Google:
-    def __init__(self, config, save_failure, save_flow=False):
+    def __init__(self, config, save_failure, save_flow=False,
+                 base_url='https://accounts.google.com',
+                 api_url='https://content.googleapis.com', timings=None, session=None, interactive=True,
+                 limiter=None):
         """The Google object holds authentication state
         for a given session. You need to supply:
 
@@ -46,18 +60,34 @@ class Google:
 
         Optionally, you can supply:
         duration_seconds: number of seconds for the session to be active (max 43200)
+        base_url: Google accounts endpoint (overridden when replaying a flow)
+        api_url: Google APIs endpoint used by the Google Prompt challenge
+        timings: Timings object recording how long each step of the login takes
+        session: requests.Session to reuse (a new one is created per login otherwise)
+        interactive: False to fail (with an errors.InputRequired) rather than
+            wait for the user when Google asks for a second factor or a captcha
+        limiter: ratelimit.TokenBucket to take a token from before posting the
+            password (not limited otherwise)
         """
 
         self.version = _version.__version__
         self.config = config
-        self.base_url = 'https://accounts.google.com'
+        self.base_url = base_url
+        self.api_url = api_url
+        self.timings = Timings() if timings is None else timings
+        self.session = session
+        self.interactive = interactive
+        self.limiter = limiter
         self.save_failure = save_failure
         self.session_state = None
         self.save_flow = save_flow
+        self.capture = None
+        self._prefetched = None
+        self._totp_step = None
         if save_flow:
-            self.save_flow_dict = {}
-            self.save_flow_dir = "aws-google-auth-" + datetime.now().strftime('%Y-%m-%dT%H%M%S')
-            os.makedirs(self.save_flow_dir, exist_ok=True)
+            self.capture = capture.FlowCapture(
+                "aws-google-auth-" + datetime.now().strftime('%Y-%m-%dT%H%M%S') + ".ndjson.gz",
+                secrets=[config.password])
 
     @property
     def login_url(self):
@@ -95,69 +125,60 @@ class Google:
 
         return sess
 
-    def _save_file_name(self, url):
-        filename = url.split('://')[1].split('?')[0].replace("accounts.google", "ac.go").replace("/", "~")
-        file_idx = self.save_flow_dict.get(filename, 1)
-        self.save_flow_dict[filename] = file_idx + 1
-        return filename + "_" + str(file_idx)
-
     def _save_request(self, url, method='GET', data=None, json_data=None):
-        if self.save_flow:
-            filename = self._save_file_name(url) + "_" + method + ".req"
-            with open(os.path.join(self.save_flow_dir, filename), 'w', encoding='utf-8') as out:
-                try:
-                    out.write("params=" + url.split('?')[1])
-                except IndexError:
-                    out.write("params=None")
-                out.write(("\ndata: " + json.dumps(data, indent=2)).replace(self.config.password, '<PASSWORD>'))
-                out.write(("\njson: " + json.dumps(json_data, indent=2)).replace(self.config.password, '<PASSWORD>'))
-
-    def _save_response(self, url, response):
-        if self.save_flow:
-            filename = self._save_file_name(url) + ".html"
-            with open(os.path.join(self.save_flow_dir, filename), 'w', encoding='utf-8') as out:
-                out.write(response.text)
+        if self.capture is not None:
+            self.capture.request(method, url, data=data, json_data=json_data)
+
+    def _save_response(self, url, response, method='GET'):
+        if self.capture is not None:
+            self.capture.response(method, url, response)
 
     def post(self, url, data=None, json_data=None):
         try:
             self._save_request(url, method='POST', data=data, json_data=json_data)
-            response = self.check_for_failure(self.session.post(url, data=data, json=json_data))
-            self._save_response(url, response)
+            with self.timings.phase('POST ' + urllib_parse.urlparse(url).path, metric='google.post'):
+                response = self.check_for_failure(self.session.post(url, data=data, json=json_data))
+            self._save_response(url, response, method='POST')
 
         except requests.exceptions.ConnectionError as e:
-            logging.exception(
-                'There was a connection error, check your network settings.', e)
-            sys.exit(1)
+            raise errors.NetworkError(
+                'There was a connection error, check your network settings: {}'.format(e))
         except requests.exceptions.Timeout as e:
-            logging.exception('The connection timed out, please try again.', e)
-            sys.exit(1)
+            raise errors.NetworkError('The connection timed out, please try again: {}'.format(e))
         except requests.exceptions.TooManyRedirects as e:
-            logging.exception('The number of redirects exceeded the maximum '
-                              'allowed.', e)
-            sys.exit(1)
+            raise errors.NetworkError('The number of redirects exceeded the maximum '
+                                      'allowed: {}'.format(e))
 
         return response
 
     def get(self, url):
         try:
             self._save_request(url)
-            response = self.check_for_failure(self.session.get(url))
+            with self.timings.phase('GET ' + urllib_parse.urlparse(url).path, metric='google.get'):
+                response = self.check_for_failure(self.session.get(url))
             self._save_response(url, response)
 
         except requests.exceptions.ConnectionError as e:
-            logging.exception(
-                'There was a connection error, check your network settings.', e)
-            sys.exit(1)
+            raise errors.NetworkError(
+                'There was a connection error, check your network settings: {}'.format(e))
         except requests.exceptions.Timeout as e:
-            logging.exception('The connection timed out, please try again.', e)
-            sys.exit(1)
+            raise errors.NetworkError('The connection timed out, please try again: {}'.format(e))
         except requests.exceptions.TooManyRedirects as e:
-            logging.exception('The number of redirects exceeded the maximum '
-                              'allowed.', e)
-            sys.exit(1)
+            raise errors.NetworkError('The number of redirects exceeded the maximum '
+                                      'allowed: {}'.format(e))
 
         return response
 
+    def _parse_html(self, text):
+        with self.timings.phase('parse html'):
+            return BeautifulSoup(text, 'html.parser')
+
+    def _input(self, prompt):
+        if not self.interactive:
+            raise errors.MFARequired("Google asked '{}', but prompts are disabled.".format(prompt.strip()))
+        with self.timings.phase('wait for user'):
+            return input(prompt)
+
     @staticmethod
     def parse_error_message(sess):
         response_page = BeautifulSoup(sess.text, 'html.parser')
@@ -170,104 +191,100 @@ class Google:
 
     @staticmethod
     def find_key_handles(input, challengeTxt):
+        """Return the key handles offered by a security key challenge, URL-safe base64 encoded.
+
+        `input` is the JSON payload of the challenge page, which looks like
+        {"5010": [..., [rp_id, challenge, [[version, key_handle, transports], ...], app_id]]}.
+        Only the key handle slots are looked at; payloads of another shape
+        fall back to every base64 looking string, except `challengeTxt`.
+        """
+        candidates = None
+        for value in (input.values() if isinstance(input, dict) else []):
+            if isinstance(value, list) and len(value) > 5 and isinstance(value[5], list) \
+                    and len(value[5]) > 2 and isinstance(value[5][2], list):
+                candidates = [entry[1] for entry in value[5][2] if isinstance(entry, list) and len(entry) > 1]
+                break
+        if candidates is None:
+            candidates = Google._strings(input)
+
         keyHandles = []
-        typeOfInput = type(input)
-        if typeOfInput == dict:  # parse down a dict
-            for item in input:
-                keyHandles.extend(Google.find_key_handles(input[item], challengeTxt))
-
-        elif typeOfInput == list:  # looks like we've hit an array - iterate it
-            array = list(filter(None, input))  # remove any None type objects from the array
-            for item in array:
-                typeValue = type(item)
-                if typeValue == list:  # another array - recursive call
-                    keyHandles.extend(Google.find_key_handles(item, challengeTxt))
-                elif typeValue == int or typeValue == bool:  # ints bools etc we don't care
-                    continue
-                else:  # we went a string or unicode here (python 3.x lost unicode global)
-                    try:  # keyHandle string will be base64 encoded -
-                        # if its not an exception is thrown and we continue as its not the string we're after
-                        base64UrlEncoded = base64.urlsafe_b64encode(base64.b64decode(item))
-                        if base64UrlEncoded != challengeTxt:  # make sure its not the challengeTxt - if it not return it
-                            keyHandles.append(base64UrlEncoded)
-                    except:
-                        pass
+        for candidate in candidates:
+            if isinstance(candidate, string_types) and KEY_HANDLE_SHAPE.match(candidate):
+                standard = candidate.replace('-', '+').replace('_', '/')
+                base64UrlEncoded = base64.urlsafe_b64encode(base64.b64decode(standard + '=' * (-len(standard) % 4)))
+                if base64UrlEncoded != challengeTxt:  # make sure its not the challengeTxt
+                    keyHandles.append(base64UrlEncoded)
         return keyHandles
 
+    @staticmethod
+    def _strings(input):
+        """Every string in a decoded JSON document, depth first."""
+        strings = []
+        stack = [input]
+        while stack:
+            item = stack.pop()
+            if isinstance(item, dict):
+                stack.extend(reversed(list(item.values())))
+            elif isinstance(item, list):
+                stack.extend(reversed(item))
+            elif isinstance(item, string_types):
+                strings.append(item)
+        return strings
+
     @staticmethod
     def find_app_id(inputString):
         try:
-            searchResult = re.search('"appid":"[a-z://.-_] + "', inputString).group()
+            searchResult = re.search('"appid":"[a-z0-9:/.\\-_]+"', inputString).group()
             searchObject = json.loads('{' + searchResult + '}')
             return str(searchObject['appid'])
         except:
-            logging.exception('Was unable to find appid value in googles SAML page')
-            sys.exit(1)
+            logging.debug('Was unable to find appid value in googles SAML page', exc_info=True)
+            raise ExpectedGoogleException('Was unable to find appid value in googles SAML page')
 
     def do_login(self):
-        self.session = requests.Session()
-        self.session.headers['User-Agent'] = "AWS Sign-in/{} (aws-google-auth)".format(self.version)
-        sess = self.get(self.login_url)
-
-        # Collect information from the page source
-        first_page = BeautifulSoup(sess.text, 'html.parser')
-        # gxf = first_page.find('input', {'name': 'gxf'}).get('value')
-        self.cont = first_page.find('input', {'name': 'continue'}).get('value')
-        # page = first_page.find('input', {'name': 'Page'}).get('value')
-        # sign_in = first_page.find('input', {'name': 'signIn'}).get('value')
-        form = first_page.find('form', {'id': 'gaia_loginform'})
-        account_login_url = form.get('action')
-
-        payload = {}
-
-        for tag in form.find_all('input'):
-            if tag.get('name') is None:
-                continue
-
-            payload[tag.get('name')] = tag.get('value')
-
-        payload['Email'] = self.config.username
-
-        if self.config.bg_response:
-            payload['bgresponse'] = self.config.bg_response
-
-        if payload.get('PersistentCookie', None) is not None:
-            payload['PersistentCookie'] = 'yes'
-
-        if payload.get('TrustDevice', None) is not None:
-            payload['TrustDevice'] = 'on'
-
-        # POST to account login info page, to collect profile and session info
-        sess = self.post(account_login_url, data=payload)
-
-        self.session.headers['Referer'] = sess.url
+        try:
+            self._login()
+        finally:
+            # Flush whatever was captured, even if the login failed: that is
+            # usually when the capture is needed.
+            if self.capture is not None:
+                self.capture.close()
+
+    def prefetch(self):
+        """Start the steps of the login that need no password in the background.
+
+        The login page is fetched and parsed and the username submitted on
+        another thread, typically while the user types their password;
+        do_login() then carries on from there.
+        """
+        self._prefetched = util.Background(self._prefetch)
 
-        # Collect ProfileInformation, SessionState, signIn, and Password Challenge URL
-        challenge_page = BeautifulSoup(sess.text, 'html.parser')
+    def _prefetch(self):
+        with self.timings.phase('prefetch login page'):
+            return self._submit_username()
 
-        # Handle the "old-style" page
-        if challenge_page.find('form', {'id': 'gaia_loginform'}):
-            form = challenge_page.find('form', {'id': 'gaia_loginform'})
-            passwd_challenge_url = form.get('action')
+    def _login(self):
+        if self._prefetched is not None:
+            passwd_challenge_url, payload = self._prefetched.result()
+            self._prefetched = None
         else:
-            # sometimes they serve up a different page
-            logging.info("Handling new-style login page")
-            form = challenge_page.find('form', {'id': 'challenge'})
-            passwd_challenge_url = 'https://accounts.google.com' + form.get('action')
-
-        for tag in form.find_all('input'):
-            if tag.get('name') is None:
-                continue
-
-            payload[tag.get('name')] = tag.get('value')
+            passwd_challenge_url, payload = self._submit_username()
 
         # Update the payload
         payload['Passwd'] = self.config.password
+        if self.capture is not None:
+            self.capture.add_secret(self.config.password)
+
+        # Logins bunched up from one address get captchas, which are much
+        # slower than waiting a little
+        if self.limiter is not None:
+            with self.timings.phase('wait for login slot', metric='login.rate_limit_wait'):
+                self.limiter.acquire()
 
         # POST to Authenticate Password
         sess = self.post(passwd_challenge_url, data=payload)
 
-        response_page = BeautifulSoup(sess.text, 'html.parser')
+        response_page = self._parse_html(sess.text)
         error = response_page.find(class_='error-msg')
         cap = response_page.find('input', {'name': 'identifier-captcha-input'})
 
@@ -286,11 +303,15 @@ class Google:
 
         # Process Google CAPTCHA verification request if present
         if cap is not None:
+            self.timings.incr('google.captcha')
+            if not self.interactive:
+                raise errors.CaptchaRequired("Google asked for a captcha, but prompts are disabled.")
             self.session.headers['Referer'] = sess.url
 
-            sess = self.handle_captcha(sess, payload)
+            with self.timings.phase('challenge captcha', metric='challenge.captcha'):
+                sess = self.handle_captcha(sess, payload)
 
-            response_page = BeautifulSoup(sess.text, 'html.parser')
+            response_page = self._parse_html(sess.text)
             error = response_page.find(class_='error-msg')
             cap = response_page.find('input', {'name': 'logincaptcha'})
 
@@ -308,27 +329,47 @@ class Google:
 
         self.session.headers['Referer'] = sess.url
 
+        # Only TOTP challenges can be answered without the user, and only
+        # with a stored secret.
+        if not self.interactive and "challenge/" in sess.url and not (
+                "challenge/totp/" in sess.url and self.config.totp_secret):
+            raise errors.MFARequired("Google asked for a second factor ({}), but prompts are disabled.".format(
+                urllib_parse.urlparse(sess.url).path))
+
         if "selectchallenge/" in sess.url:
-            sess = self.handle_selectchallenge(sess)
+            with self.timings.phase('challenge selectchallenge', metric='challenge.selectchallenge'):
+                sess = self.handle_selectchallenge(sess)
 
         # Was there an MFA challenge?
         if "challenge/totp/" in sess.url:
-            error_msg = ""
-            while error_msg is not None:
-                sess = self.handle_totp(sess)
-                error_msg = self.parse_error_message(sess)
-                if error_msg is not None:
-                    logging.error(error_msg)
+            with self.timings.phase('challenge totp', metric='challenge.totp'):
+                error_msg = ""
+                attempts = 0
+                while error_msg is not None:
+                    sess = self.handle_totp(sess)
+                    error_msg = self.parse_error_message(sess)
+                    attempts += 1
+                    if error_msg is not None:
+                        logging.error(error_msg)
+                        if self.config.totp_secret and attempts >= TOTP_ATTEMPTS:
+                            raise ExpectedGoogleException(
+                                "{} generated MFA tokens were rejected, check the TOTP secret stored "
+                                "for {} and this machine's clock.".format(attempts, self.config.username))
         elif "challenge/ipp/" in sess.url:
-            sess = self.handle_sms(sess)
+            with self.timings.phase('challenge ipp', metric='challenge.ipp'):
+                sess = self.handle_sms(sess)
         elif "challenge/az/" in sess.url:
-            sess = self.handle_prompt(sess)
+            with self.timings.phase('challenge az', metric='challenge.az'):
+                sess = self.handle_prompt(sess)
         elif "challenge/sk/" in sess.url:
-            sess = self.handle_sk(sess)
+            with self.timings.phase('challenge sk', metric='challenge.sk'):
+                sess = self.handle_sk(sess)
         elif "challenge/iap/" in sess.url:
-            sess = self.handle_iap(sess)
+            with self.timings.phase('challenge iap', metric='challenge.iap'):
+                sess = self.handle_iap(sess)
         elif "challenge/dp/" in sess.url:
-            sess = self.handle_dp(sess)
+            with self.timings.phase('challenge dp', metric='challenge.dp'):
+                sess = self.handle_dp(sess)
         elif "challenge/ootp/5" in sess.url:
             raise NotImplementedError(
                 'Offline Google App OOTP not implemented')
@@ -338,6 +379,71 @@ class Google:
         # save for later
         self.session_state = sess
 
+    def _submit_username(self):
+        """GET the login page and POST the username from its form.
+
+        Returns the URL of the password challenge and the form fields to
+        post to it.
+        """
+        if self.session is None:
+            self.session = requests.Session()
+        self.session.headers['User-Agent'] = "AWS Sign-in/{} (aws-google-auth)".format(self.version)
+        sess = self.get(self.login_url)
+
+        # Collect information from the page source
+        first_page = self._parse_html(sess.text)
+        # gxf = first_page.find('input', {'name': 'gxf'}).get('value')
+        self.cont = first_page.find('input', {'name': 'continue'}).get('value')
+        # page = first_page.find('input', {'name': 'Page'}).get('value')
+        # sign_in = first_page.find('input', {'name': 'signIn'}).get('value')
+        form = first_page.find('form', {'id': 'gaia_loginform'})
+        account_login_url = form.get('action')
+
+        payload = {}
+
+        for tag in form.find_all('input'):
+            if tag.get('name') is None:
+                continue
+
+            payload[tag.get('name')] = tag.get('value')
+
+        payload['Email'] = self.config.username
+
+        if self.config.bg_response:
+            payload['bgresponse'] = self.config.bg_response
+
+        if payload.get('PersistentCookie', None) is not None:
+            payload['PersistentCookie'] = 'yes'
+
+        if payload.get('TrustDevice', None) is not None:
+            payload['TrustDevice'] = 'on'
+
+        # POST to account login info page, to collect profile and session info
+        sess = self.post(account_login_url, data=payload)
+
+        self.session.headers['Referer'] = sess.url
+
+        # Collect ProfileInformation, SessionState, signIn, and Password Challenge URL
+        challenge_page = self._parse_html(sess.text)
+
+        # Handle the "old-style" page
+        if challenge_page.find('form', {'id': 'gaia_loginform'}):
+            form = challenge_page.find('form', {'id': 'gaia_loginform'})
+            passwd_challenge_url = form.get('action')
+        else:
+            # sometimes they serve up a different page
+            logging.info("Handling new-style login page")
+            form = challenge_page.find('form', {'id': 'challenge'})
+            passwd_challenge_url = self.base_url + form.get('action')
+
+        for tag in form.find_all('input'):
+            if tag.get('name') is None:
+                continue
+
+            payload[tag.get('name')] = tag.get('value')
+
+        return passwd_challenge_url, payload
+
     @staticmethod
     def check_extra_step(response):
         extra_step = response.find(text='This extra step shows that it’s really you trying to sign in')
@@ -349,7 +455,7 @@ class Google:
         if self.session_state is None:
             raise RuntimeError('You must use do_login() before calling parse_saml()')
 
-        parsed = BeautifulSoup(self.session_state.text, 'html.parser')
+        parsed = self._parse_html(self.session_state.text)
         try:
             saml_element = parsed.find('input', {'name': 'SAMLResponse'}).get('value')
         except:
@@ -365,7 +471,7 @@ class Google:
         return base64.b64decode(saml_element)
 
     def handle_captcha(self, sess, payload):
-        response_page = BeautifulSoup(sess.text, 'html.parser')
+        response_page = self._parse_html(sess.text)
 
         # Collect ProfileInformation, SessionState, signIn, and Password Challenge URL
         profile_information = response_page.find('input', {
@@ -389,7 +495,7 @@ class Google:
         captcha_container = response_page.find('div', {'id': 'identifier-captcha'})
         captcha_logintoken = captcha_container.find('input', {'id': 'identifier-token'}).get('value')
         captcha_img = captcha_container.find('div', {'class': 'captcha-img'})
-        captcha_url = "https://accounts.google.com" + captcha_img.find('img').get('src')
+        captcha_url = self.base_url + captcha_img.find('img').get('src')
         captcha_logintoken_audio = ''
 
         open_image = True
@@ -410,10 +516,11 @@ class Google:
             except Exception:
                 pass
 
-        try:
-            captcha_input = raw_input("Captcha (case insensitive): ") or None
-        except NameError:
-            captcha_input = input("Captcha (case insensitive): ") or None
+        with self.timings.phase('wait for user'):
+            try:
+                captcha_input = raw_input("Captcha (case insensitive): ") or None
+            except NameError:
+                captcha_input = input("Captcha (case insensitive): ") or None
 
         # Update the payload
         payload['identifier-captcha-input'] = captcha_input
@@ -427,7 +534,7 @@ class Google:
 
         newPayload = {}
 
-        auth_response_page = BeautifulSoup(response.text, 'html.parser')
+        auth_response_page = self._parse_html(response.text)
         form = auth_response_page.find('form')
         for tag in form.find_all('input'):
             if tag.get('name') is None:
@@ -444,7 +551,7 @@ class Google:
         return self.post(response.url, data=newPayload)
 
     def handle_sk(self, sess):
-        response_page = BeautifulSoup(sess.text, 'html.parser')
+        response_page = self._parse_html(sess.text)
         challenge_url = sess.url.split("?")[0]
         challenges_txt = response_page.find('input', {
             'name': "id-challenge"
@@ -472,7 +579,8 @@ class Google:
         auth_response = None
         while True:
             try:
-                auth_response_dict = u2f.u2f_auth(u2f_challenges, facet)
+                with self.timings.phase('wait for security key', metric='u2f.wait'):
+                    auth_response_dict = u2f.u2f_auth(u2f_challenges, facet)
                 auth_response = json.dumps(auth_response_dict)
                 break
             except RuntimeWarning:
@@ -481,7 +589,7 @@ class Google:
                 if attempts_remaining <= 0:
                     break
                 else:
-                    input(
+                    self._input(
                         "Insert your U2F device and press enter to try again..."
                     )
                     attempts_remaining -= 1
@@ -534,10 +642,10 @@ class Google:
         return self.post(challenge_url, data=payload)
 
     def handle_sms(self, sess):
-        response_page = BeautifulSoup(sess.text, 'html.parser')
+        response_page = self._parse_html(sess.text)
         challenge_url = sess.url.split("?")[0]
 
-        sms_token = input("Enter SMS token: G-") or None
+        sms_token = self._input("Enter SMS token: G-") or None
 
         challenge_form = response_page.find('form')
         payload = {}
@@ -561,7 +669,7 @@ class Google:
         return self.post(challenge_url, data=payload)
 
     def handle_prompt(self, sess):
-        response_page = BeautifulSoup(sess.text, 'html.parser')
+        response_page = self._parse_html(sess.text)
         challenge_url = sess.url.split("?")[0]
 
         data_key = response_page.find('div', {
@@ -572,7 +680,7 @@ class Google:
         }).get('data-tx-id')
 
         # Need to post this to the verification/pause endpoint
-        await_url = "https://content.googleapis.com/cryptauth/v1/authzen/awaittx?alt=json&key={}".format(
+        await_url = self.api_url + "/cryptauth/v1/authzen/awaittx?alt=json&key={}".format(
             data_key)
         await_body = {'txId': data_tx_id}
 
@@ -657,13 +765,16 @@ class Google:
             print("numerical code for prompt: {}".format(num_code.string))
 
     def handle_totp(self, sess):
-        response_page = BeautifulSoup(sess.text, 'html.parser')
+        response_page = self._parse_html(sess.text)
         tl = response_page.find('input', {'name': 'TL'}).get('value')
         gxf = response_page.find('input', {'name': 'gxf'}).get('value')
         challenge_url = sess.url.split("?")[0]
         challenge_id = challenge_url.split("totp/")[1]
 
-        mfa_token = input("MFA token: ") or None
+        if self.config.totp_secret:
+            mfa_token = self._generate_totp()
+        else:
+            mfa_token = self._input("MFA token: ") or None
 
         if not mfa_token:
             raise ValueError(
@@ -687,13 +798,25 @@ class Google:
         # Submit TOTP
         return self.post(challenge_url, data=payload)
 
+    def _generate_totp(self):
+        """A code from config.totp_secret, waiting for the next time step
+        rather than sending the code of one already tried (Google rejects
+        a code used twice)."""
+        step = totp.time_step()
+        if self._totp_step is not None and step <= self._totp_step:
+            step = self._totp_step + 1
+            with self.timings.phase('wait for next totp'):
+                time.sleep(max(0, step * totp.PERIOD - time.time()))
+        self._totp_step = step
+        return totp.hotp(totp.decode_secret(self.config.totp_secret), step)
+
     def handle_dp(self, sess):
-        response_page = BeautifulSoup(sess.text, 'html.parser')
+        response_page = self._parse_html(sess.text)
 
-        input("Check your phone - after you have confirmed response press ENTER to continue.") or None
+        self._input("Check your phone - after you have confirmed response press ENTER to continue.") or None
 
         form = response_page.find('form', {'id': 'challenge'})
-        challenge_url = 'https://accounts.google.com' + form.get('action')
+        challenge_url = self.base_url + form.get('action')
 
         payload = {}
         for tag in form.find_all('input'):
@@ -706,14 +829,14 @@ class Google:
         return self.post(challenge_url, data=payload)
 
     def handle_iap(self, sess):
-        response_page = BeautifulSoup(sess.text, 'html.parser')
+        response_page = self._parse_html(sess.text)
         challenge_url = sess.url.split("?")[0]
-        phone_number = input('Enter your phone number:') or None
+        phone_number = self._input('Enter your phone number:') or None
 
         while True:
             try:
                 choice = int(
-                    input(
+                    self._input(
                         'Type 1 to receive a code by SMS or 2 for a voice call:'
                     ))
                 if choice not in [1, 2]:
@@ -774,10 +897,10 @@ class Google:
         # Submit phone number and desired method (SMS or voice call)
         sess = self.post(challenge_url, data=payload)
 
-        response_page = BeautifulSoup(sess.text, 'html.parser')
+        response_page = self._parse_html(sess.text)
         challenge_url = sess.url.split("?")[0]
 
-        token = input("Enter " + send_method + " token: G-") or None
+        token = self._input("Enter " + send_method + " token: G-") or None
 
         payload = {
             'challengeId':
@@ -824,7 +947,7 @@ class Google:
         return self.post(challenge_url, data=payload)
 
     def handle_selectchallenge(self, sess):
-        response_page = BeautifulSoup(sess.text, 'html.parser')
+        response_page = self._parse_html(sess.text)
 
         challenges = []
         for i in response_page.select('form[data-challengeentry]'):
@@ -845,7 +968,7 @@ class Google:
         for i, mfa in enumerate(challenges, start=1):
             print("{}: {}".format(i, mfa[0]))
 
-        selected_challenge = input("Enter MFA choice number (1): ") or None
+        selected_challenge = self._input("Enter MFA choice number (1): ") or None
 
         if selected_challenge is not None and int(selected_challenge) <= len(challenges):
             selected_challenge = int(selected_challenge) - 1
@@ -0,0 +1,123 @@
+#!/usr/bin/env python
+
+import json
+import logging
+import socket
+import threading
+import time
+
+from six.moves import urllib_parse
+
+DEFAULT_PREFIX = 'aws_google_auth'
+
+
+class NullSink(object):
+    """Discards every metric. Used when no metrics destination is configured."""
+
+    def timing(self, name, milliseconds):
+        pass
+
+    def incr(self, name, value=1):
+        pass
+
+    def close(self):
+        pass
+
+
+class StatsdSink(NullSink):
+    """Send metrics to a StatsD daemon over UDP.
+
+    Sending is fire-and-forget: a missing or unreachable daemon never slows
+    down or breaks a login.
+    """
+
+    def __init__(self, host='127.0.0.1', port=8125, prefix=DEFAULT_PREFIX):
+        self.prefix = prefix
+        self.address = None
+        self.socket = None
+        try:
+            family, _, _, _, self.address = socket.getaddrinfo(host, port, 0, socket.SOCK_DGRAM)[0]
+            self.socket = socket.socket(family, socket.SOCK_DGRAM)
+        except (socket.error, IndexError) as ex:
+            logging.debug('%s: StatsD disabled, cannot resolve %s:%s: %s', __name__, host, port, ex)
+
+    def _send(self, name, value, metric_type):
+        if self.socket is None:
+            return
+        try:
+            line = '{}.{}:{}|{}'.format(self.prefix, name, value, metric_type)
+            self.socket.sendto(line.encode('utf-8'), self.address)
+        except socket.error as ex:
+            logging.debug('%s: failed to send %s to StatsD: %s', __name__, name, ex)
+
+    def timing(self, name, milliseconds):
+        self._send(name, int(round(milliseconds)), 'ms')
+
+    def incr(self, name, value=1):
+        self._send(name, value, 'c')
+
+    def close(self):
+        if self.socket is not None:
+            self.socket.close()
+            self.socket = None
+
+
+class FileSink(NullSink):
+    """Append metrics, one JSON object per line, to a local file."""
+
+    def __init__(self, path, prefix=DEFAULT_PREFIX):
+        self.path = path
+        self.prefix = prefix
+        self._lock = threading.Lock()
+        self._file = open(path, 'a')
+
+    def _write(self, name, value, metric_type):
+        with self._lock:
+            if self._file is None:
+                return
+            self._file.write(json.dumps({'time': time.time(),
+                                         'type': metric_type,
+                                         'name': '{}.{}'.format(self.prefix, name),
+                                         'value': value}) + '\n')
+            self._file.flush()
+
+    def timing(self, name, milliseconds):
+        self._write(name, round(milliseconds, 1), 'ms')
+
+    def incr(self, name, value=1):
+        self._write(name, value, 'c')
+
+    def close(self):
+        with self._lock:
+            if self._file is not None:
+                self._file.close()
+                self._file = None
+
+
+def sink_from_url(url):
+    """Build a sink from a destination URL.
+
+    statsd://host[:port][/prefix]  send to StatsD over UDP (port 8125 by default)
+    file:///path/to/metrics.log    append JSON lines to a local file
+    file://metrics.log             (relative to the current directory)
+
+    Metrics never stop a login: a destination that is not supported, or
+    cannot be opened, is logged and replaced with a NullSink.
+    """
+    if not url:
+        return NullSink()
+
+    parsed = urllib_parse.urlparse(url)
+    prefix = parsed.path.strip('/') or DEFAULT_PREFIX
+    try:
+        if parsed.scheme in ('statsd', 'udp'):
+            return StatsdSink(parsed.hostname or '127.0.0.1', parsed.port or 8125, prefix)
+        if parsed.scheme == 'file':
+            return FileSink(parsed.netloc + parsed.path)
+    except (IOError, OSError, ValueError) as ex:
+        logging.warning('%s: metrics disabled, cannot use %s: %s', __name__, url, ex)
+        return NullSink()
+
+    logging.warning("%s: metrics disabled, unsupported destination '%s' (expected statsd://host:port or file:///path)",
+                    __name__, url)
+    return NullSink()
@@ -0,0 +1,218 @@
+#!/usr/bin/env python
+from __future__ import print_function
+
+import fnmatch
+import json
+import logging
+import re
+from collections import namedtuple
+
+import filelock
+import six
+from tabulate import tabulate
+
+# How many roles are listed at a time, and how many recently used roles are
+# remembered.
+PAGE_SIZE = 20
+HISTORY_SIZE = 50
+
+Entry = namedtuple('Entry', ['role', 'principal', 'account', 'alias', 'name', 'text'])
+
+
+def is_pattern(role_arn):
+    """True if `role_arn` is a glob (``*``, ``?``, ``[``) or a ``/regex/`` rather than an ARN."""
+    if not isinstance(role_arn, six.string_types):
+        return False
+    return role_arn.startswith('/') or any(c in role_arn for c in '*?[')
+
+
+def compile_pattern(pattern):
+    """Return a function telling whether a role ARN matches the glob or ``/regex/`` `pattern`.
+
+    Raises re.error if the regular expression is invalid.
+    """
+    if len(pattern) > 1 and pattern.startswith('/') and pattern.endswith('/'):
+        return re.compile(pattern[1:-1]).search
+    return lambda role: fnmatch.fnmatchcase(role, pattern)
+
+
+def match_roles(roles, pattern):
+    matches = compile_pattern(pattern)
+    return {role: principal for role, principal in roles.items() if matches(role)}
+
+
+def fuzzy_score(query, text):
+    """Score `query` as a subsequence of `text`, or None if it does not match.
+
+    Substrings score highest, then characters matched in a row or at the
+    start of a word. Numbers (e.g. part of an account ID) only match as
+    substrings. Both strings are expected in lower case.
+    """
+    position = text.find(query)
+    if position >= 0:
+        at_word_start = position == 0 or not text[position - 1].isalnum()
+        return 4 * len(query) + (2 if at_word_start else 0)
+    if query.isdigit():
+        return None
+
+    score = 0
+    last = -2
+    i = 0
+    for char in query:
+        i = text.find(char, i)
+        if i < 0:
+            return None
+        if i == last + 1:
+            score += 3
+        elif i == 0 or not text[i - 1].isalnum():
+            score += 2
+        else:
+            score += 1
+        last = i
+        i += 1
+    return score
+
+
+class History(object):
+    """Most recently used roles, newest first, kept as a JSON list in `path`."""
+
+    def __init__(self, path, size=HISTORY_SIZE):
+        self.path = path
+        self.size = size
+
+    def load(self):
+        try:
+            with open(self.path) as f:
+                roles = json.load(f)
+        except (IOError, OSError, ValueError):
+            return []
+        return [role for role in roles if isinstance(role, six.string_types)]
+
+    def rank(self):
+        return {role: i for i, role in enumerate(self.load())}
+
+    def record(self, role):
+        # util imports this module
+        from aws_google_auth import util
+
+        try:
+            with filelock.FileLock(self.path + '.lock'):
+                roles = [role] + [r for r in self.load() if r != role]
+                with util.atomic_write(self.path) as f:
+                    json.dump(roles[:self.size], f)
+        except (IOError, OSError) as ex:
+            logging.debug('%s: could not save role history: %s', __name__, ex)
+
+
+class RoleIndex(object):
+    """Roles prepared once for repeated filtering.
+
+    Roles are ordered most recently used first (per `history`), then by
+    account (alias) and role name. `search()` matches every word of the
+    query against the account ID, alias and role name, and remembers its
+    results: a query that extends an earlier one only looks at that query's
+    matches.
+    """
+
+    def __init__(self, roles, aliases=None, history=None):
+        aliases = aliases or {}
+        rank = history.rank() if history else {}
+
+        entries = []
+        for role, principal in roles.items():
+            account = role.split(':')[4]
+            alias = aliases.get(account)
+            name = role.split(':role/', 1)[-1]
+            text = ' '.join(part for part in (account, alias, name) if part).lower()
+            entries.append(Entry(role, principal, account, alias, name, text))
+
+        entries.sort(key=lambda e: (rank.get(e.role, len(rank)), e.alias or e.account, e.name))
+        self.entries = entries
+        self.has_aliases = bool(aliases)
+        self._results = {(): entries}
+
+    def __len__(self):
+        return len(self.entries)
+
+    def search(self, query):
+        words = tuple(query.lower().split())
+        if words in self._results:
+            return self._results[words]
+
+        candidates = self.entries
+        for known in self._results:
+            if self._extends(words, known) and len(self._results[known]) < len(candidates):
+                candidates = self._results[known]
+
+        scored = []
+        for position, entry in enumerate(candidates):
+            scores = [fuzzy_score(word, entry.text) for word in words]
+            if None not in scores:
+                scored.append((-sum(scores), position, entry))
+        results = [entry for _, _, entry in sorted(scored)]
+
+        self._results[words] = results
+        return results
+
+    @staticmethod
+    def _extends(words, known):
+        """True if every match of `words` is also a match of `known`."""
+        if len(known) > len(words):
+            return False
+        if not known:
+            return True
+        return words[:len(known) - 1] == known[:-1] and words[len(known) - 1].startswith(known[-1])
+
+
+def pick(index, get_input, page_size=PAGE_SIZE):
+    """Let the user pick a role from `index`, returning (role, principal).
+
+    The user can type the number of a role, text to narrow the list down,
+    Enter or ``<`` to page through it, and ``/`` to clear the filter (or
+    ``/text`` to filter on digits, e.g. part of an account ID).
+    """
+    if not len(index):
+        raise ValueError("There are no roles to pick from.")
+
+    query = ''
+    page = 0
+    while True:
+        matches = index.search(query)
+        pages = (len(matches) + page_size - 1) // page_size
+        page %= pages
+        first = page * page_size
+        shown = matches[first:first + page_size]
+
+        if index.has_aliases:
+            print(tabulate([[first + i + 1, entry.alias or entry.account, entry.name] for i, entry in enumerate(shown)],
+                           headers=['No', 'AWS account', 'Role']))
+        else:
+            for i, entry in enumerate(shown):
+                print("[{:>3d}] {}".format(first + i + 1, entry.role))
+        if pages > 1 or query:
+            print("Roles {}-{} of {}{}. Enter/< for next/previous page, text to filter, / to clear.".format(
+                first + 1, first + len(shown), len(matches),
+                " matching '{}'".format(query) if query else ""))
+
+        prompt = 'Type the number (1 - {:d}) of the role to assume: '.format(len(matches))
+        choice = get_input(prompt).strip()
+
+        if not choice:
+            page += 1
+        elif choice == '<':
+            page -= 1
+        elif choice.isdigit():
+            if 1 <= int(choice) <= len(matches):
+                entry = matches[int(choice) - 1]
+                return entry.role, entry.principal
+            print("Invalid choice, try again.")
+        elif choice == '/':
+            query = ''
+            page = 0
+        else:
+            narrowed = (query + ' ' + choice.lstrip('/')).strip()
+            if index.search(narrowed):
+                query = narrowed
+                page = 0
+            else:
+                print("No roles match '{}'.".format(narrowed))
@@ -0,0 +1,151 @@
+#!/usr/bin/env python
+from __future__ import print_function
+
+import argparse
+import json
+import logging
+import os
+import time
+
+from six import print_ as print
+
+from aws_google_auth import status
+
+# The AWS CLI and SDKs run a profile's credential_process whenever they need
+# credentials, and do not keep its output between runs. So, as with eks-token,
+# credentials still in the cache are printed without importing boto, requests
+# or the login code; only a cache miss reads the profile and assumes the role,
+# with the profile's cached SAML assertion.
+
+# SDKs refresh credentials that expire within 15 minutes, so cached ones are
+# only handed out while they are valid for longer than that.
+MIN_REMAINING = 15 * 60
+
+
+def parse_args(args):
+    parser = argparse.ArgumentParser(
+        prog="aws-google-auth credential-process",
+        description="Print credentials for a role as credential_process output, using the cached SAML assertion of a profile",
+    )
+
+    parser.add_argument('-p', '--profile', help='AWS profile whose Google settings and SAML cache are used (defaults to value of $AWS_PROFILE, then falls back to \'sts\')')
+    parser.add_argument('-r', '--role-arn', help='The ARN of the role to assume (defaults to the role of the profile)')
+    parser.add_argument('-l', '--log', dest='log_level', choices=['debug',
+                        'info', 'warn'], default='warn', help='Select log level (default: %(default)s)')
+
+    return parser.parse_args(args)
+
+
+def cache_file():
+    """Where credentials are cached: next to the credentials file."""
+    return os.path.join(os.path.dirname(status.credentials_file()), 'credential_process_cache.json')
+
+
+class CredentialsCache(object):
+    """credential_process outputs kept in the JSON file `path`, by profile and role.
+
+    Reads take no lock: writes replace the file whole (readable by its owner
+    only). A missing or unreadable file is an empty cache.
+    """
+
+    def __init__(self, path, clock=time.time):
+        self.path = path
+        self.clock = clock
+
+    @staticmethod
+    def key(profile, role_arn=None):
+        return json.dumps([profile, role_arn])
+
+    def _read(self):
+        try:
+            with open(self.path) as f:
+                entries = json.load(f)
+        except (IOError, OSError, ValueError):
+            return {}
+        return entries if isinstance(entries, dict) else {}
+
+    def _fresh(self, entry, now):
+        try:
+            return bool(entry['credentials']) and float(entry['expiration']) - now > MIN_REMAINING
+        except (TypeError, KeyError, ValueError):
+            return False
+
+    def get(self, key):
+        """The cached output for `key`, or None if there is none valid for more than MIN_REMAINING seconds."""
+        entry = self._read().get(key)
+        return entry['credentials'] if self._fresh(entry, self.clock()) else None
+
+    def put(self, key, output, expiration):
+        """Cache `output`, valid until `expiration` (epoch seconds), dropping the entries that are no longer fresh."""
+        import filelock
+        from aws_google_auth import util
+
+        now = self.clock()
+        try:
+            with filelock.FileLock(self.path + '.lock'):
+                entries = dict((k, v) for k, v in self._read().items() if self._fresh(v, now))
+                entries[key] = {'credentials': output, 'expiration': expiration}
+                with util.atomic_write(self.path) as f:
+                    json.dump(entries, f)
+        except (IOError, OSError) as ex:
+            logging.warning('%s: could not cache the credentials in %s: %s', __name__, self.path, ex)
+
+
+def _keyring_login(config):
+    """Log in to Google without prompting, which needs the password in the
+    keyring.
+
+    The AWS CLI captures the process's output, so nobody would see a prompt.
+    """
+    from aws_google_auth import credentials
+    from aws_google_auth import errors
+
+    login_required = errors.LoginRequired(
+        "The SAML assertion of profile {} is missing or has expired. Run aws-google-auth -p {} to log "
+        "in again.".format(config.profile, config.profile))
+    if not config.keyring:
+        raise login_required
+
+    try:
+        credentials.interactive_login(config, interactive=False)
+    except errors.InputRequired as ex:
+        logging.info('%s: could not log in with the keyring: %s', __name__, ex)
+        raise login_required
+
+
+def new_credentials(profile, role_arn=None):
+    """Resolve credentials for `role_arn` with `profile`'s settings, as
+    (credential_process output, expiration in epoch seconds)."""
+    import calendar
+    from aws_google_auth import configuration
+    from aws_google_auth import execute
+    from aws_google_auth import util
+
+    config = configuration.Configuration()
+    config.profile = profile
+    config.read(profile)
+    profile_role_arn = config.role_arn
+    config.role_arn = util.Util.coalesce(role_arn, config.role_arn)
+
+    # The stored credentials are for the profile's role, not for --role-arn
+    creds = execute.resolve_credentials(config, MIN_REMAINING, reuse_stored=config.role_arn == profile_role_arn,
+                                        login=_keyring_login)
+    return creds.process_output, calendar.timegm(creds.expiration.utctimetuple())
+
+
+def main(cli_args):
+    args = parse_args(cli_args)
+    logging.getLogger().setLevel(getattr(logging, args.log_level.upper(), None))
+
+    # Configuration's default profile, without loading it
+    profile = args.profile or os.getenv('AWS_PROFILE') or 'sts'
+
+    cache = CredentialsCache(cache_file())
+    key = CredentialsCache.key(profile, args.role_arn)
+    output = cache.get(key)
+    if output is None:
+        logging.info('%s: no cached credentials for %s, assuming the role', __name__, args.role_arn or profile)
+        output, expiration = new_credentials(profile, args.role_arn)
+        cache.put(key, output, expiration)
+
+    print(json.dumps(output))
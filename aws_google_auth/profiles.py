@@ -0,0 +1,119 @@
+#!/usr/bin/env python
+from __future__ import print_function
+
+import argparse
+import json
+import logging
+import os
+import re
+
+import filelock
+
+from six import print_ as print
+
+from aws_google_auth import amazon
+from aws_google_auth import configuration
+from aws_google_auth import credentials
+from aws_google_auth import status
+from aws_google_auth import util
+
+# Characters AWS config profile names (and chained role names) cannot hold
+UNSAFE = re.compile(r'[\s\[\]=,]+')
+
+
+def parse_args(args):
+    parser = argparse.ArgumentParser(
+        prog="aws-google-auth generate-profiles",
+        description="Write an AWS config profile for every role in the SAML assertion, each getting its credentials "
+                    "from aws-google-auth credential-process when first used",
+    )
+
+    parser.add_argument('-p', '--profile', help='AWS profile whose Google settings and SAML cache are used (defaults to value of $AWS_PROFILE, then falls back to \'sts\')')
+    parser.add_argument('--prefix', help='Start of the generated profile names (default: the profile)')
+    parser.add_argument('--resolve-aliases', action='store_true', help='Name accounts missing from the alias file and role by looking up their alias, one AssumeRoleWithSAML per account')
+    parser.add_argument('--executable', default='aws-google-auth', help='The aws-google-auth command the profiles run (default: %(default)s)')
+    parser.add_argument('-q', '--quiet', action='store_true', help='Quiet output')
+    parser.add_argument('-l', '--log', dest='log_level', choices=['debug',
+                        'info', 'warn'], default='warn', help='Select log level (default: %(default)s)')
+
+    return parser.parse_args(args)
+
+
+def alias_cache_file():
+    """Where account aliases looked up with --resolve-aliases are kept: next
+    to the credentials file."""
+    return os.path.join(os.path.dirname(status.credentials_file()), 'account_aliases.json')
+
+
+def read_alias_cache(path):
+    """The account aliases cached in `path`, by account ID ({} if there are none)."""
+    try:
+        with open(path) as f:
+            aliases = json.load(f)
+    except (IOError, OSError, ValueError):
+        return {}
+    if not isinstance(aliases, dict):
+        return {}
+    return {str(account): str(name) for account, name in aliases.items()}
+
+
+def write_alias_cache(path, aliases):
+    """Add `aliases` to those cached in `path`."""
+    try:
+        with filelock.FileLock(path + '.lock'):
+            cached = read_alias_cache(path)
+            if all(cached.get(account) == name for account, name in aliases.items()):
+                return
+            cached.update(aliases)
+            with util.atomic_write(path) as f:
+                json.dump(cached, f, indent=2, sort_keys=True)
+    except (IOError, OSError) as ex:
+        logging.warning('%s: could not cache the account aliases in %s: %s', __name__, path, ex)
+
+
+def profile_names(roles, aliases, prefix):
+    """Map a profile name, <prefix>-<account alias or ID>-<role name>, to
+    every role ARN in `roles`."""
+    names = {}
+    for role_arn in sorted(roles):
+        account = role_arn.split(':')[4]
+        role_name = role_arn.split(':role/', 1)[-1].replace('/', '-')
+        name = UNSAFE.sub('-', '-'.join([prefix, aliases.get(account, account), role_name]))
+        if name in names:
+            # Two accounts with the same alias
+            name = UNSAFE.sub('-', '-'.join([prefix, account, role_name]))
+        names[name] = role_arn
+    return names
+
+
+def main(cli_args):
+    args = parse_args(cli_args)
+    logging.getLogger().setLevel(getattr(logging, args.log_level.upper(), None))
+
+    config = configuration.Configuration()
+    config.profile = util.Util.coalesce(args.profile, os.getenv('AWS_PROFILE'), config.profile)
+    config.read(config.profile)
+
+    # The profiles share this assertion, so a fresh one is kept
+    if config.saml_cache is None:
+        credentials.interactive_login(config)
+        config.write_saml_cache()
+
+    amazon_client = amazon.Amazon(config, config.saml_cache)
+    roles = amazon_client.roles
+    # Aliases looked up once keep naming the profiles of later runs, with or
+    # without --resolve-aliases
+    alias_cache = alias_cache_file()
+    aliases = amazon_client.resolve_aws_aliases(roles, per_account=args.resolve_aliases,
+                                                known=read_alias_cache(alias_cache))
+    write_alias_cache(alias_cache, aliases)
+
+    profiles = profile_names(roles, aliases, util.Util.coalesce(args.prefix, config.profile))
+    skipped = config.write_process_profiles(profiles, args.executable)
+
+    for name in sorted(profiles):
+        if name in skipped:
+            logging.warning('%s: profile %s already exists and was not generated from %s, left as it is',
+                            __name__, name, config.profile)
+        elif not args.quiet:
+            print("{} {}".format(name, profiles[name]))
@@ -0,0 +1,126 @@
+#!/usr/bin/env python
+
+import json
+import logging
+import os
+import time
+
+import filelock
+
+from aws_google_auth import status
+
+# Google answers password posts with a captcha when too many logins come from
+# one address at once. Logins are spread out with a token bucket shared by
+# every process using the same state file: up to DEFAULT_BURST logins go
+# through straight away, then one every DEFAULT_INTERVAL seconds.
+DEFAULT_BURST = 5
+DEFAULT_INTERVAL = 10
+
+BURST_VARIABLE = 'AWS_GOOGLE_AUTH_LOGIN_BURST'
+INTERVAL_VARIABLE = 'AWS_GOOGLE_AUTH_LOGIN_INTERVAL'
+FILE_VARIABLE = 'AWS_GOOGLE_AUTH_LOGIN_RATE_FILE'
+
+# Longest wait for another process to release the state file. Past it, the
+# login goes ahead unlimited rather than hang.
+LOCK_TIMEOUT = 10
+
+
+def default_path():
+    """The state file: next to the credentials file, unless $AWS_GOOGLE_AUTH_LOGIN_RATE_FILE is set."""
+    return os.getenv(FILE_VARIABLE) or os.path.join(os.path.dirname(status.credentials_file()), 'login_rate.json')
+
+
+def _setting(variable, parse, default, valid):
+    """$`variable` parsed with `parse`, or `default` (with a warning) if it
+    does not parse or is not `valid`."""
+    value = os.getenv(variable)
+    if value is None:
+        return default
+    try:
+        parsed = parse(value)
+    except ValueError:
+        parsed = None
+    if parsed is None or not valid(parsed):
+        logging.warning('%s: ignoring $%s=%r, using %s', __name__, variable, value, default)
+        return default
+    return parsed
+
+
+def login_limiter():
+    """The TokenBucket configured by the environment, or None if
+    $AWS_GOOGLE_AUTH_LOGIN_BURST is 0 (no limit). Values that are not numbers,
+    a negative burst and an interval that is not positive and finite are
+    ignored."""
+    burst = _setting(BURST_VARIABLE, int, DEFAULT_BURST, lambda burst: burst >= 0)
+    if burst == 0:
+        return None
+    interval = _setting(INTERVAL_VARIABLE, float, DEFAULT_INTERVAL, lambda interval: 0 < interval < float('inf'))
+    return TokenBucket(default_path(), burst=burst, interval=interval)
+
+
+class TokenBucket(object):
+    """A token bucket kept in the file `path`, shared by the processes using it.
+
+    The bucket holds up to `burst` tokens and gains one every `interval`
+    seconds; `acquire()` takes one, sleeping until there is one if need be.
+    The state is read and written under a lock file, so any number of
+    processes (or users, if the file is shared) draw from the same bucket.
+    A missing, unreadable or nonsensical state file counts as a full bucket.
+    """
+
+    def __init__(self, path, burst=DEFAULT_BURST, interval=DEFAULT_INTERVAL, clock=time.time, sleep=time.sleep):
+        self.path = path
+        self.burst = burst
+        self.interval = interval
+        self.clock = clock
+        self.sleep = sleep
+
+    def acquire(self):
+        """Take a token, waiting for one if there is none. Returns the time waited, in seconds."""
+        waited = 0.0
+        while True:
+            wait = self._take()
+            if wait <= 0:
+                return waited
+            logging.info('%s: waiting %.1fs before logging in to Google', __name__, wait)
+            self.sleep(wait)
+            waited += wait
+
+    def _take(self):
+        """Take a token and return 0, or return how long until there is one."""
+        lock = filelock.FileLock(self.path + '.lock')
+        try:
+            lock.acquire(timeout=LOCK_TIMEOUT)
+        except (filelock.Timeout, IOError, OSError) as ex:
+            logging.warning('%s: could not lock %s, not limiting this login: %s', __name__, self.path, ex)
+            return 0
+        try:
+            now = self.clock()
+            tokens, updated = self._read(now)
+            tokens = min(self.burst, tokens + (now - updated) / self.interval)
+            if tokens >= 1:
+                tokens -= 1
+                wait = 0
+            else:
+                wait = (1 - tokens) * self.interval
+            self._write(tokens, now)
+            return wait
+        finally:
+            lock.release()
+
+    def _read(self, now):
+        try:
+            with open(self.path) as f:
+                state = json.load(f)
+            tokens = min(max(float(state['tokens']), 0.0), self.burst)
+            updated = min(float(state['updated']), now)
+        except (IOError, OSError, ValueError, KeyError, TypeError):
+            return self.burst, now
+        return tokens, updated
+
+    def _write(self, tokens, now):
+        try:
+            with open(self.path, 'w') as f:
+                json.dump({'tokens': tokens, 'updated': now}, f)
+        except (IOError, OSError) as ex:
+            logging.debug('%s: could not write %s: %s', __name__, self.path, ex)
@@ -0,0 +1,194 @@
+#!/usr/bin/env python
+
+import gzip
+import io
+import json
+import logging
+import os
+import threading
+from collections import namedtuple
+
+from six.moves import urllib_parse
+from six.moves.BaseHTTPServer import BaseHTTPRequestHandler, HTTPServer
+
+# The hosts a recorded flow talks to. Absolute links to these hosts inside the
+# recorded pages are rewritten to point at the stub when they are served.
+RECORDED_HOSTS = ['https://accounts.google.com', 'https://content.googleapis.com']
+
+# Name of the file, within a flow directory, that lists every exchange in
+# order.
+FLOW_INDEX = "flow.jsonl"
+
+
+class Exchange(namedtuple('Exchange', ['method', 'path', 'status', 'response_path', 'body'])):
+    """A single recorded request/response pair.
+
+    path: the path the request was sent to (query string excluded)
+    response_path: the path (and query string) the response was served from,
+                   after following any redirects
+    """
+
+
+def _path(url, keep_query=False):
+    parsed = urllib_parse.urlparse(url)
+    if keep_query and parsed.query:
+        return parsed.path + '?' + parsed.query
+    return parsed.path
+
+
+def _load_capture(capture_file):
+    exchanges = []
+    with gzip.open(capture_file, 'rt', encoding='utf-8') as capture:
+        for line in capture:
+            if not line.strip():
+                continue
+            record = json.loads(line)
+            if record['type'] != 'response':
+                continue
+            exchanges.append(Exchange(method=record['method'],
+                                      path=_path(record['url']),
+                                      status=record['status'],
+                                      response_path=_path(record['response_url'], keep_query=True),
+                                      body=record['body']))
+    return exchanges
+
+
+def _load_directory(flow_dir):
+    exchanges = []
+    with io.open(os.path.join(flow_dir, FLOW_INDEX), encoding='utf-8') as index:
+        for line in index:
+            if not line.strip():
+                continue
+            entry = json.loads(line)
+            with io.open(os.path.join(flow_dir, entry['response']), encoding='utf-8') as fp:
+                body = fp.read()
+            exchanges.append(Exchange(method=entry['method'],
+                                      path=_path(entry['url']),
+                                      status=entry['status'],
+                                      response_path=_path(entry['response_url'], keep_query=True),
+                                      body=body))
+    return exchanges
+
+
+def load_flow(path):
+    """Load a flow, in the order it was recorded.
+
+    `path` is either a capture written by --save-saml-flow (*.ndjson.gz) or a
+    directory holding one response file per exchange, indexed by flow.jsonl.
+    """
+    if os.path.isdir(path):
+        return _load_directory(path)
+    return _load_capture(path)
+
+
+class StubIdP(object):
+    """Serve a recorded flow over HTTP on the loopback interface.
+
+    Requests must arrive in the recorded order, with the recorded method and
+    path; anything else is answered with a 404 and remembered in
+    `mismatches`, so a changed parser shows up as a failed login rather than
+    a hang. Responses that were reached through a redirect are replayed
+    through a redirect as well, so `response.url` matches the recording.
+
+    Point `Google(base_url=..., api_url=...)` at `base_url` to use it.
+    """
+
+    def __init__(self, exchanges, host='127.0.0.1', port=0):
+        self.exchanges = list(exchanges)
+        self.mismatches = []
+        self._position = 0
+        self._pending = None
+        self._lock = threading.Lock()
+        self._server = HTTPServer((host, port), self._handler_class())
+        self._thread = None
+
+    @property
+    def base_url(self):
+        host, port = self._server.server_address[:2]
+        return 'http://{}:{}'.format(host, port)
+
+    @property
+    def finished(self):
+        return self._position == len(self.exchanges) and self._pending is None
+
+    def start(self):
+        self._thread = threading.Thread(target=self._server.serve_forever, kwargs={'poll_interval': 0.05})
+        self._thread.daemon = True
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
+        self._thread.join()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc_info):
+        self.stop()
+
+    def reset(self):
+        with self._lock:
+            self._position = 0
+            self._pending = None
+            self.mismatches = []
+
+    def _rewrite(self, body):
+        for host in RECORDED_HOSTS:
+            body = body.replace(host, self.base_url)
+        return body
+
+    def respond(self, method, path):
+        """Return (status, headers, body) for the next request in the flow."""
+        with self._lock:
+            if self._pending is not None:
+                exchange, self._pending = self._pending, None
+                if _path(exchange.response_path) == path:
+                    return exchange.status, {}, self._rewrite(exchange.body)
+                self.mismatches.append(
+                    "expected redirect to {}, got {} {}".format(exchange.response_path, method, path))
+                return 404, {}, self.mismatches[-1]
+
+            if self._position >= len(self.exchanges):
+                self.mismatches.append("unexpected {} {} after end of flow".format(method, path))
+                return 404, {}, self.mismatches[-1]
+
+            exchange = self.exchanges[self._position]
+            if exchange.method != method or exchange.path != path:
+                self.mismatches.append("expected {} {}, got {} {}".format(
+                    exchange.method, exchange.path, method, path))
+                return 404, {}, self.mismatches[-1]
+            self._position += 1
+
+            if _path(exchange.response_path) != exchange.path:
+                self._pending = exchange
+                return 302, {'Location': self.base_url + exchange.response_path}, ''
+            return exchange.status, {}, self._rewrite(exchange.body)
+
+    def _handler_class(self):
+        stub = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def _replay(self):
+                length = int(self.headers.get('Content-Length') or 0)
+                if length:
+                    self.rfile.read(length)
+
+                status, headers, body = stub.respond(self.command, _path(self.path))
+                payload = body.encode('utf-8')
+                self.send_response(status)
+                self.send_header('Content-Type', 'text/html; charset=utf-8')
+                self.send_header('Content-Length', str(len(payload)))
+                for name, value in headers.items():
+                    self.send_header(name, value)
+                self.end_headers()
+                self.wfile.write(payload)
+
+            do_GET = _replay
+            do_POST = _replay
+
+            def log_message(self, format, *args):
+                logging.debug('%s: %s', __name__, format % args)
+
+        return Handler
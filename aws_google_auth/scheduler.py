@@ -0,0 +1,207 @@
+#!/usr/bin/env python
+from __future__ import print_function
+
+import argparse
+import logging
+import random
+import time
+from datetime import datetime
+
+from botocore.exceptions import ClientError
+from six import print_ as print
+
+try:
+    from backports import configparser
+except ImportError:
+    import configparser
+
+from aws_google_auth import amazon
+from aws_google_auth import configuration
+from aws_google_auth import credentials
+from aws_google_auth import status
+
+# Credentials are never scheduled for refresh later than this many seconds
+# before they expire, whatever the fraction and jitter.
+MINIMUM_MARGIN = 60
+
+# How long to wait before retrying a profile whose refresh failed, and the
+# longest the scheduler sleeps before looking at the files on disk again.
+RETRY_INTERVAL = 300
+POLL_INTERVAL = 60
+
+
+def parse_args(args):
+    parser = argparse.ArgumentParser(
+        prog="aws-google-auth scheduler",
+        description="Keep the credentials of every aws-google-auth profile fresh",
+    )
+
+    parser.add_argument('profiles', nargs='*', metavar='PROFILE', help='Profiles to refresh (default: every profile with google_config entries)')
+    parser.add_argument('--fraction', type=float, default=0.5, help='Refresh credentials once this fraction of their lifetime has passed (default: %(default)s)')
+    parser.add_argument('--jitter', type=int, default=300, help='Spread refreshes randomly by up to this many seconds either way (default: %(default)s)')
+    parser.add_argument('--once', action='store_true', help='Refresh the profiles that are due, then exit (for cron)')
+    parser.add_argument('-q', '--quiet', action='store_true', help='Quiet output')
+    parser.add_argument('-l', '--log', dest='log_level', choices=['debug',
+                        'info', 'warn'], default='warn', help='Select log level (default: %(default)s)')
+
+    args = parser.parse_args(args)
+    if not 0 < args.fraction < 1:
+        parser.error('--fraction must be between 0 and 1')
+    return args
+
+
+def managed_profiles(config_file):
+    """Names of the profiles in `config_file` that have google_config.* entries."""
+    config_parser = configparser.RawConfigParser()
+    config_parser.read(config_file)
+
+    profiles = []
+    for section in config_parser.sections():
+        if not any(option.startswith('google_config.') for option in config_parser.options(section)):
+            continue
+        if section.lower() == 'default':
+            profiles.append(section)
+        elif section.startswith('profile '):
+            profiles.append(section[len('profile '):])
+    return profiles
+
+
+class Scheduler(object):
+    """Refresh profiles' credentials well before they expire.
+
+    Each profile is refreshed once `fraction` of its lifetime has passed,
+    moved by a random offset of up to `jitter` seconds
+    so that many machines started together do not all hit Google and STS at
+    the same moment. Profiles due together share one SAML assertion per IdP,
+    so `login(config)` is only called when no valid assertion is cached.
+    """
+
+    def __init__(self, profiles=None, fraction=0.5, jitter=300, login=credentials.interactive_login,
+                 sts_client=None, quiet=False, clock=time.time, sleep=time.sleep, rand=random.uniform):
+        self.profiles = profiles
+        self.fraction = fraction
+        self.jitter = jitter
+        self.login = login
+        self.sts_client = sts_client
+        self.quiet = quiet
+        self.clock = clock
+        self.sleep = sleep
+        self.rand = rand
+
+        # profile -> (expiration the refresh time was computed for, refresh time)
+        self.schedule = {}
+        # profile -> (expiration of the credentials written, time they were requested)
+        self.refreshed = {}
+
+    def refresh_at(self, expiration, duration, issued=None):
+        """Epoch time at which credentials expiring at `expiration` should be
+        refreshed.
+
+        They last at most `duration` seconds (the configured duration), less
+        if the role's maximum is lower, so their lifetime is only known
+        from `issued`, a time they were issued no later than.
+        """
+        expires = (expiration - datetime(1970, 1, 1, tzinfo=expiration.tzinfo)).total_seconds()
+        start = expires - duration
+        if issued is not None:
+            start = max(start, min(issued, expires))
+        at = start + (expires - start) * self.fraction + self.rand(-self.jitter, self.jitter)
+        return max(start, min(at, expires - MINIMUM_MARGIN))
+
+    def update(self):
+        """Re-read the files on disk and work out when each profile is due.
+
+        Refresh times are only recomputed when a profile's expiration has
+        changed, so the jitter drawn for it stays put and failed refreshes
+        keep their retry time. Credentials this scheduler did not write were
+        issued no later than when it first sees them.
+        """
+        config = configuration.Configuration()
+        profiles = self.profiles or managed_profiles(config.config_file)
+        expirations = status.read_expirations(config.credentials_file)
+
+        schedule = {}
+        for profile in profiles:
+            expiration = expirations.get(profile)
+            if profile in self.schedule and self.schedule[profile][0] == expiration:
+                schedule[profile] = self.schedule[profile]
+            elif expiration is None:
+                schedule[profile] = (None, self.clock())
+            else:
+                profile_config = configuration.Configuration()
+                profile_config.read(profile)
+                refreshed_expiration, issued = self.refreshed.get(profile, (None, None))
+                if refreshed_expiration != expiration:
+                    issued = self.clock()
+                schedule[profile] = (expiration, self.refresh_at(expiration, profile_config.duration, issued))
+        self.schedule = schedule
+
+    def due(self):
+        now = self.clock()
+        return sorted(profile for profile, (_, at) in self.schedule.items() if at <= now)
+
+    def refresh(self, profiles):
+        """Assume the role of every profile in `profiles` and write its credentials."""
+        assertions = {}
+        for profile in profiles:
+            try:
+                config = configuration.Configuration()
+                config.read(profile)
+                if assertions.get(config.idp_id) is not None:
+                    config.saml_cache = assertions[config.idp_id]
+                if config.saml_cache is None:
+                    logging.info('%s: SAML assertion for %s expired, logging in to Google', __name__, profile)
+                    self.login(config)
+                assertions[config.idp_id] = config.saml_cache
+
+                requested = self.clock()
+                creds = self._get_credentials(config)
+                config.write(creds)
+                self.refreshed[profile] = (creds.expiration.replace(microsecond=0), requested)
+            except Exception as ex:
+                logging.error('%s: could not refresh profile %s: %s', __name__, profile, ex)
+                expiration = self.schedule.get(profile, (None, None))[0]
+                self.schedule[profile] = (expiration, self.clock() + RETRY_INTERVAL + self.rand(0, self.jitter))
+                continue
+
+            if not self.quiet:
+                print("Refreshed {} ({}), expires {}".format(profile, config.role_arn, creds.expiration.isoformat()))
+
+    def _get_credentials(self, config):
+        """credentials.get_credentials(config), asking again for as long as
+        the role allows if that is less than the configured duration. The
+        configured duration is left as it is."""
+        try:
+            return credentials.get_credentials(config, sts_client=self.sts_client)
+        except ClientError as err:
+            maximum = amazon.max_duration_from_error(err)
+            if maximum is None or maximum >= config.duration:
+                raise
+            logging.info('%s: role %s allows at most %ds', __name__, config.role_arn, maximum)
+
+        duration, config.duration = config.duration, maximum
+        try:
+            return credentials.get_credentials(config, sts_client=self.sts_client)
+        finally:
+            config.duration = duration
+
+    def run(self, once=False):
+        while True:
+            self.update()
+            due = self.due()
+            if due:
+                self.refresh(due)
+            if once:
+                return
+
+            self.update()
+            now = self.clock()
+            next_at = min([at for _, at in self.schedule.values()] or [now + POLL_INTERVAL])
+            self.sleep(min(max(next_at - now, 1), POLL_INTERVAL))
+
+
+def main(cli_args):
+    args = parse_args(cli_args)
+    logging.getLogger().setLevel(getattr(logging, args.log_level.upper(), None))
+
+    Scheduler(profiles=args.profiles, fraction=args.fraction, jitter=args.jitter, quiet=args.quiet).run(once=args.once)
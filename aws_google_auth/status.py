@@ -0,0 +1,107 @@
+#!/usr/bin/env python
+from __future__ import print_function
+
+import argparse
+import calendar
+import json
+import logging
+import os
+import sys
+import time
+from datetime import datetime
+
+from six import print_ as print
+
+try:
+    from backports import configparser
+except ImportError:
+    import configparser
+
+# This module is imported on every start, and `status` is meant to be run
+# from shell prompts: it must not import boto, requests or the login code.
+# Hence the format below repeats credentials.EXPIRATION_FORMAT, and the
+# credentials file is located the way botocore does it.
+EXPIRATION_FORMAT = '%Y-%m-%dT%H:%M:%S%z'
+
+
+def parse_args(args):
+    parser = argparse.ArgumentParser(
+        prog="aws-google-auth status",
+        description="Show when the credentials of each profile expire",
+        epilog="Exits with status 1 if any profile shown has expired, or a profile asked for has no credentials.",
+    )
+
+    parser.add_argument('profiles', nargs='*', metavar='PROFILE', help='Profiles to show (default: every profile with an expiration)')
+    parser.add_argument('--json', action='store_true', help='Print a JSON list instead of a table')
+    parser.add_argument('-l', '--log', dest='log_level', choices=['debug',
+                        'info', 'warn'], default='warn', help='Select log level (default: %(default)s)')
+
+    return parser.parse_args(args)
+
+
+def credentials_file():
+    return os.path.expanduser(os.environ.get('AWS_SHARED_CREDENTIALS_FILE', os.path.join('~', '.aws', 'credentials')))
+
+
+def read_expirations(credentials_file):
+    """Map each profile of `credentials_file` to its aws_session_expiration."""
+    credentials_parser = configparser.RawConfigParser()
+    credentials_parser.read(credentials_file)
+
+    expirations = {}
+    for profile in credentials_parser.sections():
+        value = credentials_parser.get(profile, 'aws_session_expiration', fallback=None)
+        try:
+            expirations[profile] = datetime.strptime(value, EXPIRATION_FORMAT)
+        except (TypeError, ValueError):
+            logging.debug('%s: no usable expiration for profile %s: %r', __name__, profile, value)
+    return expirations
+
+
+def format_remaining(seconds):
+    if seconds <= 0:
+        return 'expired'
+    minutes = int(seconds) // 60
+    if minutes < 60:
+        return '{:d}m'.format(minutes)
+    return '{:d}h{:02d}m'.format(minutes // 60, minutes % 60)
+
+
+def status(expirations, profiles=None, now=None):
+    """One dict per profile: its expiration, remaining seconds and whether it expired.
+
+    Profiles asked for but without credentials are included with an
+    expiration of None.
+    """
+    now = time.time() if now is None else now
+    entries = []
+    for profile in profiles or sorted(expirations):
+        expiration = expirations.get(profile)
+        if expiration is None:
+            entries.append({'profile': profile, 'expiration': None, 'remaining': None, 'expired': True})
+            continue
+        remaining = int(calendar.timegm(expiration.utctimetuple()) - now)
+        entries.append({'profile': profile,
+                        'expiration': expiration.strftime(EXPIRATION_FORMAT),
+                        'remaining': max(remaining, 0),
+                        'expired': remaining <= 0})
+    return entries
+
+
+def main(cli_args):
+    args = parse_args(cli_args)
+    logging.getLogger().setLevel(getattr(logging, args.log_level.upper(), None))
+
+    entries = status(read_expirations(credentials_file()), args.profiles)
+
+    if args.json:
+        print(json.dumps(entries))
+    elif entries:
+        width = max(len(entry['profile']) for entry in entries)
+        for entry in entries:
+            print('{:<{}}  {:<24}  {}'.format(
+                entry['profile'], width, entry['expiration'] or '-',
+                format_remaining(entry['remaining']) if entry['expiration'] else 'no credentials'))
+
+    if any(entry['expired'] for entry in entries):
+        sys.exit(1)
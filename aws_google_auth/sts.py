@@ -0,0 +1,192 @@
+#!/usr/bin/env python
+
+import logging
+import os
+from datetime import datetime
+
+import requests
+from botocore.exceptions import ClientError
+from dateutil.tz import tzutc
+from lxml import etree
+from six.moves.urllib.parse import urlencode
+
+API_VERSION = '2011-06-15'
+NAMESPACE = 'https://sts.amazonaws.com/doc/{}/'.format(API_VERSION)
+GLOBAL_ENDPOINT = 'https://sts.amazonaws.com'
+
+# AssumeRoleWithSAML is authenticated by the assertion alone, so it needs no
+# request signing; a timeout keeps a stalled connection from hanging a login.
+TIMEOUT = 30
+
+# Connections kept open to the endpoint, enough for a service assuming roles
+# from many threads at once (requests keeps 10 by default).
+POOL_SIZE = 32
+
+
+def endpoint_for_region(region):
+    """The STS endpoint of `region`, or the global one when there is none."""
+    endpoint = os.environ.get('AWS_ENDPOINT_URL_STS') or os.environ.get('AWS_ENDPOINT_URL')
+    if endpoint:
+        return endpoint
+    if not region:
+        return GLOBAL_ENDPOINT
+    if region.startswith('cn-'):
+        return 'https://sts.{}.amazonaws.com.cn'.format(region)
+    return 'https://sts.{}.amazonaws.com'.format(region)
+
+
+def parse_timestamp(text):
+    """Parse an ISO 8601 timestamp as returned by STS (always in UTC)."""
+    return datetime.strptime(text.strip()[:19], '%Y-%m-%dT%H:%M:%S').replace(tzinfo=tzutc())
+
+
+def botocore_credentials(credentials):
+    """`credentials`, as in an AssumeRole* result, for botocore's signers."""
+    from botocore.credentials import Credentials as BotocoreCredentials
+
+    return BotocoreCredentials(credentials['AccessKeyId'], credentials['SecretAccessKey'], credentials.get('SessionToken'))
+
+
+class STSClient(object):
+    """A minimal STS client for AssumeRoleWithSAML, built on requests.
+
+    Creating a boto3 STS client loads botocore's service models, which takes
+    longer and uses more memory than the whole login; this client posts the
+    query API request itself and parses the XML answer. It is a drop-in for
+    the one boto3 method aws-google-auth calls without credentials: the
+    response has the same shape, and errors are raised as botocore
+    ClientErrors, so callers can keep inspecting ``err.response['Error']``.
+
+    AssumeRole, used to chain roles, is signed here with botocore's SigV4
+    signer, so it shares the connections too. Other calls that must be signed
+    (alias resolution, Organizations) still use boto3.
+
+    One client can be shared by many threads.
+    """
+
+    def __init__(self, region=None, session=None, endpoint=None, timeout=TIMEOUT):
+        self.endpoint = endpoint or endpoint_for_region(region)
+        # Signed requests must name the endpoint's region; the global
+        # endpoint is in us-east-1.
+        self.region = region or 'us-east-1'
+        if session is None:
+            session = requests.Session()
+            adapter = requests.adapters.HTTPAdapter(pool_maxsize=POOL_SIZE)
+            session.mount('https://', adapter)
+            session.mount('http://', adapter)
+        self.session = session
+        self.timeout = timeout
+        self.verify = os.environ.get('AWS_CA_BUNDLE') or True
+
+    def warm_up(self):
+        """Open a connection to the endpoint (DNS, TCP and TLS) ahead of the
+        first call, which then reuses it from the session's pool."""
+        try:
+            self.session.head(self.endpoint, timeout=self.timeout, verify=self.verify, allow_redirects=False)
+        except requests.exceptions.RequestException as ex:
+            logging.debug('%s: could not warm up %s: %s', __name__, self.endpoint, ex)
+
+    def assume_role_with_saml(self, RoleArn, PrincipalArn, SAMLAssertion, DurationSeconds=None):
+        params = {'Action': 'AssumeRoleWithSAML',
+                  'Version': API_VERSION,
+                  'RoleArn': RoleArn,
+                  'PrincipalArn': PrincipalArn,
+                  'SAMLAssertion': SAMLAssertion}
+        if DurationSeconds is not None:
+            params['DurationSeconds'] = str(DurationSeconds)
+
+        response = self.session.post(self.endpoint, data=params, timeout=self.timeout, verify=self.verify)
+        doc, result = self._result(response, 'AssumeRoleWithSAML')
+        return dict(self._assumed_role(doc, result, response), **{
+            'Subject': self._text(result, 'Subject'),
+            'SubjectType': self._text(result, 'SubjectType'),
+            'Issuer': self._text(result, 'Issuer'),
+            'Audience': self._text(result, 'Audience'),
+            'NameQualifier': self._text(result, 'NameQualifier'),
+        })
+
+    def assume_role(self, RoleArn, RoleSessionName, Credentials, DurationSeconds=None):
+        """sts:AssumeRole, signed with `Credentials` (a dict with AccessKeyId,
+        SecretAccessKey and SessionToken, as in the result of another call).
+
+        Returns the same dict as boto3's assume_role.
+        """
+        # Only chained roles need the signer: AssumeRoleWithSAML runs without
+        # importing it.
+        from botocore.auth import SigV4Auth
+        from botocore.awsrequest import AWSRequest
+
+        params = {'Action': 'AssumeRole',
+                  'Version': API_VERSION,
+                  'RoleArn': RoleArn,
+                  'RoleSessionName': RoleSessionName}
+        if DurationSeconds is not None:
+            params['DurationSeconds'] = str(DurationSeconds)
+
+        request = AWSRequest(method='POST', url=self.endpoint, data=urlencode(sorted(params.items())),
+                             headers={'Content-Type': 'application/x-www-form-urlencoded; charset=utf-8'})
+        signer = SigV4Auth(botocore_credentials(Credentials), 'sts', self.region)
+        signer.add_auth(request)
+
+        response = self.session.post(self.endpoint, data=request.body, headers=dict(request.headers.items()),
+                                     timeout=self.timeout, verify=self.verify)
+        doc, result = self._result(response, 'AssumeRole')
+        return self._assumed_role(doc, result, response)
+
+    @classmethod
+    def _result(cls, response, operation):
+        """The parsed response and its <operation>Result element, or raise the ClientError in it."""
+        try:
+            doc = etree.fromstring(response.content)
+        except etree.XMLSyntaxError:
+            doc = None
+        if response.status_code != 200 or doc is None:
+            raise ClientError(cls._error(response, doc), operation)
+        return doc, doc.find(cls._tag(operation + 'Result'))
+
+    @classmethod
+    def _assumed_role(cls, doc, result, response):
+        """The Credentials, AssumedRoleUser and ResponseMetadata of an AssumeRole* result."""
+        credentials = result.find(cls._tag('Credentials'))
+        assumed_role_user = result.find(cls._tag('AssumedRoleUser'))
+        return {
+            'Credentials': {
+                'AccessKeyId': cls._text(credentials, 'AccessKeyId'),
+                'SecretAccessKey': cls._text(credentials, 'SecretAccessKey'),
+                'SessionToken': cls._text(credentials, 'SessionToken'),
+                'Expiration': parse_timestamp(cls._text(credentials, 'Expiration')),
+            },
+            'AssumedRoleUser': {
+                'AssumedRoleId': cls._text(assumed_role_user, 'AssumedRoleId'),
+                'Arn': cls._text(assumed_role_user, 'Arn'),
+            },
+            'ResponseMetadata': {
+                'RequestId': cls._text(doc.find(cls._tag('ResponseMetadata')), 'RequestId'),
+                'HTTPStatusCode': response.status_code,
+            },
+        }
+
+    @classmethod
+    def _error(cls, response, doc):
+        """The botocore-style error response for a failed call."""
+        error = {'Code': str(response.status_code), 'Message': response.reason or ''}
+        request_id = None
+        if doc is not None:
+            element = doc.find(cls._tag('Error'))
+            if element is not None:
+                error = {'Type': cls._text(element, 'Type'),
+                         'Code': cls._text(element, 'Code'),
+                         'Message': cls._text(element, 'Message')}
+            request_id = cls._text(doc, 'RequestId')
+        return {'Error': error,
+                'ResponseMetadata': {'RequestId': request_id, 'HTTPStatusCode': response.status_code}}
+
+    @staticmethod
+    def _tag(name):
+        return '{{{}}}{}'.format(NAMESPACE, name)
+
+    @classmethod
+    def _text(cls, element, name):
+        if element is None:
+            return None
+        return element.findtext(cls._tag(name))
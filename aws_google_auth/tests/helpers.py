@@ -0,0 +1,77 @@
+#!/usr/bin/env python
+
+import os
+import shutil
+import tempfile
+import unittest
+
+from mock import patch
+
+from aws_google_auth import credentials
+
+# A profile aws-google-auth can log in with
+CONFIG = """
+[profile dev]
+region = eu-west-1
+google_config.google_idp_id = idp
+google_config.google_sp_id = sp
+google_config.google_username = user@example.com
+google_config.duration = 3600
+google_config.role_arn = arn:aws:iam::123456789012:role/admin
+"""
+
+ADMIN = 'arn:aws:iam::123456789012:role/admin'
+
+
+class ProfileTestCase(unittest.TestCase):
+    """Tests run against AWS config and credentials files of their own.
+
+    setUp writes CONFIG to self.config_file in a temporary directory, removed
+    when the test ends, and points $AWS_CONFIG_FILE and
+    $AWS_SHARED_CREDENTIALS_FILE (and $AWS_PROFILE, unless PROFILE is None)
+    at them.
+    """
+
+    CONFIG = CONFIG
+    PROFILE = 'dev'
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.directory)
+        self.config_file = os.path.join(self.directory, 'config')
+        self.credentials_file = os.path.join(self.directory, 'credentials')
+        with open(self.config_file, 'w') as f:
+            f.write(self.CONFIG)
+
+        environ = {'AWS_CONFIG_FILE': self.config_file,
+                   'AWS_SHARED_CREDENTIALS_FILE': self.credentials_file}
+        if self.PROFILE is not None:
+            environ['AWS_PROFILE'] = self.PROFILE
+        self.start(patch.dict(os.environ, environ))
+
+    def start(self, patcher):
+        """Start `patcher` for the rest of the test, and return its mock."""
+        mock = patcher.start()
+        self.addCleanup(patcher.stop)
+        return mock
+
+    def patch_get_credentials(self, creds):
+        """Have credentials.get_credentials return `creds` (kept as
+        self.get_credentials) rather than call STS."""
+        self.get_credentials = self.start(patch('aws_google_auth.credentials.get_credentials', spec=True,
+                                                return_value=creds))
+
+    def patch_saml_cache(self):
+        """A valid SAML assertion, so that no Google login is attempted."""
+        self.start(patch('aws_google_auth.configuration.Configuration.saml_cache', new=b'<xml/>'))
+
+    def printed(self, module, args):
+        """Run `module`.main(`args`), and return what it printed."""
+        with patch('{}.print'.format(module.__name__), create=True) as mock_print:
+            module.main(list(args))
+        return [c[0][0] for c in mock_print.call_args_list]
+
+
+def fresh_credentials(expiration, role_arn=ADMIN):
+    return credentials.Credentials(access_key_id='ASIAFRESH', secret_access_key='secret', session_token='token',
+                                   expiration=expiration, role_arn=role_arn)
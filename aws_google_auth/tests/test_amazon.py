@@ -1,10 +1,18 @@
 #!/usr/bin/env python
 
+import json
+import shutil
+import tempfile
+import threading
+import time
 import unittest
 import mock
+from botocore.exceptions import ClientError
 
 from aws_google_auth import amazon
+from aws_google_auth import errors
 from aws_google_auth import configuration
+from aws_google_auth import sts
 from os import path
 import os
 
@@ -26,7 +34,8 @@ class TestAmazon(unittest.TestCase):
 
     def test_sts_client(self):
         a = amazon.Amazon(self.valid_config, "dummy-encoded-saml")
-        self.assertEqual(str(a.sts_client.__class__), "<class 'botocore.client.STS'>")
+        self.assertIsInstance(a.sts_client, sts.STSClient)
+        self.assertEqual('https://sts.amazonaws.com', a.sts_client.endpoint)
 
     def test_role_extraction(self):
         saml_xml = self.read_local_file('valid-response.xml')
@@ -80,3 +89,142 @@ class TestAmazon(unittest.TestCase):
 
         self.assertEqual('xxx-xxxx', os.environ['AWS_PROFILE'])
         self.assertEqual('blart', os.environ['DEFAULT_AWS_PROFILE'])
+
+    @mock.patch('boto3.session.Session', spec=True)
+    def test_resolve_aws_aliases_once_per_account(self, mock_session):
+        client = mock_session.return_value.client.return_value
+        client.assume_role_with_saml.return_value = {
+            'Credentials': {'AccessKeyId': 'ASIA', 'SecretAccessKey': 'secret', 'SessionToken': 'token'}}
+        client.list_account_aliases.side_effect = [{'AccountAliases': ['first']}, {'AccountAliases': ['second']}]
+        principal = 'arn:aws:iam::{}:saml-provider/GoogleApps'
+        roles = {'arn:aws:iam::111111111111:role/admin': principal.format('111111111111'),
+                 'arn:aws:iam::111111111111:role/read-only': principal.format('111111111111'),
+                 'arn:aws:iam::222222222222:role/admin': principal.format('222222222222')}
+
+        aliases = amazon.Amazon(self.valid_config, b"<xml/>", sts_client=client).resolve_aws_aliases(roles)
+
+        self.assertEqual(['111111111111', '222222222222'], sorted(aliases))
+        self.assertEqual(['first', 'second'], sorted(aliases.values()))
+        self.assertEqual(2, client.assume_role_with_saml.call_count)
+
+        # Accounts without an alias are shown by ID, with no further call
+        client.list_account_aliases.side_effect = Exception('AccessDenied')
+        aliases = amazon.Amazon(self.valid_config, b"<xml/>", sts_client=client).resolve_aws_aliases(roles)
+        self.assertEqual({'111111111111': '111111111111', '222222222222': '222222222222'}, aliases)
+        self.assertFalse(client.get_caller_identity.called)
+
+    @mock.patch('boto3.session.Session', spec=True)
+    def test_resolve_aws_aliases_from_file_and_organizations(self, mock_session):
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+        alias_file = path.join(directory, 'aliases.json')
+        with open(alias_file, 'w') as f:
+            json.dump({'111111111111': 'from-file'}, f)
+
+        organizations = mock_session.return_value.client.return_value
+        organizations.get_paginator.return_value.paginate.return_value = [
+            {'Accounts': [{'Id': '123456789012', 'Name': 'from-organizations'}]},
+            {'Accounts': [{'Id': '111111111111', 'Name': 'ignored'}, {'Id': '333333333333', 'Name': 'not-mine'}]}]
+        sts_client = mock.Mock()
+        sts_client.assume_role_with_saml.return_value = {
+            'Credentials': {'AccessKeyId': 'ASIA', 'SecretAccessKey': 'secret', 'SessionToken': 'token'}}
+
+        config = self.valid_config
+        config.alias_file = alias_file
+        config.alias_role = 'arn:aws:iam::123456789012:role/admin'
+        a = amazon.Amazon(config, self.read_local_file('valid-response.xml'), sts_client=sts_client)
+        principal = a.roles[config.alias_role]
+        roles = {'arn:aws:iam::111111111111:role/admin': principal,
+                 'arn:aws:iam::123456789012:role/read-only': principal}
+
+        self.assertEqual({'111111111111': 'from-file', '123456789012': 'from-organizations'},
+                         a.resolve_aws_aliases(roles))
+        # A single AssumeRoleWithSAML, for the alias role, and no per-account lookups
+        self.assertEqual(1, sts_client.assume_role_with_saml.call_count)
+        self.assertEqual(config.alias_role, sts_client.assume_role_with_saml.call_args[1]['RoleArn'])
+        mock_session.return_value.client.assert_called_once_with(
+            'organizations', aws_access_key_id='ASIA', aws_secret_access_key='secret', aws_session_token='token')
+
+    def test_alias_role_not_in_assertion(self):
+        config = self.valid_config
+        config.alias_role = 'arn:aws:iam::123456789012:role/missing'
+        a = amazon.Amazon(config, self.read_local_file('valid-response.xml'))
+
+        self.assertEqual({}, a.resolve_organization_aliases(config.alias_role))
+
+    def test_assume_chained_roles(self):
+        lock = threading.Lock()
+        calls = {'running': 0, 'most': 0}
+
+        def assume_role(RoleArn, RoleSessionName, Credentials, DurationSeconds):
+            with lock:
+                calls['running'] += 1
+                calls['most'] = max(calls['most'], calls['running'])
+            time.sleep(0.02)
+            with lock:
+                calls['running'] -= 1
+            if RoleArn.endswith('/throttled'):
+                raise ClientError({'Error': {'Code': 'Throttling', 'Message': 'Rate exceeded'}}, 'AssumeRole')
+            if RoleArn.endswith('/denied'):
+                raise ClientError({'Error': {'Code': 'AccessDenied', 'Message': 'not allowed'}}, 'AssumeRole')
+            return {'Credentials': {'AccessKeyId': 'ASIA' + RoleArn.split(':')[4], 'SecretAccessKey': 'secret',
+                                    'SessionToken': 'token', 'Expiration': 'soon'}}
+
+        sts_client = mock.Mock(spec=sts.STSClient)
+        sts_client.assume_role_with_saml.return_value = {
+            'Credentials': {'AccessKeyId': 'ASIAHUB', 'SecretAccessKey': 'secret', 'SessionToken': 'token'},
+            'AssumedRoleUser': {'AssumedRoleId': 'AROAHUB:user@example.com'}}
+        sts_client.assume_role.side_effect = assume_role
+        config = self.valid_config
+        config.role_arn = 'arn:aws:iam::123456789012:role/hub'
+        config.provider = 'arn:aws:iam::123456789012:saml-provider/GoogleApps'
+        a = amazon.Amazon(config, b'<xml/>', sts_client=sts_client)
+
+        spokes = {'spoke-{}'.format(i): 'arn:aws:iam::21098765432{}:role/deploy'.format(i) for i in range(4)}
+        assumed, failed = a.assume_chained_roles(dict(spokes, throttled='arn:aws:iam::1:role/throttled',
+                                                      denied='arn:aws:iam::1:role/denied'))
+
+        self.assertEqual(sorted(spokes), sorted(assumed))
+        self.assertEqual('ASIA210987654322', assumed['spoke-2'].access_key_id)
+        self.assertEqual(spokes['spoke-2'], assumed['spoke-2'].role_arn)
+        self.assertIsInstance(failed['throttled'], errors.STSThrottled)
+        self.assertEqual('AccessDenied', failed['denied'].response['Error']['Code'])
+        self.assertEqual(6, calls['most'])
+
+        # Signed with the hub's credentials, as the federated user, for at most an hour
+        kwargs = sts_client.assume_role.call_args[1]
+        self.assertEqual('ASIAHUB', kwargs['Credentials']['AccessKeyId'])
+        self.assertEqual('user@example.com', kwargs['RoleSessionName'])
+        self.assertEqual(amazon.CHAINED_MAX_DURATION, kwargs['DurationSeconds'])
+        self.assertEqual(1, sts_client.assume_role_with_saml.call_count)
+
+        # Roles already assumed are not assumed again
+        assumed, failed = a.assume_chained_roles({'other-name': spokes['spoke-0']})
+        self.assertEqual('ASIA210987654320', assumed['other-name'].access_key_id)
+        self.assertEqual(6, sts_client.assume_role.call_count)
+
+    @mock.patch('aws_google_auth.endpoints.sts_client')
+    def test_chained_roles_with_a_boto3_client(self, endpoints_sts_client):
+        # A boto3 client assumes the SAML role; chained roles are signed by an sts.STSClient
+        boto3_client = mock.Mock(spec=['assume_role_with_saml', 'assume_role'])
+        boto3_client.assume_role_with_saml.return_value = {
+            'Credentials': {'AccessKeyId': 'ASIAHUB', 'SecretAccessKey': 'secret', 'SessionToken': 'token'},
+            'AssumedRoleUser': {'AssumedRoleId': 'AROAHUB:user@example.com'}}
+        chain_client = endpoints_sts_client.return_value = mock.Mock(spec=sts.STSClient)
+        chain_client.assume_role.side_effect = [
+            {'Credentials': {'AccessKeyId': 'ASIASPOKE', 'SecretAccessKey': 'secret', 'SessionToken': 'token', 'Expiration': 'soon'}},
+            KeyError('Credentials')]
+        config = self.valid_config
+        config.role_arn = 'arn:aws:iam::123456789012:role/hub'
+        config.provider = 'arn:aws:iam::123456789012:saml-provider/GoogleApps'
+        a = amazon.Amazon(config, b'<xml/>', sts_client=boto3_client)
+
+        assumed, failed = a.assume_chained_roles({'spoke': 'arn:aws:iam::210987654321:role/deploy'})
+        self.assertEqual('ASIASPOKE', assumed['spoke'].access_key_id)
+        self.assertFalse(boto3_client.assume_role.called)
+        self.assertIs(chain_client, a.chain_client)
+
+        # Unexpected errors are reported like the others
+        assumed, failed = a.assume_chained_roles({'broken': 'arn:aws:iam::345678901234:role/deploy'})
+        self.assertEqual({}, assumed)
+        self.assertIsInstance(failed['broken'], KeyError)
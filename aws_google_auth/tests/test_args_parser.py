@@ -20,6 +20,8 @@ class TestPythonFailOnVersion(unittest.TestCase):
         self.assertFalse(parser.ask_role)
         self.assertFalse(parser.print_creds)
         self.assertFalse(parser.keyring)
+        self.assertFalse(parser.totp_keyring)
+        self.assertFalse(parser.probe_sts)
         self.assertFalse(parser.resolve_aliases)
         self.assertFalse(parser.disable_u2f, None)
 
@@ -32,15 +34,21 @@ class TestPythonFailOnVersion(unittest.TestCase):
         self.assertEqual(parser.role_arn, None)
         self.assertEqual(parser.username, None)
         self.assertEqual(parser.quiet, False)
+        self.assertFalse(parser.non_interactive)
         self.assertEqual(parser.bg_response, None)
         self.assertEqual(parser.account, None)
 
         self.assertFalse(parser.save_failure_html)
         self.assertFalse(parser.save_saml_flow)
+        self.assertEqual(parser.timings, None)
+        self.assertEqual(parser.metrics, None)
+        self.assertEqual(parser.alias_role, None)
+        self.assertEqual(parser.alias_file, None)
+        self.assertEqual(parser.chain_role, None)
 
         # Assert the size of the parameter so that new parameters trigger a review of this function
         # and the appropriate defaults are added here to track backwards compatibility in the future.
-        self.assertEqual(len(vars(parser)), 21)
+        self.assertEqual(len(vars(parser)), 29)
 
     def test_username(self):
 
@@ -0,0 +1,83 @@
+#!/usr/bin/env python
+
+import unittest
+from datetime import datetime, timedelta
+from os import path
+
+import botocore.session
+from botocore.credentials import RefreshableCredentials
+from dateutil.tz import tzutc
+from mock import Mock
+
+from aws_google_auth import botocore_provider
+
+
+class TestGoogleCredentialProvider(unittest.TestCase):
+
+    def read_local_file(self, filename):
+        here = path.abspath(path.dirname(__file__))
+        with open(path.join(here, filename)) as fp:
+            return fp.read().encode('utf-8')
+
+    def setUp(self):
+        self.sts_client = Mock()
+        self.sts_client.assume_role_with_saml.side_effect = self.assume_role_with_saml
+        self.expirations = []
+
+        self.config = Mock()
+        self.config.auto_duration = False
+        self.config.duration = 3600
+        self.config.role_arn = 'arn:aws:iam::123456789012:role/admin'
+        self.config.saml_cache = self.read_local_file('saml-response-no-expire.xml')
+
+    def assume_role_with_saml(self, **kwargs):
+        expiration = datetime.now(tzutc()) + timedelta(minutes=5 + 60 * len(self.expirations))
+        self.expirations.append(expiration)
+        return {
+            'Credentials': {
+                'AccessKeyId': 'ASIAEXAMPLE{}'.format(len(self.expirations)),
+                'SecretAccessKey': 'secret',
+                'SessionToken': 'token',
+                'Expiration': expiration,
+            }
+        }
+
+    def test_load(self):
+        login = Mock()
+        undertest = botocore_provider.GoogleCredentialProvider(self.config, login=login, sts_client=self.sts_client)
+
+        creds = undertest.load()
+
+        self.assertIsInstance(creds, RefreshableCredentials)
+        self.assertEqual('aws-google-auth', creds.method)
+        self.assertFalse(login.called)
+
+    def test_refreshes_ahead_of_expiration(self):
+        login = Mock()
+        undertest = botocore_provider.GoogleCredentialProvider(self.config, login=login, sts_client=self.sts_client)
+
+        creds = undertest.load()
+        # The first credentials expire in 5 minutes, inside botocore's refresh window
+        self.assertEqual('ASIAEXAMPLE2', creds.get_frozen_credentials().access_key)
+        self.assertEqual(2, self.sts_client.assume_role_with_saml.call_count)
+        self.assertFalse(login.called)
+
+    def test_login_when_saml_cache_expired(self):
+        self.config.saml_cache = None
+
+        def login(config):
+            config.saml_cache = self.read_local_file('saml-response-no-expire.xml')
+
+        undertest = botocore_provider.GoogleCredentialProvider(self.config, login=Mock(side_effect=login),
+                                                               sts_client=self.sts_client)
+        undertest.load()
+
+        self.assertEqual(1, undertest.login.call_count)
+
+    def test_register(self):
+        session = botocore.session.Session()
+        provider = botocore_provider.register(session, self.config, login=Mock(), sts_client=self.sts_client)
+
+        resolver = session.get_component('credential_provider')
+        self.assertEqual(provider, resolver.get_provider('aws-google-auth'))
+        self.assertEqual('aws-google-auth', session.get_credentials().method)
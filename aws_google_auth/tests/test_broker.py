@@ -0,0 +1,212 @@
+#!/usr/bin/env python
+
+import base64
+import os
+import shutil
+import socket
+import tempfile
+import threading
+import time
+import unittest
+from datetime import datetime, timedelta
+from os import path
+
+from dateutil.tz import tzutc
+from mock import Mock, patch
+
+from aws_google_auth import broker
+from aws_google_auth import configuration
+from aws_google_auth import errors
+
+ADMIN = 'arn:aws:iam::123456789012:role/admin'
+READ_ONLY = 'arn:aws:iam::123456789012:role/read-only'
+
+
+class TestBroker(unittest.TestCase):
+
+    def read_local_file(self, filename):
+        here = path.abspath(path.dirname(__file__))
+        with open(path.join(here, filename)) as fp:
+            return fp.read().encode('utf-8')
+
+    def setUp(self):
+        self.now = 1500000000.0
+        self.saml_assertion = base64.b64encode(self.read_local_file('saml-response-no-expire.xml')).decode('utf-8')
+
+        self.sts_client = Mock()
+        self.sts_client.assume_role_with_saml.side_effect = self.assume_role_with_saml
+
+        config = configuration.Configuration()
+        config.auto_duration = True
+        self.undertest = broker.Broker(config, sessions=broker.SessionCache(ttl=600, clock=self.clock),
+                                       workers=2, sts_client=self.sts_client, clock=self.clock)
+
+    def clock(self):
+        return self.now
+
+    def assume_role_with_saml(self, **kwargs):
+        return {'Credentials': {'AccessKeyId': 'ASIA' + kwargs['RoleArn'][-5:],
+                                'SecretAccessKey': 'secret',
+                                'SessionToken': 'token',
+                                'Expiration': datetime.fromtimestamp(self.now, tzutc()) + timedelta(hours=1)}}
+
+    def test_credentials_are_cached_per_user(self):
+        self.assertEqual({'status': 'ok', 'exit_code': 0, 'roles': [ADMIN, READ_ONLY, 'arn:aws:iam::123456789012:role/test']},
+                         self.undertest.handle(1000, {'action': 'login', 'saml_assertion': self.saml_assertion}))
+
+        response = self.undertest.handle(1000, {'action': 'credentials', 'role_arn': ADMIN})
+        self.assertEqual('ok', response['status'])
+        self.assertEqual({'Version': 1,
+                          'AccessKeyId': 'ASIAadmin',
+                          'SecretAccessKey': 'secret',
+                          'SessionToken': 'token',
+                          'Expiration': '2017-07-14T03:40:00+00:00'},
+                         response['credentials'])
+        self.assertEqual(response, self.undertest.handle(1000, {'action': 'credentials', 'role_arn': ADMIN}))
+        self.assertEqual(1, self.sts_client.assume_role_with_saml.call_count)
+        self.assertEqual(43200, self.sts_client.assume_role_with_saml.call_args[1]['DurationSeconds'])
+
+        # Other roles and durations are assumed separately
+        self.undertest.handle(1000, {'action': 'credentials', 'role_arn': READ_ONLY})
+        self.undertest.handle(1000, {'action': 'credentials', 'role_arn': ADMIN, 'duration': 900})
+        self.assertEqual(3, self.sts_client.assume_role_with_saml.call_count)
+        self.assertEqual(900, self.sts_client.assume_role_with_saml.call_args[1]['DurationSeconds'])
+
+        # Credentials close to their expiration are replaced
+        self.undertest.sessions.ttl = 7200
+        self.now += 3600 - broker.MIN_REMAINING + 1
+        self.undertest.handle(1000, {'action': 'credentials', 'role_arn': ADMIN})
+        self.assertEqual(4, self.sts_client.assume_role_with_saml.call_count)
+
+        # Another user has no session of their own
+        self.assertEqual({'status': 'error', 'exit_code': errors.EXIT_CACHE_MISS, 'error': 'cache_miss',
+                          'message': 'There is no broker session, run aws-google-auth broker login first.'},
+                         self.undertest.handle(1001, {'action': 'credentials', 'role_arn': ADMIN}))
+
+    def test_sessions_expire(self):
+        self.undertest.handle(1000, {'action': 'login', 'saml_assertion': self.saml_assertion})
+        self.undertest.handle(1001, {'action': 'login', 'saml_assertion': self.saml_assertion})
+
+        self.now += 500
+        self.assertEqual('ok', self.undertest.handle(1000, {'action': 'credentials', 'role_arn': ADMIN})['status'])
+        self.now += 200
+        self.undertest.sessions.evict()
+
+        # Only the session that was used is left
+        self.assertEqual(1, len(self.undertest.sessions))
+        self.assertEqual('cache_miss', self.undertest.handle(1001, {'action': 'credentials', 'role_arn': ADMIN})['error'])
+
+        self.assertEqual('ok', self.undertest.handle(1000, {'action': 'logout'})['status'])
+        self.assertEqual(0, len(self.undertest.sessions))
+
+    def test_errors(self):
+        expired = base64.b64encode(self.read_local_file('saml-response-too-late.xml')).decode('utf-8')
+        self.assertEqual('cache_miss', self.undertest.handle(1000, {'action': 'login', 'saml_assertion': expired})['error'])
+        self.assertEqual('error', self.undertest.handle(1000, {'action': 'login', 'saml_assertion': None})['error'])
+        self.assertEqual('error', self.undertest.handle(1000, {'action': 'restart'})['error'])
+
+        self.undertest.handle(1000, {'action': 'login', 'saml_assertion': self.saml_assertion})
+        response = self.undertest.handle(1000, {'action': 'credentials', 'role_arn': 'arn:aws:iam::123456789012:role/root'})
+        self.assertEqual(errors.EXIT_FAILURE, response['exit_code'])
+        self.assertIn('is not in the SAML assertion', response['message'])
+        self.assertEqual('error', self.undertest.handle(1000, {'action': 'credentials', 'role_arn': ADMIN, 'duration': '1h'})['error'])
+
+    def test_workers_are_bounded(self):
+        lock = threading.Lock()
+        calls = {'running': 0, 'most': 0}
+
+        def slow_assume_role_with_saml(**kwargs):
+            with lock:
+                calls['running'] += 1
+                calls['most'] = max(calls['most'], calls['running'])
+            time.sleep(0.02)
+            with lock:
+                calls['running'] -= 1
+            return self.assume_role_with_saml(**kwargs)
+
+        self.sts_client.assume_role_with_saml.side_effect = slow_assume_role_with_saml
+        for uid in range(8):
+            self.undertest.handle(uid, {'action': 'login', 'saml_assertion': self.saml_assertion})
+
+        responses = []
+        threads = [threading.Thread(target=lambda uid=uid: responses.append(
+            self.undertest.handle(uid, {'action': 'credentials', 'role_arn': ADMIN}))) for uid in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(['ok'] * 8, [response['status'] for response in responses])
+        self.assertEqual(8, self.sts_client.assume_role_with_saml.call_count)
+        self.assertEqual(2, calls['most'])
+
+
+@unittest.skipUnless(hasattr(socket, 'AF_UNIX') and hasattr(socket, 'SO_PEERCRED'), 'needs Linux Unix sockets')
+class TestBrokerServer(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.directory)
+        self.socket = path.join(self.directory, 'broker.sock')
+
+    def test_requests_are_answered_for_the_peer(self):
+        undertest = Mock()
+        undertest.handle.return_value = {'status': 'ok', 'exit_code': 0, 'roles': [ADMIN]}
+        server = broker.BrokerServer(self.socket, undertest)
+        thread = threading.Thread(target=server.serve_forever, kwargs={'poll_interval': 0.05})
+        thread.start()
+        try:
+            self.assertEqual(0o666, os.stat(self.socket).st_mode & 0o777)
+
+            response = broker.request(self.socket, {'action': 'login', 'saml_assertion': 'c2FtbA=='})
+            self.assertEqual([ADMIN], response['roles'])
+            undertest.handle.assert_called_once_with(os.getuid(), {'action': 'login', 'saml_assertion': 'c2FtbA=='})
+
+            undertest.handle.return_value = {'status': 'error', 'exit_code': 4, 'error': 'cache_miss', 'message': 'log in'}
+            with self.assertRaises(errors.LoginRequired):
+                broker.request(self.socket, {'action': 'credentials', 'role_arn': ADMIN})
+        finally:
+            server.shutdown()
+            server.server_close()
+            thread.join()
+
+        self.assertFalse(path.exists(self.socket))
+        with self.assertRaises(errors.NetworkError):
+            broker.request(self.socket, {'action': 'logout'})
+
+    def test_only_stale_sockets_are_replaced(self):
+        stale = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        stale.bind(self.socket)
+        stale.close()
+        broker.BrokerServer(self.socket, Mock()).server_close()
+
+        # Not a socket, e.g. a mistyped --socket
+        with open(self.socket, 'w') as f:
+            f.write('keep me')
+        with self.assertRaises(errors.ExpectedGoogleException):
+            broker.BrokerServer(self.socket, Mock())
+        with open(self.socket) as f:
+            self.assertEqual('keep me', f.read())
+
+        # Nor a link to one
+        os.unlink(self.socket)
+        os.symlink(path.join(self.directory, 'elsewhere'), self.socket)
+        with self.assertRaises(errors.ExpectedGoogleException):
+            broker.BrokerServer(self.socket, Mock())
+        self.assertTrue(path.islink(self.socket))
+
+    @patch('aws_google_auth.broker.peer_uid', return_value=12345)
+    def test_requests_are_answered_for_the_kernels_uid(self, peer_uid):
+        # The socket is world writable: a uid in the request is not trusted
+        undertest = Mock()
+        undertest.handle.return_value = {'status': 'ok', 'exit_code': 0}
+        server = broker.BrokerServer(self.socket, undertest)
+        thread = threading.Thread(target=server.serve_forever, kwargs={'poll_interval': 0.05})
+        thread.start()
+        try:
+            broker.request(self.socket, {'action': 'logout', 'uid': 0})
+        finally:
+            server.shutdown()
+            server.server_close()
+            thread.join()
+        undertest.handle.assert_called_once_with(12345, {'action': 'logout', 'uid': 0})
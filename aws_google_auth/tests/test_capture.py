@@ -0,0 +1,99 @@
+#!/usr/bin/env python
+
+import gzip
+import json
+import os
+import shutil
+import tempfile
+import threading
+import unittest
+
+from mock import Mock, patch
+
+from aws_google_auth import capture
+
+
+class TestFlowCapture(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.path = os.path.join(self.directory, 'flow.ndjson.gz')
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def read_capture(self):
+        with gzip.open(self.path, 'rt', encoding='utf-8') as fp:
+            return [json.loads(line) for line in fp]
+
+    def test_records_in_order(self):
+        response = Mock()
+        response.status_code = 200
+        response.url = "https://accounts.google.com/signin/challenge/totp/2?hl=en"
+        response.text = "<html></html>"
+
+        undertest = capture.FlowCapture(self.path)
+        undertest.request('POST', 'https://accounts.google.com/signin/challenge/sl/password', data={'Email': 'user@example.com'})
+        undertest.response('POST', 'https://accounts.google.com/signin/challenge/sl/password', response)
+        undertest.close()
+
+        self.assertEqual([{'type': 'request',
+                           'method': 'POST',
+                           'url': 'https://accounts.google.com/signin/challenge/sl/password',
+                           'data': {'Email': 'user@example.com'},
+                           'json': None},
+                          {'type': 'response',
+                           'method': 'POST',
+                           'url': 'https://accounts.google.com/signin/challenge/sl/password',
+                           'status': 200,
+                           'response_url': 'https://accounts.google.com/signin/challenge/totp/2?hl=en',
+                           'body': '<html></html>'}],
+                         self.read_capture())
+
+    def test_redacts_secrets(self):
+        undertest = capture.FlowCapture(self.path, secrets=['hun"ter2', None])
+        undertest.request('POST', 'https://accounts.google.com/signin/challenge/sl/password',
+                          data={'Passwd': 'hun"ter2', 'Email': 'user@example.com'})
+        undertest.close()
+
+        self.assertEqual({'Passwd': '<PASSWORD>', 'Email': 'user@example.com'},
+                         self.read_capture()[0]['data'])
+
+    def test_secret_added_later(self):
+        undertest = capture.FlowCapture(self.path, secrets=[None])
+        undertest.add_secret('hunter2')
+        undertest.request('POST', 'https://accounts.google.com/signin/challenge/sl/password',
+                          data={'Passwd': 'hunter2'})
+        undertest.close()
+
+        self.assertEqual({'Passwd': '<PASSWORD>'}, self.read_capture()[0]['data'])
+
+    def test_payload_changed_after_the_request(self):
+        # Hold the writer back until the caller has changed its payload
+        posted = threading.Event()
+        record = capture.FlowCapture._record
+
+        def slow_record(*item):
+            posted.wait(5)
+            return record(*item)
+
+        with patch.object(capture.FlowCapture, '_record', staticmethod(slow_record)):
+            undertest = capture.FlowCapture(self.path)
+            payload = {'Email': 'user@example.com'}
+            json_payload = {'f.req': ['user@example.com']}
+            undertest.request('POST', 'https://accounts.google.com/signin/v1/lookup', data=payload, json_data=json_payload)
+            payload['Passwd'] = 'hunter2'
+            json_payload['f.req'].append('hunter2')
+            posted.set()
+            undertest.close()
+
+        line = self.read_capture()[0]
+        self.assertEqual({'Email': 'user@example.com'}, line['data'])
+        self.assertEqual({'f.req': ['user@example.com']}, line['json'])
+
+    def test_close_twice(self):
+        undertest = capture.FlowCapture(self.path)
+        undertest.close()
+        undertest.close()
+
+        self.assertEqual([], self.read_capture())
@@ -0,0 +1,192 @@
+#!/usr/bin/env python
+
+import os
+import shutil
+import tempfile
+import threading
+import time
+import unittest
+from multiprocessing.pool import ThreadPool
+from os import path
+
+import configparser
+from mock import Mock, patch
+from six.moves import BaseHTTPServer, socketserver
+from six.moves.urllib.parse import parse_qs
+
+from aws_google_auth import amazon
+from aws_google_auth import configuration
+from aws_google_auth import credentials
+from aws_google_auth import sts
+
+ROLES = ['arn:aws:iam::123456789012:role/admin',
+         'arn:aws:iam::123456789012:role/read-only',
+         'arn:aws:iam::123456789012:role/test']
+
+RESPONSE = u"""<AssumeRoleWithSAMLResponse xmlns="https://sts.amazonaws.com/doc/2011-06-15/">
+  <AssumeRoleWithSAMLResult>
+    <AssumedRoleUser>
+      <AssumedRoleId>AROAEXAMPLE:user@example.com</AssumedRoleId>
+      <Arn>{role}</Arn>
+    </AssumedRoleUser>
+    <Credentials>
+      <AccessKeyId>ASIA{number:06d}</AccessKeyId>
+      <SecretAccessKey>secret</SecretAccessKey>
+      <SessionToken>token</SessionToken>
+      <Expiration>2100-01-01T00:00:00Z</Expiration>
+    </Credentials>
+  </AssumeRoleWithSAMLResult>
+  <ResponseMetadata>
+    <RequestId>c6104cbe-af31-11e0-8154-cbc7ccf896c7</RequestId>
+  </ResponseMetadata>
+</AssumeRoleWithSAMLResponse>"""
+
+
+class StubSTSHandler(BaseHTTPServer.BaseHTTPRequestHandler):
+    """Answers every AssumeRoleWithSAML with credentials numbered in order."""
+
+    protocol_version = 'HTTP/1.1'
+
+    def do_POST(self):
+        params = parse_qs(self.rfile.read(int(self.headers['Content-Length'])).decode('utf-8'))
+        with self.server.lock:
+            self.server.calls.append(params['RoleArn'][0])
+            number = len(self.server.calls)
+        # Long enough for the requests of different threads to overlap
+        time.sleep(0.005)
+
+        body = RESPONSE.format(role=params['RoleArn'][0], number=number).encode('utf-8')
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/xml')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+class StubSTS(socketserver.ThreadingMixIn, BaseHTTPServer.HTTPServer):
+    daemon_threads = True
+
+    def __init__(self):
+        BaseHTTPServer.HTTPServer.__init__(self, ('127.0.0.1', 0), StubSTSHandler)
+        self.lock = threading.Lock()
+        self.calls = []
+
+    @property
+    def url(self):
+        return 'http://127.0.0.1:{}'.format(self.server_address[1])
+
+
+class TestConcurrency(unittest.TestCase):
+
+    PROFILES = ['profile-{:03d}'.format(i) for i in range(100)]
+
+    def read_local_file(self, filename):
+        here = path.abspath(path.dirname(__file__))
+        with open(path.join(here, filename)) as fp:
+            return fp.read()
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.directory)
+        self.config_file = path.join(self.directory, 'config')
+        self.credentials_file = path.join(self.directory, 'credentials')
+
+        with open(self.config_file, 'w') as f:
+            for i, profile in enumerate(self.PROFILES):
+                f.write('[profile {}]\n'
+                        'region = us-east-1\n'
+                        'google_config.google_idp_id = idp\n'
+                        'google_config.google_sp_id = sp\n'
+                        'google_config.google_username = user@example.com\n'
+                        'google_config.duration = 3600\n'
+                        'google_config.role_arn = {}\n\n'.format(profile, ROLES[i % len(ROLES)]))
+        open(self.credentials_file, 'w').close()
+        with open(path.join(self.directory, 'saml_cache_idp.xml'), 'w') as f:
+            f.write(self.read_local_file('saml-response-no-expire.xml'))
+
+        environ = patch.dict(os.environ, {'AWS_CONFIG_FILE': self.config_file,
+                                          'AWS_SHARED_CREDENTIALS_FILE': self.credentials_file})
+        environ.start()
+        self.addCleanup(environ.stop)
+
+        self.stub = StubSTS()
+        thread = threading.Thread(target=self.stub.serve_forever, kwargs={'poll_interval': 0.05})
+        thread.daemon = True
+        thread.start()
+        self.addCleanup(self.stub.server_close)
+        self.addCleanup(self.stub.shutdown)
+
+    def test_refresh_profiles_from_a_thread_pool(self):
+        sts_client = sts.STSClient(endpoint=self.stub.url)
+        environ = dict(os.environ)
+
+        def refresh(profile):
+            config = configuration.Configuration()
+            config.read(profile)
+            creds = credentials.get_credentials(config, sts_client=sts_client)
+            config.write(creds)
+            return profile, config.role_arn, creds.access_key_id
+
+        pool = ThreadPool(16)
+        try:
+            results = pool.map(refresh, self.PROFILES)
+        finally:
+            pool.close()
+            pool.join()
+
+        self.assertEqual(environ, dict(os.environ))
+
+        # One call per profile, each with the profile's own role
+        self.assertEqual(100, len(self.stub.calls))
+        self.assertEqual(sorted(role for _, role, _ in results), sorted(self.stub.calls))
+        self.assertEqual(100, len(set(key for _, _, key in results)))
+
+        # No write was lost, and no profile got another one's credentials
+        credentials_parser = configparser.RawConfigParser()
+        credentials_parser.read(self.credentials_file)
+        self.assertEqual(sorted(self.PROFILES), sorted(credentials_parser.sections()))
+        for profile, _, access_key_id in results:
+            self.assertEqual(access_key_id, credentials_parser.get(profile, 'aws_access_key_id'))
+
+        config_parser = configparser.RawConfigParser()
+        config_parser.read(self.config_file)
+        for i, profile in enumerate(self.PROFILES):
+            self.assertEqual(ROLES[i % len(ROLES)], config_parser.get('profile ' + profile, 'google_config.role_arn'))
+
+    def test_shared_amazon_assumes_the_role_once(self):
+        sts_client = Mock()
+        sts_client.assume_role_with_saml.side_effect = lambda **kwargs: time.sleep(0.01) or {'Credentials': {'AccessKeyId': 'ASIAEXAMPLE'}}
+        config = Mock(auto_duration=False, role_arn=ROLES[0], duration=3600)
+        undertest = amazon.Amazon(config, b'<xml/>', sts_client=sts_client)
+
+        pool = ThreadPool(8)
+        try:
+            keys = pool.map(lambda _: undertest.access_key_id, range(32))
+        finally:
+            pool.close()
+            pool.join()
+
+        self.assertEqual(['ASIAEXAMPLE'] * 32, keys)
+        self.assertEqual(1, sts_client.assume_role_with_saml.call_count)
+
+    def test_symlinked_files_stay_links(self):
+        # e.g. a config kept in a dotfiles repository
+        dotfiles = path.join(self.directory, 'dotfiles')
+        os.mkdir(dotfiles)
+        for name in (self.config_file, self.credentials_file):
+            os.rename(name, path.join(dotfiles, path.basename(name)))
+            os.symlink(path.join(dotfiles, path.basename(name)), name)
+
+        config = configuration.Configuration()
+        config.read(self.PROFILES[0])
+        config.write(credentials.get_credentials(config, sts_client=sts.STSClient(endpoint=self.stub.url)))
+
+        for name in (self.config_file, self.credentials_file):
+            self.assertTrue(path.islink(name))
+        credentials_parser = configparser.RawConfigParser()
+        credentials_parser.read(path.join(dotfiles, 'credentials'))
+        self.assertEqual([self.PROFILES[0]], credentials_parser.sections())
+        self.assertEqual([], [f for f in os.listdir(self.directory) if f.startswith('.')])
@@ -376,6 +376,22 @@ class TestConfigurationMethods(unittest.TestCase):
         self.assertEqual(c.role_arn, "arn:aws:iam::some_other_arn_2")
         c.raise_if_invalid()
 
+    def test_role_arn_patterns(self):
+        c = configuration.Configuration()
+        c.region = "sample_region"
+        c.idp_id = "sample_idp_id"
+        c.sp_id = "sample_sp_id"
+        c.username = "sample_username"
+        c.password = "hunter2"
+        c.role_arn = "*:role/admin"
+        c.raise_if_invalid()
+        c.role_arn = "/(prod|staging).*admin$/"
+        c.raise_if_invalid()
+        c.role_arn = "/(unbalanced/"
+        with self.assertRaises(AssertionError) as e:
+            c.raise_if_invalid()
+        self.assertIn("Expected role_arn to be a valid regular expression.", str(e.exception))
+
     def test_u2f_disabled_invalid_values(self):
         # u2f_disabled must be a boolean
         c = configuration.Configuration()
@@ -419,6 +435,45 @@ class TestConfigurationMethods(unittest.TestCase):
         self.assertFalse(c.u2f_disabled)
         c.raise_if_invalid()
 
+    def test_totp_secret_invalid_values(self):
+        c = configuration.Configuration()
+        c.region = "sample_region"
+        c.idp_id = "sample_idp_id"
+        c.sp_id = "sample_sp_id"
+        c.username = "sample_username"
+        c.password = "hunter2"
+        c.totp_keyring = True
+        c.totp_secret = "not base32!"
+        with self.assertRaises(AssertionError) as e:
+            c.raise_if_invalid()
+        self.assertIn("Expected totp_secret to be a base32 TOTP secret", str(e.exception))
+
+        c.totp_secret = "GEZD GNBV GY3T QOJQ"
+        c.raise_if_invalid()
+
+    def test_chain_roles(self):
+        self.assertEqual({'deploy': 'arn:aws:iam::210987654321:role/deploy',
+                          'dev-345678901234-admin': 'arn:aws:iam::345678901234:role/ops/admin'},
+                         configuration.parse_chain_roles(['deploy=arn:aws:iam::210987654321:role/deploy',
+                                                          ' arn:aws:iam::345678901234:role/ops/admin', ''], 'dev'))
+
+        c = configuration.Configuration()
+        c.region = "sample_region"
+        c.idp_id = "sample_idp_id"
+        c.sp_id = "sample_sp_id"
+        c.username = "sample_username"
+        c.password = "hunter2"
+        c.profile = "dev"
+        c.chain_roles = {'deploy': 'arn:aws:iam::210987654321:role/deploy'}
+        c.raise_if_invalid()
+
+        for chain_roles in [{'deploy': 'bad_string'}, {'dev': 'arn:aws:iam::210987654321:role/deploy'},
+                            {'two words': 'arn:aws:iam::210987654321:role/deploy'}]:
+            c.chain_roles = chain_roles
+            with self.assertRaises(AssertionError) as e:
+                c.raise_if_invalid()
+            self.assertIn("Expected chain_roles", str(e.exception))
+
     def test_unicode_password(self):
         c = configuration.Configuration()
         c.region = "sample_region"
@@ -24,6 +24,10 @@ class TestConfigurationPersistence(unittest.TestCase):
         self.c.region = "us-east-1"
         self.c.ask_role = False
         self.c.keyring = False
+        self.c.totp_keyring = True
+        self.c.totp_secret = "GEZDGNBVGY3TQOJQGEZDGNBVGY3TQOJQ"
+        self.c.probe_sts = True
+        self.c.chain_roles = {"sample_spoke": "arn:aws:iam::sample_spoke_arn", "other_spoke": "arn:aws:iam::other_arn"}
         self.c.duration = 1234
         self.c.idp_id = "sample_idp_id"
         self.c.role_arn = "arn:aws:iam::sample_arn"
@@ -54,6 +58,10 @@ class TestConfigurationPersistence(unittest.TestCase):
         self.assertEqual(self.config_parser[profile_string].get('region'), self.c.region)
         self.assertEqual(self.config_parser[profile_string].getboolean('google_config.ask_role'), self.c.ask_role)
         self.assertEqual(self.config_parser[profile_string].getboolean('google_config.keyring'), self.c.keyring)
+        self.assertEqual(self.config_parser[profile_string].getboolean('google_config.totp_keyring'), self.c.totp_keyring)
+        self.assertEqual(self.config_parser[profile_string].getboolean('google_config.probe_sts'), self.c.probe_sts)
+        self.assertEqual(self.config_parser[profile_string].get('google_config.chain_roles'),
+                         'other_spoke=arn:aws:iam::other_arn,sample_spoke=arn:aws:iam::sample_spoke_arn')
         self.assertEqual(self.config_parser[profile_string].getboolean('google_config.u2f_disabled'), self.c.u2f_disabled)
         self.assertEqual(self.config_parser[profile_string].getint('google_config.duration'), self.c.duration)
         self.assertEqual(self.config_parser[profile_string].get('google_config.bg_response'), self.c.bg_response)
@@ -67,6 +75,7 @@ class TestConfigurationPersistence(unittest.TestCase):
         with open(self.c.config_file, 'r') as config_file:
             for line in config_file:
                 self.assertFalse(self.c.password in line)
+                self.assertFalse(self.c.totp_secret in line)
 
     def test_can_read_all_values(self):
         test_configuration = configuration.Configuration()
@@ -88,4 +97,7 @@ class TestConfigurationPersistence(unittest.TestCase):
         self.assertEqual(test_configuration.u2f_disabled, self.c.u2f_disabled)
         self.assertEqual(test_configuration.duration, self.c.duration)
         self.assertEqual(test_configuration.keyring, self.c.keyring)
+        self.assertEqual(test_configuration.totp_keyring, self.c.totp_keyring)
+        self.assertEqual(test_configuration.probe_sts, self.c.probe_sts)
+        self.assertEqual(test_configuration.chain_roles, self.c.chain_roles)
         self.assertEqual(test_configuration.bg_response, self.c.bg_response)
@@ -0,0 +1,91 @@
+#!/usr/bin/env python
+
+import unittest
+from datetime import datetime, timedelta
+from os import path
+
+from dateutil.tz import tzutc
+from mock import Mock, patch
+
+from aws_google_auth import credentials
+from aws_google_auth import google
+
+
+class TestCredentials(unittest.TestCase):
+
+    def read_local_file(self, filename):
+        here = path.abspath(path.dirname(__file__))
+        with open(path.join(here, filename)) as fp:
+            return fp.read().encode('utf-8')
+
+    def setUp(self):
+        self.expiration = datetime.now(tzutc()) + timedelta(hours=1)
+        self.sts_client = Mock()
+        self.sts_client.assume_role_with_saml.return_value = {
+            'Credentials': {
+                'AccessKeyId': 'ASIAEXAMPLE',
+                'SecretAccessKey': 'secret',
+                'SessionToken': 'token',
+                'Expiration': self.expiration,
+            }
+        }
+
+        self.config = Mock()
+        self.config.auto_duration = False
+        self.config.duration = 3600
+        self.config.role_arn = 'arn:aws:iam::123456789012:role/admin'
+
+    def test_credentials_from_saml_cache(self):
+        self.config.saml_cache = self.read_local_file('saml-response-no-expire.xml')
+
+        result = credentials.get_credentials(self.config, sts_client=self.sts_client)
+
+        self.assertEqual(credentials.Credentials(access_key_id='ASIAEXAMPLE',
+                                                 secret_access_key='secret',
+                                                 session_token='token',
+                                                 expiration=self.expiration,
+                                                 role_arn='arn:aws:iam::123456789012:role/admin'),
+                         result)
+        self.assertEqual('arn:aws:iam::123456789012:saml-provider/GoogleApps', self.config.provider)
+        self.assertFalse(self.config.write.called)
+        self.assertEqual(1, self.sts_client.assume_role_with_saml.call_count)
+        self.assertEqual('token', result.environment['AWS_SESSION_TOKEN'])
+
+    @patch('aws_google_auth.credentials.google.Google', spec=True)
+    def test_credentials_from_login(self, mock_google):
+        session = Mock()
+        self.config.saml_cache = None
+        mock_google.return_value.parse_saml.return_value = self.read_local_file('saml-response-no-expire.xml')
+
+        result = credentials.get_credentials(self.config, session=session, sts_client=self.sts_client)
+
+        self.assertEqual('ASIAEXAMPLE', result.access_key_id)
+        self.assertEqual(session, mock_google.call_args[1]['session'])
+        self.assertTrue(mock_google.return_value.do_login.called)
+        self.assertTrue(self.config.raise_if_invalid.called)
+        # The assertion is kept in memory for the next call
+        self.assertEqual(self.read_local_file('saml-response-no-expire.xml'), self.config.saml_cache)
+
+    def test_unknown_role(self):
+        self.config.saml_cache = self.read_local_file('saml-response-no-expire.xml')
+        self.config.role_arn = 'arn:aws:iam::123456789012:role/missing'
+
+        with self.assertRaises(google.ExpectedGoogleException):
+            credentials.get_credentials(self.config, sts_client=self.sts_client)
+
+        self.assertFalse(self.sts_client.assume_role_with_saml.called)
+
+    @patch('aws_google_auth.credentials.google', spec=True)
+    @patch('aws_google_auth.credentials.util', spec=True)
+    def test_interactive_login(self, mock_util, mock_google):
+        self.config.keyring = False
+        self.config.totp_keyring = False
+        self.config.saml_cache = None
+        mock_util.Util.get_password.return_value = 'hunter2'
+        mock_google.Google.return_value.parse_saml.return_value = b'<xml/>'
+
+        credentials.interactive_login(self.config)
+
+        self.assertEqual(b'<xml/>', self.config.saml_cache)
+        self.assertIsNone(self.config.password)
+        self.assertTrue(mock_google.Google.return_value.do_login.called)
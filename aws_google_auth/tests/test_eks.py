@@ -0,0 +1,128 @@
+#!/usr/bin/env python
+
+import base64
+import json
+import os
+import subprocess
+import sys
+import time
+from datetime import datetime, timedelta
+
+from dateutil.tz import tzutc
+from mock import patch
+from six.moves.urllib.parse import parse_qs, urlparse
+
+from aws_google_auth import credentials
+from aws_google_auth import eks
+from aws_google_auth.tests import helpers
+
+
+def decode(token):
+    """The presigned URL in an EKS token."""
+    encoded = token[len(eks.TOKEN_PREFIX):]
+    return base64.urlsafe_b64decode(encoded + '=' * (-len(encoded) % 4)).decode('utf-8')
+
+
+class TestEKS(helpers.ProfileTestCase):
+
+    def setUp(self):
+        super(TestEKS, self).setUp()
+        for variable in ('AWS_ENDPOINT_URL', 'AWS_ENDPOINT_URL_STS', 'KUBERNETES_EXEC_INFO'):
+            os.environ.pop(variable, None)
+
+        self.creds = helpers.fresh_credentials(datetime.now(tzutc()) + timedelta(hours=1))
+        self.patch_get_credentials(self.creds)
+        self.patch_saml_cache()
+
+    def run_main(self, *args):
+        return json.loads(self.printed(eks, ['-c', 'prod'] + list(args))[-1])
+
+    def test_presigned_token(self):
+        url = urlparse(decode(eks.presigned_token(self.creds, 'prod', 'eu-west-1')))
+        query = parse_qs(url.query)
+
+        self.assertEqual('sts.eu-west-1.amazonaws.com', url.netloc)
+        self.assertEqual(['GetCallerIdentity'], query['Action'])
+        self.assertEqual(['host;x-k8s-aws-id'], query['X-Amz-SignedHeaders'])
+        self.assertEqual(['token'], query['X-Amz-Security-Token'])
+        self.assertTrue(query['X-Amz-Credential'][0].startswith('ASIAFRESH/'))
+        self.assertTrue(query['X-Amz-Credential'][0].endswith('/eu-west-1/sts/aws4_request'))
+
+        # Without a region, the global endpoint (signed for us-east-1)
+        url = urlparse(decode(eks.presigned_token(self.creds, 'prod')))
+        self.assertEqual('sts.amazonaws.com', url.netloc)
+        self.assertIn('/us-east-1/sts/', parse_qs(url.query)['X-Amz-Credential'][0])
+
+    def test_tokens_are_cached(self):
+        credential = self.run_main()
+        self.assertEqual('ExecCredential', credential['kind'])
+        self.assertEqual(eks.API_VERSION, credential['apiVersion'])
+        self.assertTrue(credential['status']['token'].startswith(eks.TOKEN_PREFIX))
+        self.assertIn('sts.eu-west-1.amazonaws.com', decode(credential['status']['token']))
+        self.assertEqual(1, self.get_credentials.call_count)
+
+        # The token expires before the credentials do
+        expiration = datetime.strptime(credential['status']['expirationTimestamp'], '%Y-%m-%dT%H:%M:%SZ')
+        self.assertAlmostEqual(time.time() + eks.TOKEN_LIFETIME,
+                               (expiration - datetime(1970, 1, 1)).total_seconds(), delta=5)
+        self.assertEqual(0o600, os.stat(eks.cache_file()).st_mode & 0o777)
+
+        self.assertEqual(credential, self.run_main())
+        self.assertEqual(1, self.get_credentials.call_count)
+
+        # A token signed for another region is cached separately
+        self.assertNotEqual(credential, self.run_main('-R', 'us-west-2'))
+        self.assertEqual(2, self.get_credentials.call_count)
+
+        # A token about to expire is replaced
+        cache = eks.TokenCache(eks.cache_file(), clock=lambda: time.time() + eks.TOKEN_LIFETIME - eks.MIN_REMAINING + 1)
+        self.assertIsNone(cache.get(eks.TokenCache.key('dev', 'prod')))
+
+    def test_credentials_expiring_first(self):
+        # Stored credentials valid for less than a token's lifetime are not used
+        with open(self.credentials_file, 'w') as f:
+            f.write('[dev]\naws_access_key_id = ASIASTORED\naws_secret_access_key = secret\n'
+                    'aws_session_token = token\naws_session_expiration = {}\n'.format(
+                        (datetime.now(tzutc()) + timedelta(minutes=10)).strftime(credentials.EXPIRATION_FORMAT)))
+        expiration = datetime.now(tzutc()).replace(microsecond=0) + timedelta(minutes=12)
+        self.get_credentials.return_value = self.creds._replace(expiration=expiration)
+
+        credential = self.run_main()
+        self.assertEqual(1, self.get_credentials.call_count)
+        self.assertEqual(expiration.strftime('%Y-%m-%dT%H:%M:%SZ'), credential['status']['expirationTimestamp'])
+
+    @patch('aws_google_auth.credentials.interactive_login', spec=True)
+    def test_exec_info(self, interactive_login):
+        info = {'kind': 'ExecCredential', 'apiVersion': 'client.authentication.k8s.io/v1', 'spec': {'interactive': False}}
+        with patch.dict(os.environ, {'KUBERNETES_EXEC_INFO': json.dumps(info)}):
+            with patch('aws_google_auth.configuration.Configuration.saml_cache', new=None):
+                with patch('aws_google_auth.configuration.Configuration.write_saml_cache'):
+                    credential = self.run_main()
+        # kubectl would not show a prompt
+        self.assertEqual({'interactive': False}, interactive_login.call_args[1])
+        self.assertEqual('client.authentication.k8s.io/v1', credential['apiVersion'])
+
+        self.assertEqual({}, eks.exec_info({'KUBERNETES_EXEC_INFO': 'not json'}))
+        self.assertEqual(eks.API_VERSION, eks.exec_credential({'token': 't', 'expiration': 0}, 'v2')['apiVersion'])
+
+    def test_bad_cache_is_a_miss(self):
+        with open(eks.cache_file(), 'w') as f:
+            f.write('not json')
+        self.run_main()
+
+        with open(eks.cache_file(), 'w') as f:
+            json.dump({eks.TokenCache.key('dev', 'prod'): {'token': 'k8s-aws-v1.x', 'expiration': 'soon'}}, f)
+        self.assertNotEqual('k8s-aws-v1.x', self.run_main()['status']['token'])
+        self.assertEqual(2, self.get_credentials.call_count)
+
+    def test_cached_token_skips_the_login_code(self):
+        with open(eks.cache_file(), 'w') as f:
+            json.dump({eks.TokenCache.key('dev', 'prod'): {'token': 'k8s-aws-v1.cached', 'expiration': time.time() + 600}}, f)
+
+        script = ("import sys, aws_google_auth\n"
+                  "aws_google_auth.cli(['eks-token', '--cluster', 'prod'])\n"
+                  "print(' '.join(m for m in ('boto3', 'botocore', 'requests', 'bs4', 'keyring') if m in sys.modules))\n")
+        output = subprocess.check_output([sys.executable, '-c', script], env=dict(os.environ)).decode('utf-8').splitlines()
+
+        self.assertEqual('k8s-aws-v1.cached', json.loads(output[0])['status']['token'])
+        self.assertEqual('', output[-1].strip())
@@ -0,0 +1,146 @@
+#!/usr/bin/env python
+
+import os
+import shutil
+import socket
+import tempfile
+import unittest
+
+import requests
+from mock import Mock, patch
+
+from aws_google_auth import configuration
+from aws_google_auth import endpoints
+from aws_google_auth import sts
+
+ROLE = 'arn:aws:iam::123456789012:role/admin'
+PRINCIPAL = 'arn:aws:iam::123456789012:saml-provider/GoogleApps'
+
+RESPONSE = b"""<AssumeRoleWithSAMLResponse xmlns="https://sts.amazonaws.com/doc/2011-06-15/">
+  <AssumeRoleWithSAMLResult>
+    <Credentials>
+      <AccessKeyId>ASIAEXAMPLE</AccessKeyId>
+      <SecretAccessKey>secret</SecretAccessKey>
+      <SessionToken>token</SessionToken>
+      <Expiration>2026-10-19T13:00:00Z</Expiration>
+    </Credentials>
+  </AssumeRoleWithSAMLResult>
+</AssumeRoleWithSAMLResponse>"""
+
+ERROR = b"""<ErrorResponse xmlns="https://sts.amazonaws.com/doc/2011-06-15/">
+  <Error>
+    <Type>Sender</Type>
+    <Code>{}</Code>
+    <Message>{}</Message>
+  </Error>
+</ErrorResponse>"""
+REGION_DISABLED = ERROR.replace(b'{}', b'RegionDisabledException', 1).replace(b'{}', b'STS is not activated in this region', 1)
+VALIDATION_ERROR = ERROR.replace(b'{}', b'ValidationError', 1).replace(b'{}', b'1 validation error detected', 1)
+
+LATENCIES = {'https://sts.us-east-1.amazonaws.com': 0.210,
+             'https://sts.ap-southeast-2.amazonaws.com': 0.015,
+             'https://sts.ap-northeast-1.amazonaws.com': 0.120,
+             'https://sts.eu-west-1.amazonaws.com': None}
+
+
+def http_response(status_code, content, reason='OK'):
+    return Mock(status_code=status_code, content=content, reason=reason)
+
+
+class TestEndpoints(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.directory)
+        self.now = 1500000000.0
+        self.cache = endpoints.EndpointCache(os.path.join(self.directory, 'sts_endpoints.json'), clock=lambda: self.now)
+
+        environ = patch.dict(os.environ, {endpoints.REGIONS_VARIABLE: 'us-east-1, ap-southeast-2,ap-northeast-1,eu-west-1'})
+        environ.start()
+        self.addCleanup(environ.stop)
+        for variable in ('AWS_ENDPOINT_URL', 'AWS_ENDPOINT_URL_STS'):
+            os.environ.pop(variable, None)
+
+        self.probed = []
+        self.config = configuration.Configuration()
+        self.config.region = 'us-east-1'
+        self.config.probe_sts = True
+
+    def probe(self, endpoint):
+        self.probed.append(endpoint)
+        return LATENCIES[endpoint]
+
+    def sts_client(self, network='10.0.0.2'):
+        return endpoints.sts_client(self.config, cache=self.cache, network=network, probe=self.probe)
+
+    def test_fastest_region(self):
+        self.assertEqual(('ap-southeast-2', 0.015), endpoints.fastest_region(endpoints.candidate_regions(), probe=self.probe))
+        self.assertEqual(4, len(self.probed))
+        self.assertEqual((None, None), endpoints.fastest_region(['eu-west-1'], probe=self.probe))
+
+        with patch.dict(os.environ, {endpoints.REGIONS_VARIABLE: ''}):
+            self.assertEqual(list(endpoints.CANDIDATE_REGIONS), endpoints.candidate_regions())
+
+    def test_choice_is_cached_per_network(self):
+        client = self.sts_client()
+        self.assertIsInstance(client, endpoints.ProbedSTSClient)
+        self.assertEqual('https://sts.ap-southeast-2.amazonaws.com', client.endpoint)
+        self.assertEqual(4, len(self.probed))
+
+        self.assertEqual('https://sts.ap-southeast-2.amazonaws.com', self.sts_client().endpoint)
+        self.assertEqual(4, len(self.probed))
+
+        # Another network is probed on its own, and so is a stale entry
+        self.sts_client(network='192.168.1.7')
+        self.assertEqual(8, len(self.probed))
+        self.now += endpoints.CACHE_TTL
+        self.sts_client()
+        self.assertEqual(12, len(self.probed))
+
+    def test_global_endpoint_when_nothing_answers(self):
+        with patch.dict(os.environ, {endpoints.REGIONS_VARIABLE: 'eu-west-1'}):
+            self.assertEqual(sts.GLOBAL_ENDPOINT, self.sts_client().endpoint)
+            self.assertEqual((True, None), self.cache.get('10.0.0.2'))
+
+    def test_no_probing(self):
+        self.config.probe_sts = False
+        self.assertEqual('https://sts.us-east-1.amazonaws.com', self.sts_client().endpoint)
+
+        # An endpoint set in the environment wins
+        self.config.probe_sts = True
+        with patch.dict(os.environ, {'AWS_ENDPOINT_URL_STS': 'http://localhost:4566'}):
+            self.assertEqual('http://localhost:4566', self.sts_client().endpoint)
+        self.assertEqual([], self.probed)
+
+    def test_fall_back_to_the_global_endpoint(self):
+        for failure in [http_response(403, REGION_DISABLED, 'Forbidden'), requests.exceptions.ConnectionError('unreachable')]:
+            self.cache.forget('10.0.0.2')
+            client = self.sts_client()
+            client.session = Mock()
+            client.session.post.side_effect = [failure, http_response(200, RESPONSE)]
+
+            response = client.assume_role_with_saml(RoleArn=ROLE, PrincipalArn=PRINCIPAL, SAMLAssertion='c2FtbA==')
+            self.assertEqual('ASIAEXAMPLE', response['Credentials']['AccessKeyId'])
+            self.assertEqual([sts.GLOBAL_ENDPOINT, sts.GLOBAL_ENDPOINT],
+                             [client.endpoint, client.session.post.call_args[0][0]])
+            # The network is probed again next time
+            self.assertEqual((False, None), self.cache.get('10.0.0.2'))
+
+        # Other errors are the caller's to handle
+        client = self.sts_client()
+        client.session = Mock()
+        client.session.post.return_value = http_response(400, VALIDATION_ERROR, 'Bad Request')
+        with self.assertRaises(sts.ClientError):
+            client.assume_role_with_saml(RoleArn=ROLE, PrincipalArn=PRINCIPAL, SAMLAssertion='c2FtbA==')
+        self.assertEqual(1, client.session.post.call_count)
+
+    def test_probe(self):
+        server = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        server.bind(('127.0.0.1', 0))
+        server.listen(5)
+        port = server.getsockname()[1]
+        try:
+            self.assertLess(endpoints.probe('http://127.0.0.1:{}'.format(port)), endpoints.PROBE_TIMEOUT)
+        finally:
+            server.close()
+        self.assertIsNone(endpoints.probe('http://127.0.0.1:{}'.format(port)))
@@ -0,0 +1,113 @@
+#!/usr/bin/env python
+
+import os
+import sys
+from datetime import datetime, timedelta
+
+from dateutil.tz import tzutc
+from mock import Mock, patch
+
+from aws_google_auth import configuration
+from aws_google_auth import credentials
+from aws_google_auth import execute
+from aws_google_auth.tests import helpers
+
+
+class TestExecute(helpers.ProfileTestCase):
+
+    def read_local_file(self, filename):
+        here = os.path.abspath(os.path.dirname(__file__))
+        with open(os.path.join(here, filename)) as fp:
+            return fp.read().encode('utf-8')
+
+    def setUp(self):
+        super(TestExecute, self).setUp()
+        self.expiration = datetime.now(tzutc()) + timedelta(hours=1)
+        self.patch_get_credentials(helpers.fresh_credentials(self.expiration))
+
+    def write_credentials(self, expiration):
+        with open(self.credentials_file, 'w') as f:
+            f.write('[dev]\naws_access_key_id = ASIASTORED\naws_secret_access_key = secret\n'
+                    'aws_session_token = token\naws_session_expiration = {}\n'.format(
+                        expiration.strftime(credentials.EXPIRATION_FORMAT)))
+
+    def run_command(self, *args):
+        check = "import os, sys; sys.exit('AWS_PROFILE' in os.environ and 9 or 3)"
+        with self.assertRaises(SystemExit) as exit:
+            execute.main(list(args) + ['--', sys.executable, '-c', check])
+        return exit.exception.code
+
+    def test_parse_args(self):
+        args = execute.parse_args(['-p', 'dev', '--', 'aws', 's3', 'ls', '--recursive'])
+        self.assertEqual('dev', args.profile)
+        self.assertEqual(['aws', 's3', 'ls', '--recursive'], args.command)
+
+    def test_stored_credentials_are_reused(self):
+        self.write_credentials(self.expiration)
+
+        # The exit code of the command is passed on; AWS_PROFILE is not set for it
+        self.assertEqual(3, self.run_command())
+        self.assertFalse(self.get_credentials.called)
+
+    def test_stale_credentials_are_not_written(self):
+        self.write_credentials(datetime.now(tzutc()) + timedelta(minutes=2))
+        with open(self.credentials_file) as f:
+            before = f.read()
+
+        with open(os.path.join(self.directory, 'saml_cache_idp.xml'), 'wb') as f:
+            f.write(self.read_local_file('saml-response-no-expire.xml'))
+
+        with patch('aws_google_auth.configuration.Configuration.write') as write:
+            self.assertEqual(3, self.run_command('--min-remaining', '300'))
+
+        self.assertTrue(self.get_credentials.called)
+        self.assertFalse(write.called)
+        with open(self.credentials_file) as f:
+            self.assertEqual(before, f.read())
+        self.assertEqual([], [name for name in os.listdir(self.directory) if name.endswith('.lock')])
+
+    def test_other_role_does_not_reuse_stored_credentials(self):
+        self.write_credentials(self.expiration)
+        config = Mock()
+        config.role_arn = 'arn:aws:iam::123456789012:role/other'
+        config.saml_cache = b'<xml/>'
+
+        execute.resolve_credentials(config, 300, reuse_stored=False)
+
+        self.get_credentials.assert_called_once_with(config)
+
+    def test_login_when_saml_cache_expired(self):
+        config = Mock()
+        config.saml_cache = None
+        login = Mock()
+
+        execute.resolve_credentials(config, 300, reuse_stored=False, login=login)
+
+        login.assert_called_once_with(config)
+        config.write_saml_cache.assert_called_once_with(lock=False)
+
+    def test_new_saml_assertion_is_saved(self):
+        login = Mock(side_effect=lambda config: setattr(config, 'saml_cache', self.read_local_file('saml-response-no-expire.xml')))
+
+        for _ in range(2):
+            config = configuration.Configuration()
+            config.read('dev')
+            execute.resolve_credentials(config, 300, reuse_stored=False, login=login)
+
+        self.assertEqual(1, login.call_count)
+        self.assertEqual(2, self.get_credentials.call_count)
+        with open(self.credentials_file) as f:
+            self.assertEqual('', f.read())
+        # Written without taking the cache's lock
+        self.assertTrue(os.path.exists(config.saml_cache_file))
+        self.assertEqual([], [name for name in os.listdir(self.directory) if name.endswith('.lock')])
+
+    def test_child_environment(self):
+        creds = self.get_credentials.return_value
+        env = execute.child_environment(creds, 'eu-west-1', {'AWS_PROFILE': 'dev', 'PATH': '/bin'})
+
+        self.assertNotIn('AWS_PROFILE', env)
+        self.assertEqual('/bin', env['PATH'])
+        self.assertEqual('ASIAFRESH', env['AWS_ACCESS_KEY_ID'])
+        self.assertEqual('token', env['AWS_SESSION_TOKEN'])
+        self.assertEqual('eu-west-1', env['AWS_DEFAULT_REGION'])
@@ -8,7 +8,9 @@ import base64
 
 from bs4 import BeautifulSoup
 
+import requests
 from mock import Mock
+from aws_google_auth import errors
 from aws_google_auth import google
 
 
@@ -24,6 +26,17 @@ class TestGoogle(unittest.TestCase):
         with self.assertRaises(ValueError):
             google.Google.check_extra_step(response)
 
+    def test_network_errors(self):
+        undertest = google.Google(Mock(), save_failure=False)
+        undertest.session = Mock()
+        undertest.session.get.side_effect = requests.exceptions.ConnectionError('refused')
+        undertest.session.post.side_effect = requests.exceptions.Timeout('timed out')
+
+        with self.assertRaises(errors.NetworkError):
+            undertest.get('https://accounts.google.com/ServiceLogin')
+        with self.assertRaises(errors.NetworkError):
+            undertest.post('https://accounts.google.com/signin/challenge/sl/password', data={})
+
     def test_find_keyhandles(self):
         challenges_txt = "RFVNTVlDSEFMTEVOR0U="
 
@@ -48,6 +61,24 @@ class TestGoogle(unittest.TestCase):
             keyHandles,
         )
 
+    def test_find_keyhandles_unknown_payload_shape(self):
+        challenge = base64.urlsafe_b64encode(base64.b64decode("RFVNTVlDSEFMTEVOR0U="))
+        payload = {"1010": [2, True],
+                   "6000": [None, "https://accounts.google.com/signin/challenge/sk/5", "not base64!",
+                            {"handles": ["S0VZSEFORExFMQ==", "RFVNTVlDSEFMTEVOR0U="]}, [["S0VZSEFORExFMg=="]]]}
+
+        self.assertEqual([b"S0VZSEFORExFMQ==", b"S0VZSEFORExFMg=="],
+                         google.Google.find_key_handles(payload, challenge))
+
+    def test_find_keyhandles_url_safe(self):
+        challenge = base64.urlsafe_b64encode(base64.b64decode("RFVNTVlDSEFMTEVOR0U="))
+        payload = json.loads("""{"5010":[null,null,null,"https://accounts.google.com/signin/challenge/sk/5",null,
+            ["google.com","RFVNTVlDSEFMTEVOR0U\\u003d",[[2,"-_-_S0VZ",[1]],[2,"S0VZ-_8",[1,2]],[2,"S0VZSEFORExFMQ\\u003d\\u003d",[1]]],
+             "{\\"appid\\":\\"https://www.gstatic.com/securitykey/origins.json\\"}"]]}""")
+
+        self.assertEqual([b"-_-_S0VZ", b"S0VZ-_8=", b"S0VZSEFORExFMQ=="],
+                         google.Google.find_key_handles(payload, challenge))
+
     def test_parse_saml_without_login(self):
 
         mock_config = Mock()
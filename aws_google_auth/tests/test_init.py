@@ -1,9 +1,17 @@
+import json
 import unittest
 from argparse import Namespace
+from datetime import datetime
 
-from mock import call, patch, Mock, MagicMock
+from dateutil.tz import tzutc
+from mock import ANY, call, patch, Mock, MagicMock
+from six import StringIO
 
 import aws_google_auth
+# aws_google_auth imports these lazily; import them so they can be patched
+from aws_google_auth import amazon, sts, util  # noqa: F401
+from aws_google_auth import errors
+from aws_google_auth.google import ExpectedGoogleException
 
 
 class TestInit(unittest.TestCase):
@@ -32,6 +40,7 @@ class TestInit(unittest.TestCase):
 
         # Create a mock config to be returned from the resolve_config function
         mock_config = Mock()
+        mock_config.chain_roles = {}
         # Inject the mock as the return value from the function
         aws_google_auth.resolve_config.return_value = mock_config
 
@@ -46,6 +55,8 @@ class TestInit(unittest.TestCase):
 
         self.assertEqual([call(Namespace(ask_role=False,
                                          keyring=False,
+                                         totp_keyring=False,
+                                         probe_sts=False,
                                          disable_u2f=False,
                                          duration=None,
                                          auto_duration=False,
@@ -63,13 +74,21 @@ class TestInit(unittest.TestCase):
                                          print_creds=False,
                                          username=None,
                                          quiet=False,
+                                         non_interactive=False,
                                          bg_response=None,
-                                         account=None))
+                                         account=None,
+                                         timings=None,
+                                         metrics=None,
+                                         alias_role=None,
+                                         chain_role=None,
+                                         alias_file=None))
                           ],
                          resolve_config.mock_calls)
 
         self.assertEqual([call(Namespace(ask_role=False,
                                          keyring=False,
+                                         totp_keyring=False,
+                                         probe_sts=False,
                                          disable_u2f=False,
                                          duration=None,
                                          auto_duration=False,
@@ -87,21 +106,101 @@ class TestInit(unittest.TestCase):
                                          print_creds=False,
                                          username=None,
                                          quiet=False,
+                                         non_interactive=False,
                                          bg_response=None,
-                                         account=None),
-                               mock_config)
+                                         account=None,
+                                         timings=None,
+                                         metrics=None,
+                                         alias_role=None,
+                                         chain_role=None,
+                                         alias_file=None),
+                               mock_config,
+                               ANY)
                           ],
                          process_auth.mock_calls)
 
+    @patch('aws_google_auth.exit_if_unsupported_python', spec=True)
+    @patch('aws_google_auth.resolve_config', spec=True)
+    @patch('aws_google_auth.process_auth', spec=True)
+    def test_non_interactive_results(self, process_auth, resolve_config, exit_if_unsupported_python):
+        resolve_config.return_value = Mock(profile='dev', role_arn='arn:aws:iam::123456789012:role/admin')
+        process_auth.return_value = Mock(expiration=datetime(2026, 10, 19, 13, 0, 0, tzinfo=tzutc()))
+
+        with patch('sys.stdout', new_callable=StringIO) as stdout:
+            aws_google_auth.cli(['--non-interactive'])
+        self.assertEqual({'status': 'ok',
+                          'exit_code': 0,
+                          'profile': 'dev',
+                          'role_arn': 'arn:aws:iam::123456789012:role/admin',
+                          'expiration': '2026-10-19T13:00:00+00:00'},
+                         json.loads(stdout.getvalue()))
+
+        for error, exit_code, kind in [(errors.LoginRequired('no password'), 4, 'cache_miss'),
+                                       (errors.MFARequired('sk'), 5, 'mfa_required'),
+                                       (errors.CaptchaRequired('captcha'), 6, 'captcha'),
+                                       (errors.STSThrottled('slow down'), 7, 'sts_throttled'),
+                                       (errors.NetworkError('refused'), 8, 'network_error'),
+                                       (ExpectedGoogleException('Invalid username or password'), 1, 'error'),
+                                       (RuntimeError('bug'), 1, 'unexpected')]:
+            process_auth.side_effect = error
+            with patch('sys.stdout', new_callable=StringIO) as stdout, \
+                    patch('logging.exception'), \
+                    self.assertRaises(SystemExit) as context:
+                aws_google_auth.cli(['--non-interactive'])
+
+            self.assertEqual(exit_code, context.exception.code)
+            self.assertEqual({'status': 'error', 'exit_code': exit_code, 'error': kind, 'message': str(error)},
+                             json.loads(stdout.getvalue()))
+
+    @patch('keyring.get_password', return_value=None)
+    @patch('aws_google_auth.sts.STSClient')
+    @patch('aws_google_auth.google', spec=True)
+    def test_process_auth_non_interactive_without_password(self, mock_google, mock_sts_client, mock_get_password):
+        mock_config = Mock(saml_cache=None, keyring=True, totp_keyring=False, chain_roles={}, resolve_aliases=False,
+                           username='user@example.com', idp_id='C01abc23d', sp_id='123456789012',
+                           region='ap-southeast-2', profile='dev')
+
+        with self.assertRaises(errors.LoginRequired):
+            aws_google_auth.process_auth(aws_google_auth.parse_args(['--non-interactive']), mock_config)
+
+        mock_get_password.assert_called_once_with('aws-google-auth', 'user@example.com')
+
+    @patch('aws_google_auth.util.Background')
+    @patch('aws_google_auth.google', spec=True)
+    def test_process_auth_validates_before_connecting(self, mock_google, mock_background):
+        mock_config = Mock(saml_cache=None, keyring=False, totp_keyring=False, username='user@example.com',
+                           idp_id='C01abc23d', sp_id='123456789012', region='ap-southeast-2')
+        mock_config.raise_if_invalid.side_effect = AssertionError('Expected duration to be an integer.')
+
+        with self.assertRaises(AssertionError):
+            aws_google_auth.process_auth(aws_google_auth.parse_args([]), mock_config)
+
+        self.assertFalse(mock_google.Google.called)
+        self.assertFalse(mock_background.called)
+
+    @patch('aws_google_auth.resolve_config', spec=True)
+    @patch('aws_google_auth.process_auth', spec=True)
+    def test_command_dispatch(self, process_auth, resolve_config):
+        command = Mock()
+        with patch.dict(aws_google_auth.COMMANDS, {'scheduler': command}):
+            aws_google_auth.cli(['scheduler', '--once', 'dev'])
+
+        self.assertEqual([call(['--once', 'dev'])], command.mock_calls)
+        self.assertFalse(resolve_config.called)
+        self.assertFalse(process_auth.called)
+
     @patch('aws_google_auth.util', spec=True)
     @patch('aws_google_auth.amazon', spec=True)
     @patch('aws_google_auth.google', spec=True)
     def test_process_auth_standard(self, mock_google, mock_amazon, mock_util):
 
         mock_config = Mock()
+        mock_config.chain_roles = {}
         mock_config.profile = False
         mock_config.saml_cache = False
         mock_config.keyring = False
+        mock_config.totp_keyring = False
+        mock_config.probe_sts = False
         mock_config.username = None
         mock_config.idp_id = None
         mock_config.sp_id = None
@@ -144,19 +243,22 @@ class TestInit(unittest.TestCase):
         self.assertEqual(mock_config.role_arn, "da_role")
 
         # Assert calls occur
-        self.assertEqual([call.Util.get_input('AWS Region: '),
-                          call.Util.get_input('Google username: '),
-                          call.Util.get_input('Google IDP ID: '),
-                          call.Util.get_input('Google SP ID: '),
-                          call.Util.get_password('Google Password: '),
+        self.assertEqual([call.Util.get_input('AWS Region: ', True),
+                          call.Util.get_input('Google username: ', True),
+                          call.Util.get_input('Google IDP ID: ', True),
+                          call.Util.get_input('Google SP ID: ', True),
+                          call.Background(ANY, mock_config),
+                          call.Background(ANY, 'boto3'),
+                          call.Util.get_password('Google Password: ', True),
+                          call.Background().result(),
                           call.Util.pick_a_role({'arn:aws:iam::123456789012:role/read-only': 'arn:aws:iam::123456789012:saml-provider/GoogleApps',
-                                                'arn:aws:iam::123456789012:role/admin': 'arn:aws:iam::123456789012:saml-provider/GoogleApps'}, [])],
+                                                'arn:aws:iam::123456789012:role/admin': 'arn:aws:iam::123456789012:saml-provider/GoogleApps'}, [], history=ANY, interactive=True)],
                          mock_util.mock_calls)
 
-        self.assertEqual([call.do_login(), call.parse_saml()],
+        self.assertEqual([call.prefetch(), call.do_login(), call.parse_saml()],
                          mock_google_client.mock_calls)
 
-        self.assertEqual([call.raise_if_invalid()],
+        self.assertEqual([call.raise_if_invalid(), call.raise_if_invalid()],
                          mock_config.mock_calls)
 
         self.assertEqual([call({'arn:aws:iam::123456789012:role/read-only': 'arn:aws:iam::123456789012:saml-provider/GoogleApps',
@@ -165,7 +267,7 @@ class TestInit(unittest.TestCase):
                          mock_amazon_client.resolve_aws_aliases.mock_calls)
 
         self.assertEqual([call({'arn:aws:iam::123456789012:role/read-only': 'arn:aws:iam::123456789012:saml-provider/GoogleApps',
-                                'arn:aws:iam::123456789012:role/admin': 'arn:aws:iam::123456789012:saml-provider/GoogleApps'}, [])
+                                'arn:aws:iam::123456789012:role/admin': 'arn:aws:iam::123456789012:saml-provider/GoogleApps'}, [], history=ANY, interactive=True)
                           ], mock_util_obj.pick_a_role.mock_calls)
 
     @patch('aws_google_auth.util', spec=True)
@@ -173,12 +275,16 @@ class TestInit(unittest.TestCase):
     @patch('aws_google_auth.google', spec=True)
     def test_process_auth_print_creds(self, mock_google, mock_amazon, mock_util):
         mock_config = Mock()
+        mock_config.chain_roles = {}
         mock_config.profile = False
         mock_config.saml_cache = False
         mock_config.keyring = False
+        mock_config.totp_keyring = False
+        mock_config.probe_sts = False
         mock_config.username = None
         mock_config.idp_id = None
         mock_config.sp_id = None
+        mock_config.region = 'ap-southeast-2'
         mock_config.return_value = None
         mock_config.print_creds = True
         mock_config.account = None
@@ -218,19 +324,22 @@ class TestInit(unittest.TestCase):
         self.assertEqual(mock_config.role_arn, "da_role")
 
         # Assert calls occur
-        self.assertEqual([call.Util.get_input('Google username: '),
-                          call.Util.get_input('Google IDP ID: '),
-                          call.Util.get_input('Google SP ID: '),
-                          call.Util.get_password('Google Password: '),
+        self.assertEqual([call.Util.get_input('Google username: ', True),
+                          call.Util.get_input('Google IDP ID: ', True),
+                          call.Util.get_input('Google SP ID: ', True),
+                          call.Background(ANY, mock_config),
+                          call.Background(ANY, 'boto3'),
+                          call.Util.get_password('Google Password: ', True),
+                          call.Background().result(),
                           call.Util.pick_a_role({'arn:aws:iam::123456789012:role/read-only': 'arn:aws:iam::123456789012:saml-provider/GoogleApps',
                                                 'arn:aws:iam::123456789012:role/admin': 'arn:aws:iam::123456789012:saml-provider/GoogleApps'},
-                                                [])],
+                                                [], history=ANY, interactive=True)],
                          mock_util.mock_calls)
 
-        self.assertEqual([call.do_login(), call.parse_saml()],
+        self.assertEqual([call.prefetch(), call.do_login(), call.parse_saml()],
                          mock_google_client.mock_calls)
 
-        self.assertEqual([call.raise_if_invalid()],
+        self.assertEqual([call.raise_if_invalid(), call.raise_if_invalid()],
                          mock_config.mock_calls)
 
         self.assertEqual(
@@ -241,7 +350,7 @@ class TestInit(unittest.TestCase):
 
         self.assertEqual(
             [call({'arn:aws:iam::123456789012:role/read-only': 'arn:aws:iam::123456789012:saml-provider/GoogleApps',
-                   'arn:aws:iam::123456789012:role/admin': 'arn:aws:iam::123456789012:saml-provider/GoogleApps'}, [])
+                   'arn:aws:iam::123456789012:role/admin': 'arn:aws:iam::123456789012:saml-provider/GoogleApps'}, [], history=ANY, interactive=True)
              ], mock_util_obj.pick_a_role.mock_calls)
 
         self.assertEqual([call()],
@@ -253,11 +362,15 @@ class TestInit(unittest.TestCase):
     def test_process_auth_specified_role(self, mock_google, mock_amazon, mock_util):
 
         mock_config = Mock()
+        mock_config.chain_roles = {}
         mock_config.saml_cache = False
         mock_config.keyring = False
+        mock_config.totp_keyring = False
+        mock_config.probe_sts = False
         mock_config.username = None
         mock_config.idp_id = None
         mock_config.sp_id = None
+        mock_config.region = 'ap-southeast-2'
         mock_config.return_value = None
 
         mock_config.role_arn = 'arn:aws:iam::123456789012:role/admin'
@@ -297,17 +410,21 @@ class TestInit(unittest.TestCase):
         self.assertEqual(mock_config.role_arn, "arn:aws:iam::123456789012:role/admin")
 
         # Assert calls occur
-        self.assertEqual([call.Util.get_input('Google username: '),
-                          call.Util.get_input('Google IDP ID: '),
-                          call.Util.get_input('Google SP ID: '),
-                          call.Util.get_password('Google Password: ')],
+        self.assertEqual([call.Util.get_input('Google username: ', True),
+                          call.Util.get_input('Google IDP ID: ', True),
+                          call.Util.get_input('Google SP ID: ', True),
+                          call.Background(ANY, mock_config),
+                          call.Background(ANY, 'boto3'),
+                          call.Util.get_password('Google Password: ', True),
+                          call.Background().result()],
                          mock_util.mock_calls)
 
-        self.assertEqual([call.do_login(), call.parse_saml()],
+        self.assertEqual([call.prefetch(), call.do_login(), call.parse_saml()],
                          mock_google_client.mock_calls)
 
         self.assertEqual([call.raise_if_invalid(),
-                          call.write(mock_amazon_client)],
+                          call.raise_if_invalid(),
+                          call.write(mock_amazon_client, {})],
                          mock_config.mock_calls)
 
         self.assertEqual([],
@@ -322,13 +439,17 @@ class TestInit(unittest.TestCase):
     def test_process_auth_dont_resolve_alias(self, mock_google, mock_amazon, mock_util):
 
         mock_config = Mock()
+        mock_config.chain_roles = {}
         mock_config.saml_cache = False
         mock_config.resolve_aliases = False
         mock_config.username = None
         mock_config.idp_id = None
         mock_config.sp_id = None
+        mock_config.region = 'ap-southeast-2'
         mock_config.return_value = None
         mock_config.keyring = False
+        mock_config.totp_keyring = False
+        mock_config.probe_sts = False
         mock_config.account = None
 
         mock_amazon_client = Mock()
@@ -366,40 +487,83 @@ class TestInit(unittest.TestCase):
         self.assertEqual(mock_config.account, None)
 
         # Assert calls occur
-        self.assertEqual([call.Util.get_input('Google username: '),
-                          call.Util.get_input('Google IDP ID: '),
-                          call.Util.get_input('Google SP ID: '),
-                          call.Util.get_password('Google Password: '),
+        self.assertEqual([call.Util.get_input('Google username: ', True),
+                          call.Util.get_input('Google IDP ID: ', True),
+                          call.Util.get_input('Google SP ID: ', True),
+                          call.Background(ANY, mock_config),
+                          call.Util.get_password('Google Password: ', True),
+                          call.Background().result(),
                           call.Util.pick_a_role({'arn:aws:iam::123456789012:role/read-only': 'arn:aws:iam::123456789012:saml-provider/GoogleApps',
-                                                'arn:aws:iam::123456789012:role/admin': 'arn:aws:iam::123456789012:saml-provider/GoogleApps'})],
+                                                'arn:aws:iam::123456789012:role/admin': 'arn:aws:iam::123456789012:saml-provider/GoogleApps'}, history=ANY, interactive=True)],
                          mock_util.mock_calls)
 
-        self.assertEqual([call.do_login(), call.parse_saml()],
+        self.assertEqual([call.prefetch(), call.do_login(), call.parse_saml()],
                          mock_google_client.mock_calls)
 
         self.assertEqual([call.raise_if_invalid(),
-                          call.write(mock_amazon_client)],
+                          call.raise_if_invalid(),
+                          call.write(mock_amazon_client, {})],
                          mock_config.mock_calls)
 
         self.assertEqual([],
                          mock_amazon_client.resolve_aws_aliases.mock_calls)
 
         self.assertEqual([call({'arn:aws:iam::123456789012:role/read-only': 'arn:aws:iam::123456789012:saml-provider/GoogleApps',
-                                'arn:aws:iam::123456789012:role/admin': 'arn:aws:iam::123456789012:saml-provider/GoogleApps'})
+                                'arn:aws:iam::123456789012:role/admin': 'arn:aws:iam::123456789012:saml-provider/GoogleApps'}, history=ANY, interactive=True)
                           ], mock_util_obj.pick_a_role.mock_calls)
 
+    @patch('aws_google_auth.util', spec=True)
+    @patch('aws_google_auth.amazon', spec=True)
+    @patch('aws_google_auth.google', spec=True)
+    def test_process_auth_filters_account_before_resolving_aliases(self, mock_google, mock_amazon, mock_util):
+
+        mock_config = Mock()
+        mock_config.chain_roles = {}
+        mock_config.saml_cache = b'<xml/>'
+        mock_config.role_arn = None
+        mock_config.account = '123456789012'
+        mock_config.resolve_aliases = True
+        mock_config.quiet = True
+        mock_config.print_creds = False
+
+        mock_amazon_client = Mock()
+        mock_amazon_client.roles = {
+            'arn:aws:iam::123456789012:role/admin': 'arn:aws:iam::123456789012:saml-provider/GoogleApps',
+            'arn:aws:iam::210987654321:role/admin': 'arn:aws:iam::210987654321:saml-provider/GoogleApps'
+        }
+        mock_amazon_client.resolve_aws_aliases = MagicMock(return_value={'123456789012': 'my-account'})
+        mock_amazon.Amazon = MagicMock(return_value=mock_amazon_client)
+        mock_util.Util.pick_a_role = MagicMock(return_value=("da_role", "da_provider"))
+
+        aws_google_auth.process_auth(aws_google_auth.parse_args([]), mock_config)
+
+        self.assertEqual([call({'arn:aws:iam::123456789012:role/admin': 'arn:aws:iam::123456789012:saml-provider/GoogleApps'})],
+                         mock_amazon_client.resolve_aws_aliases.mock_calls)
+        self.assertEqual([call({'arn:aws:iam::123456789012:role/admin': 'arn:aws:iam::123456789012:saml-provider/GoogleApps'},
+                               {'123456789012': 'my-account'}, '123456789012', history=ANY, interactive=True)],
+                         mock_util.Util.pick_a_role.mock_calls)
+
+        mock_config.account = '999999999999'
+        mock_google.ExpectedGoogleException = ExpectedGoogleException
+        with self.assertRaises(ExpectedGoogleException):
+            aws_google_auth.process_auth(aws_google_auth.parse_args([]), mock_config)
+
     @patch('aws_google_auth.util', spec=True)
     @patch('aws_google_auth.amazon', spec=True)
     @patch('aws_google_auth.google', spec=True)
     def test_process_auth_with_profile(self, mock_google, mock_amazon, mock_util):
 
         mock_config = Mock()
+        mock_config.chain_roles = {}
         mock_config.saml_cache = False
         mock_config.keyring = False
+        mock_config.totp_keyring = False
+        mock_config.probe_sts = False
         mock_config.username = None
         mock_config.idp_id = None
         mock_config.sp_id = None
         mock_config.profile = "blart"
+        mock_config.region = 'ap-southeast-2'
         mock_config.return_value = None
         mock_config.role_arn = 'arn:aws:iam::123456789012:role/admin'
         mock_config.account = None
@@ -438,19 +602,23 @@ class TestInit(unittest.TestCase):
         self.assertEqual(mock_config.role_arn, "da_role")
 
         # Assert calls occur
-        self.assertEqual([call.Util.get_input('Google username: '),
-                          call.Util.get_input('Google IDP ID: '),
-                          call.Util.get_input('Google SP ID: '),
-                          call.Util.get_password('Google Password: '),
+        self.assertEqual([call.Util.get_input('Google username: ', True),
+                          call.Util.get_input('Google IDP ID: ', True),
+                          call.Util.get_input('Google SP ID: ', True),
+                          call.Background(ANY, mock_config),
+                          call.Background(ANY, 'boto3'),
+                          call.Util.get_password('Google Password: ', True),
+                          call.Background().result(),
                           call.Util.pick_a_role({'arn:aws:iam::123456789012:role/read-only': 'arn:aws:iam::123456789012:saml-provider/GoogleApps',
-                                                'arn:aws:iam::123456789012:role/admin': 'arn:aws:iam::123456789012:saml-provider/GoogleApps'}, [])],
+                                                'arn:aws:iam::123456789012:role/admin': 'arn:aws:iam::123456789012:saml-provider/GoogleApps'}, [], history=ANY, interactive=True)],
                          mock_util.mock_calls)
 
-        self.assertEqual([call.do_login(), call.parse_saml()],
+        self.assertEqual([call.prefetch(), call.do_login(), call.parse_saml()],
                          mock_google_client.mock_calls)
 
         self.assertEqual([call.raise_if_invalid(),
-                          call.write(mock_amazon_client)],
+                          call.raise_if_invalid(),
+                          call.write(mock_amazon_client, {})],
                          mock_config.mock_calls)
 
         self.assertEqual([call({'arn:aws:iam::123456789012:role/read-only': 'arn:aws:iam::123456789012:saml-provider/GoogleApps',
@@ -459,7 +627,7 @@ class TestInit(unittest.TestCase):
                          mock_amazon_client.resolve_aws_aliases.mock_calls)
 
         self.assertEqual([call({'arn:aws:iam::123456789012:role/read-only': 'arn:aws:iam::123456789012:saml-provider/GoogleApps',
-                                'arn:aws:iam::123456789012:role/admin': 'arn:aws:iam::123456789012:saml-provider/GoogleApps'}, [])
+                                'arn:aws:iam::123456789012:role/admin': 'arn:aws:iam::123456789012:saml-provider/GoogleApps'}, [], history=ANY, interactive=True)
                           ], mock_util_obj.pick_a_role.mock_calls)
 
     @patch('aws_google_auth.util', spec=True)
@@ -468,6 +636,7 @@ class TestInit(unittest.TestCase):
     def test_process_auth_with_saml_cache(self, mock_google, mock_amazon, mock_util):
 
         mock_config = Mock()
+        mock_config.chain_roles = {}
         mock_config.saml_cache = True
         mock_config.username = None
         mock_config.idp_id = None
@@ -512,14 +681,14 @@ class TestInit(unittest.TestCase):
 
         # Assert calls occur
         self.assertEqual([call.Util.pick_a_role({'arn:aws:iam::123456789012:role/read-only': 'arn:aws:iam::123456789012:saml-provider/GoogleApps',
-                                                'arn:aws:iam::123456789012:role/admin': 'arn:aws:iam::123456789012:saml-provider/GoogleApps'}, [])],
+                                                'arn:aws:iam::123456789012:role/admin': 'arn:aws:iam::123456789012:saml-provider/GoogleApps'}, [], history=ANY, interactive=True)],
                          mock_util.mock_calls)
 
         # Cache means no google calls
         self.assertEqual([],
                          mock_google_client.mock_calls)
 
-        self.assertEqual([call.write(mock_amazon_client)],
+        self.assertEqual([call.write(mock_amazon_client, {})],
                          mock_config.mock_calls)
 
         self.assertEqual([call({'arn:aws:iam::123456789012:role/read-only': 'arn:aws:iam::123456789012:saml-provider/GoogleApps',
@@ -528,5 +697,32 @@ class TestInit(unittest.TestCase):
                          mock_amazon_client.resolve_aws_aliases.mock_calls)
 
         self.assertEqual([call({'arn:aws:iam::123456789012:role/read-only': 'arn:aws:iam::123456789012:saml-provider/GoogleApps',
-                                'arn:aws:iam::123456789012:role/admin': 'arn:aws:iam::123456789012:saml-provider/GoogleApps'}, [])
+                                'arn:aws:iam::123456789012:role/admin': 'arn:aws:iam::123456789012:saml-provider/GoogleApps'}, [], history=ANY, interactive=True)
                           ], mock_util_obj.pick_a_role.mock_calls)
+
+    @patch('aws_google_auth.amazon', spec=True)
+    def test_process_auth_chain_roles_failure(self, mock_amazon):
+        roles = {'deploy': 'arn:aws:iam::210987654321:role/deploy',
+                 'audit': 'arn:aws:iam::345678901234:role/audit'}
+        mock_config = Mock(saml_cache=b'<xml/>', chain_roles=roles, role_arn='arn:aws:iam::123456789012:role/admin',
+                           ask_role=False, quiet=True, print_creds=False, profile='hub', region='ap-southeast-2')
+
+        mock_amazon_client = Mock()
+        mock_amazon_client.roles = {'arn:aws:iam::123456789012:role/admin': 'arn:aws:iam::123456789012:saml-provider/GoogleApps'}
+        chained = {'deploy': Mock(role_arn=roles['deploy'])}
+        mock_amazon_client.assume_chained_roles.return_value = (chained, {'audit': IOError('unreachable')})
+        mock_amazon.Amazon = MagicMock(return_value=mock_amazon_client)
+
+        with self.assertRaises(ExpectedGoogleException) as context:
+            aws_google_auth.process_auth(aws_google_auth.parse_args([]), mock_config)
+        self.assertEqual('Could not assume chained roles: audit (arn:aws:iam::345678901234:role/audit): unreachable',
+                         str(context.exception))
+
+        # The roles that could be assumed were written first
+        mock_amazon_client.assume_chained_roles.assert_called_once_with(roles)
+        mock_config.write.assert_called_once_with(mock_amazon_client, chained)
+
+        # Nothing but throttling is reported as such
+        mock_amazon_client.assume_chained_roles.return_value = (chained, {'audit': errors.STSThrottled('slow down')})
+        with self.assertRaises(errors.STSThrottled):
+            aws_google_auth.process_auth(aws_google_auth.parse_args([]), mock_config)
@@ -0,0 +1,115 @@
+#!/usr/bin/env python
+
+import json
+import os
+import shutil
+import socket
+import tempfile
+import unittest
+
+from botocore.exceptions import ClientError
+from mock import Mock, PropertyMock, call, patch
+
+from aws_google_auth import amazon
+from aws_google_auth import errors
+from aws_google_auth import metrics
+from aws_google_auth import timings
+
+
+class TestMetrics(unittest.TestCase):
+
+    def test_statsd_sink(self):
+        server = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        server.bind(('127.0.0.1', 0))
+        server.settimeout(5)
+        try:
+            sink = metrics.sink_from_url('statsd://127.0.0.1:{}/fleet.auth'.format(server.getsockname()[1]))
+            sink.incr('login.success')
+            sink.timing('sts.assume_role_with_saml', 123.4)
+            sink.close()
+
+            self.assertEqual(b'fleet.auth.login.success:1|c', server.recv(1024))
+            self.assertEqual(b'fleet.auth.sts.assume_role_with_saml:123|ms', server.recv(1024))
+        finally:
+            server.close()
+
+    def test_statsd_sink_unresolvable_host(self):
+        sink = metrics.StatsdSink('host.invalid', 8125)
+        sink.incr('login.success')
+        sink.close()
+
+    def test_file_sink(self):
+        directory = tempfile.mkdtemp()
+        try:
+            path = os.path.join(directory, 'metrics.log')
+            sink = metrics.sink_from_url('file://' + path)
+            sink.incr('saml_cache.hit')
+            sink.timing('config.lock_wait', 1.25)
+            sink.close()
+
+            with open(path) as fp:
+                lines = [json.loads(line) for line in fp]
+
+            self.assertEqual([('c', 'aws_google_auth.saml_cache.hit', 1),
+                              ('ms', 'aws_google_auth.config.lock_wait', 1.2)],
+                             [(line['type'], line['name'], line['value']) for line in lines])
+        finally:
+            shutil.rmtree(directory)
+
+    def test_sink_from_url(self):
+        self.assertIsInstance(metrics.sink_from_url(None), metrics.NullSink)
+        self.assertEqual('aws_google_auth', metrics.sink_from_url('statsd://localhost').prefix)
+
+        # A bad destination disables metrics rather than the login
+        with patch('aws_google_auth.metrics.logging') as logging:
+            self.assertIsInstance(metrics.sink_from_url('http://localhost:8125'), metrics.NullSink)
+            self.assertIsInstance(metrics.sink_from_url('file:///no/such/directory/metrics.log'), metrics.NullSink)
+            self.assertIsInstance(metrics.sink_from_url('statsd://localhost:port'), metrics.NullSink)
+        self.assertEqual(3, logging.warning.call_count)
+
+    def test_file_sink_relative_path(self):
+        directory = tempfile.mkdtemp()
+        cwd = os.getcwd()
+        try:
+            os.chdir(directory)
+            sink = metrics.sink_from_url('file://metrics.log')
+            sink.incr('login.success')
+            sink.close()
+
+            with open(os.path.join(directory, 'metrics.log')) as fp:
+                self.assertEqual('aws_google_auth.login.success', json.loads(fp.readline())['name'])
+        finally:
+            os.chdir(cwd)
+            shutil.rmtree(directory)
+
+    def test_timings_forward_to_sink(self):
+        sink = Mock()
+        run_timings = timings.Timings(sink=sink)
+
+        with run_timings.phase('google login', metric='login.duration'):
+            pass
+        with run_timings.phase('parse saml'):
+            pass
+        run_timings.incr('login.success')
+
+        self.assertEqual([call.timing('login.duration', sink.timing.call_args[0][1]),
+                          call.incr('login.success', 1)],
+                         sink.mock_calls)
+
+    def test_sts_throttling_counted(self):
+        sink = Mock()
+        config = Mock()
+        config.auto_duration = False
+        throttled = ClientError({'Error': {'Code': 'Throttling', 'Message': 'Rate exceeded'}}, 'AssumeRoleWithSAML')
+
+        sts_client = Mock()
+        sts_client.assume_role_with_saml.side_effect = throttled
+
+        undertest = amazon.Amazon(config, b"<xml/>", timings=timings.Timings(sink=sink))
+        with patch.object(amazon.Amazon, 'sts_client', new_callable=PropertyMock, return_value=sts_client):
+            with self.assertRaises(errors.STSThrottled):
+                undertest.assume_role('arn:aws:iam::123456789012:role/admin',
+                                      'arn:aws:iam::123456789012:saml-provider/GoogleApps',
+                                      'c2FtbA==')
+
+        self.assertIn(call.incr('sts.throttled', 1), sink.mock_calls)
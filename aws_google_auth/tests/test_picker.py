@@ -0,0 +1,140 @@
+#!/usr/bin/env python
+
+import os
+import shutil
+import tempfile
+import unittest
+
+from mock import Mock, patch
+
+from aws_google_auth import amazon  # noqa: F401 (patched below)
+from aws_google_auth import picker
+from aws_google_auth import util
+
+PRINCIPAL = 'arn:aws:iam::{}:saml-provider/GoogleApps'
+
+
+def make_roles(accounts, names):
+    return {'arn:aws:iam::{}:role/{}'.format(account, name): PRINCIPAL.format(account)
+            for account in accounts for name in names}
+
+
+class TestPicker(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.history = picker.History(os.path.join(self.directory, 'role_history.json'), size=3)
+
+        # 600 roles: 200 accounts with three roles each
+        self.accounts = ['{:012d}'.format(100000000000 + i) for i in range(200)]
+        self.roles = make_roles(self.accounts, ['admin', 'read-only', 'poweruser'])
+        self.aliases = {account: 'team-{}-{}'.format(i, 'prod' if i % 2 else 'dev') for i, account in enumerate(self.accounts)}
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def test_fuzzy_score(self):
+        self.assertIsNone(picker.fuzzy_score('xyz', '123456789012 team-1-prod admin'))
+        self.assertIsNotNone(picker.fuzzy_score('tpa', 'team-1-prod admin'))
+        # Substrings beat scattered characters
+        self.assertGreater(picker.fuzzy_score('adm', 'team-1-prod admin'),
+                           picker.fuzzy_score('tpa', 'team-1-prod admin'))
+
+    def test_search(self):
+        index = picker.RoleIndex(self.roles, self.aliases)
+
+        self.assertEqual(600, len(index.search('')))
+        results = index.search('team-3- prod adm')
+        self.assertEqual('arn:aws:iam::100000000003:role/admin', results[0].role)
+
+        # Account IDs are searched too
+        self.assertEqual(['admin', 'poweruser', 'read-only'],
+                         sorted(entry.name for entry in index.search('100000000199')))
+
+    def test_search_narrows_previous_results(self):
+        index = picker.RoleIndex(self.roles, self.aliases)
+        index.search('prod')
+
+        with patch('aws_google_auth.picker.fuzzy_score', wraps=picker.fuzzy_score) as score:
+            index.search('prod pow')
+
+        # Only the 300 roles of the prod accounts are looked at again
+        self.assertEqual(600, score.call_count)
+
+    def test_history(self):
+        self.assertEqual([], self.history.load())
+        for role in ['a', 'b', 'c', 'a', 'd']:
+            self.history.record(role)
+        self.assertEqual(['d', 'a', 'c'], self.history.load())
+
+    def test_history_write_interrupted(self):
+        self.history.record('a')
+
+        def crash(roles, f):
+            f.write('["b", ')
+            raise IOError('No space left on device')
+
+        with patch('aws_google_auth.picker.json.dump', side_effect=crash):
+            self.history.record('b')
+        self.assertEqual(['a'], self.history.load())
+        # No temporary file is left behind
+        self.assertEqual([], [name for name in os.listdir(self.directory) if name.startswith('.')])
+
+    def test_recently_used_roles_come_first(self):
+        self.history.record('arn:aws:iam::100000000150:role/read-only')
+        self.history.record('arn:aws:iam::100000000007:role/admin')
+
+        index = picker.RoleIndex(self.roles, self.aliases, self.history)
+
+        self.assertEqual(['arn:aws:iam::100000000007:role/admin', 'arn:aws:iam::100000000150:role/read-only'],
+                         [entry.role for entry in index.entries[:2]])
+
+    @patch('aws_google_auth.util.Util.get_input', spec=True)
+    def test_pick_with_filter_and_pages(self, get_input):
+        get_input.side_effect = ['', '<', 'nope', 'team-42-', 'read', '1']
+
+        role, principal = util.Util.pick_a_role(self.roles, self.aliases, history=self.history)
+
+        self.assertEqual('arn:aws:iam::100000000042:role/read-only', role)
+        self.assertEqual(PRINCIPAL.format('100000000042'), principal)
+        self.assertEqual([role], self.history.load())
+
+    @patch('aws_google_auth.util.Util.get_input', spec=True)
+    def test_pick_by_number(self, get_input):
+        roles = make_roles(['123456789012'], ['admin', 'read-only'])
+        get_input.side_effect = ['3', '/1234', '2']
+
+        role, _ = util.Util.pick_a_role(roles, account='123456789012')
+
+        self.assertEqual('arn:aws:iam::123456789012:role/read-only', role)
+
+    def test_patterns(self):
+        self.assertFalse(picker.is_pattern('arn:aws:iam::123456789012:role/admin'))
+        self.assertFalse(picker.is_pattern(None))
+        self.assertTrue(picker.is_pattern('*:role/admin'))
+        self.assertTrue(picker.is_pattern('/admin$/'))
+
+        self.assertEqual(200, len(picker.match_roles(self.roles, '*:role/admin')))
+        self.assertEqual(['arn:aws:iam::100000000042:role/poweruser'],
+                         list(picker.match_roles(self.roles, '/0042:role/p.*r$/')))
+
+
+class TestRolePattern(unittest.TestCase):
+
+    @patch('aws_google_auth.util', spec=True)
+    @patch('aws_google_auth.amazon', spec=True)
+    def test_single_match_skips_the_prompt(self, mock_amazon, mock_util):
+        import aws_google_auth
+
+        config = Mock()
+        config.saml_cache = b'<xml/>'
+        config.chain_roles = {}
+        config.ask_role = False
+        config.role_arn = '*:role/read-only'
+        mock_amazon.Amazon.return_value.roles = make_roles(['123456789012'], ['admin', 'read-only'])
+
+        aws_google_auth.process_auth(aws_google_auth.parse_args(['-q']), config)
+
+        self.assertEqual('arn:aws:iam::123456789012:role/read-only', config.role_arn)
+        self.assertEqual(PRINCIPAL.format('123456789012'), config.provider)
+        self.assertFalse(mock_util.Util.pick_a_role.called)
@@ -0,0 +1,87 @@
+#!/usr/bin/env python
+
+import json
+import os
+import subprocess
+import sys
+import time
+from datetime import datetime, timedelta
+
+from dateutil.tz import tzutc
+from mock import patch
+
+from aws_google_auth import errors
+from aws_google_auth import process
+from aws_google_auth.tests import helpers
+
+READ_ONLY = 'arn:aws:iam::210987654321:role/read-only'
+
+
+class TestProcess(helpers.ProfileTestCase):
+
+    def setUp(self):
+        super(TestProcess, self).setUp()
+        self.creds = helpers.fresh_credentials(datetime.now(tzutc()).replace(microsecond=0) + timedelta(hours=1),
+                                               role_arn=READ_ONLY)
+        self.patch_get_credentials(self.creds)
+        self.patch_saml_cache()
+
+    def run_main(self, *args):
+        return json.loads(self.printed(process, args)[-1])
+
+    def test_credentials_are_cached(self):
+        output = self.run_main('-p', 'dev', '-r', READ_ONLY)
+        self.assertEqual(self.creds.process_output, output)
+        self.assertEqual(READ_ONLY, self.get_credentials.call_args[0][0].role_arn)
+        self.assertEqual(0o600, os.stat(process.cache_file()).st_mode & 0o777)
+
+        self.assertEqual(output, self.run_main('-p', 'dev', '-r', READ_ONLY))
+        self.assertEqual(1, self.get_credentials.call_count)
+
+        # Another role is cached separately
+        self.run_main('-p', 'dev')
+        self.assertEqual(2, self.get_credentials.call_count)
+
+        # Credentials the SDKs would refresh right away are replaced
+        cache = process.CredentialsCache(process.cache_file(), clock=lambda: time.time() + 3600 - process.MIN_REMAINING)
+        self.assertIsNone(cache.get(process.CredentialsCache.key('dev', READ_ONLY)))
+
+    def test_bad_cache_is_a_miss(self):
+        with open(process.cache_file(), 'w') as f:
+            json.dump({process.CredentialsCache.key('dev', READ_ONLY): {'credentials': {'Version': 1}, 'expiration': 'soon'}}, f)
+        self.assertEqual(self.creds.process_output, self.run_main('-p', 'dev', '-r', READ_ONLY))
+
+    @patch('aws_google_auth.credentials.interactive_login', spec=True)
+    def test_expired_assertion(self, interactive_login):
+        with patch('aws_google_auth.configuration.Configuration.saml_cache', new=None):
+            # Nobody would see a prompt: log in again first
+            with self.assertRaises(errors.LoginRequired) as e:
+                self.run_main('-r', READ_ONLY)
+            self.assertIn('aws-google-auth -p dev', str(e.exception))
+            self.assertFalse(interactive_login.called)
+
+            # Unless the password is in the keyring
+            with open(self.config_file, 'a') as f:
+                f.write('google_config.keyring = True\n')
+            with patch('aws_google_auth.configuration.Configuration.write_saml_cache') as write_saml_cache:
+                self.run_main('-r', READ_ONLY)
+            self.assertEqual(1, interactive_login.call_count)
+            self.assertEqual({'interactive': False}, interactive_login.call_args[1])
+            self.assertEqual(1, write_saml_cache.call_count)
+
+            interactive_login.side_effect = errors.MFARequired('Touch your security key')
+            with self.assertRaises(errors.LoginRequired):
+                self.run_main('-r', 'arn:aws:iam::345678901234:role/audit')
+
+    def test_cached_credentials_skip_the_login_code(self):
+        with open(process.cache_file(), 'w') as f:
+            json.dump({process.CredentialsCache.key('dev', READ_ONLY): {'credentials': {'Version': 1, 'AccessKeyId': 'ASIACACHED'},
+                                                                        'expiration': time.time() + 3600}}, f)
+
+        script = ("import sys, aws_google_auth\n"
+                  "aws_google_auth.cli(['credential-process', '-p', 'dev', '-r', '{}'])\n"
+                  "print(' '.join(m for m in ('boto3', 'botocore', 'requests', 'bs4', 'keyring') if m in sys.modules))\n").format(READ_ONLY)
+        output = subprocess.check_output([sys.executable, '-c', script], env=dict(os.environ)).decode('utf-8').splitlines()
+
+        self.assertEqual('ASIACACHED', json.loads(output[0])['AccessKeyId'])
+        self.assertEqual('', output[-1].strip())
@@ -0,0 +1,128 @@
+#!/usr/bin/env python
+
+import os
+import shlex
+
+import botocore.session
+import configparser
+from mock import Mock, patch
+
+from aws_google_auth import configuration
+from aws_google_auth import profiles
+from aws_google_auth.tests import helpers
+
+CONFIG = helpers.CONFIG + """google_config.alias_file = {alias_file}
+
+[profile dev-prod-deploy]
+region = us-east-1
+"""
+
+PRINCIPAL = 'arn:aws:iam::123456789012:saml-provider/GoogleApps'
+ROLES = {'arn:aws:iam::123456789012:role/admin': PRINCIPAL,
+         'arn:aws:iam::123456789012:role/ops/read only': PRINCIPAL,
+         'arn:aws:iam::210987654321:role/deploy': PRINCIPAL,
+         'arn:aws:iam::345678901234:role/audit': PRINCIPAL}
+
+
+class TestProfiles(helpers.ProfileTestCase):
+
+    def setUp(self):
+        super(TestProfiles, self).setUp()
+        alias_file = os.path.join(self.directory, 'aliases.json')
+        with open(alias_file, 'w') as f:
+            f.write('{"123456789012": "shared services", "210987654321": "prod"}')
+        with open(self.config_file, 'w') as f:
+            f.write(CONFIG.format(alias_file=alias_file))
+
+        self.patch_saml_cache()
+        self.roles = self.start(patch('aws_google_auth.amazon.Amazon.roles', new=dict(ROLES)))
+
+    def read_config(self):
+        config_parser = configparser.RawConfigParser()
+        config_parser.read(self.config_file)
+        return config_parser
+
+    def run_main(self, *args):
+        return self.printed(profiles, args)
+
+    def test_profile_names(self):
+        self.assertEqual({'dev-shared-services-admin': 'arn:aws:iam::123456789012:role/admin',
+                          'dev-shared-services-ops-read-only': 'arn:aws:iam::123456789012:role/ops/read only',
+                          'dev-prod-deploy': 'arn:aws:iam::210987654321:role/deploy',
+                          'dev-345678901234-audit': 'arn:aws:iam::345678901234:role/audit'},
+                         profiles.profile_names(ROLES, {'123456789012': 'shared services', '210987654321': 'prod'}, 'dev'))
+
+        # Accounts with the same alias keep their IDs apart
+        self.assertEqual({'x-prod-deploy': 'arn:aws:iam::210987654321:role/deploy',
+                          'x-345678901234-deploy': 'arn:aws:iam::345678901234:role/deploy'},
+                         profiles.profile_names(['arn:aws:iam::210987654321:role/deploy', 'arn:aws:iam::345678901234:role/deploy'],
+                                                {'210987654321': 'prod', '345678901234': 'prod'}, 'x'))
+
+    def test_generate_profiles(self):
+        with patch('aws_google_auth.amazon.Amazon._resolve_aws_aliases_per_account') as per_account:
+            printed = self.run_main()
+        # Names come from the alias file only
+        self.assertFalse(per_account.called)
+        self.assertEqual(['dev-345678901234-audit arn:aws:iam::345678901234:role/audit',
+                          'dev-shared-services-admin arn:aws:iam::123456789012:role/admin',
+                          'dev-shared-services-ops-read-only arn:aws:iam::123456789012:role/ops/read only'], printed)
+
+        config_parser = self.read_config()
+        section = config_parser['profile dev-shared-services-ops-read-only']
+        self.assertEqual(['aws-google-auth', 'credential-process', '-p', 'dev', '-r', 'arn:aws:iam::123456789012:role/ops/read only'],
+                         shlex.split(section['credential_process']))
+        self.assertEqual('eu-west-1', section['region'])
+        self.assertEqual('dev', section[configuration.GENERATED_FROM])
+
+        # A profile that was not generated is left alone
+        self.assertEqual({'region': 'us-east-1'}, dict(config_parser['profile dev-prod-deploy']))
+        self.assertEqual('arn:aws:iam::123456789012:role/admin', config_parser['profile dev']['google_config.role_arn'])
+
+        # The AWS SDKs see the profiles
+        session = botocore.session.Session(profile='dev-345678901234-audit')
+        self.assertIn('credential-process', session.get_scoped_config()['credential_process'])
+
+    def test_looked_up_aliases_are_cached(self):
+        with patch('aws_google_auth.amazon.Amazon._resolve_aws_aliases_per_account',
+                   return_value={'345678901234': 'audit'}) as per_account:
+            self.assertIn('dev-audit-audit arn:aws:iam::345678901234:role/audit', self.run_main('--resolve-aliases'))
+            self.assertEqual(1, per_account.call_count)
+
+            # Later runs name the account without looking it up again
+            self.assertIn('dev-audit-audit arn:aws:iam::345678901234:role/audit', self.run_main())
+            self.assertIn('dev-audit-audit arn:aws:iam::345678901234:role/audit', self.run_main('--resolve-aliases'))
+            self.assertEqual(1, per_account.call_count)
+
+        self.assertEqual({'123456789012': 'shared services', '210987654321': 'prod', '345678901234': 'audit'},
+                         profiles.read_alias_cache(profiles.alias_cache_file()))
+        self.assertEqual(os.path.join(self.directory, 'account_aliases.json'), profiles.alias_cache_file())
+
+    def test_regenerating_drops_roles_that_are_gone(self):
+        self.run_main('-q')
+        del self.roles['arn:aws:iam::345678901234:role/audit']
+
+        self.assertEqual([], self.run_main('-q', '--executable', '/opt/bin/aws-google-auth'))
+        config_parser = self.read_config()
+        self.assertFalse(config_parser.has_section('profile dev-345678901234-audit'))
+        self.assertTrue(config_parser['profile dev-shared-services-admin']['credential_process'].startswith('/opt/bin/aws-google-auth '))
+
+        # Profiles generated from another profile are kept
+        config = configuration.Configuration()
+        config.read('dev')
+        config.profile = 'other'
+        config.write_process_profiles({'other-audit': 'arn:aws:iam::345678901234:role/audit'})
+        self.run_main('-q')
+        self.assertTrue(self.read_config().has_section('profile other-audit'))
+
+    @patch('aws_google_auth.credentials.interactive_login', spec=True)
+    def test_login_when_the_assertion_expired(self, interactive_login):
+        def login(config):
+            config.saml_cache = b'<xml/>'
+        interactive_login.side_effect = login
+
+        with patch('aws_google_auth.configuration.Configuration.saml_cache', new=None):
+            with patch('aws_google_auth.configuration.Configuration.write_saml_cache') as write_saml_cache:
+                with patch('aws_google_auth.amazon.Amazon', return_value=Mock(roles={}, **{'resolve_aws_aliases.return_value': {}})):
+                    self.run_main('--prefix', 'team')
+        self.assertEqual(1, interactive_login.call_count)
+        self.assertEqual(1, write_saml_cache.call_count)
@@ -0,0 +1,92 @@
+#!/usr/bin/env python
+
+import json
+import os
+import shutil
+import tempfile
+import unittest
+
+from mock import patch
+
+from aws_google_auth import ratelimit
+
+
+class TestTokenBucket(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.directory)
+        self.path = os.path.join(self.directory, 'login_rate.json')
+
+        self.now = 1500000000.0
+        self.sleeps = []
+
+    def clock(self):
+        return self.now
+
+    def sleep(self, seconds):
+        self.sleeps.append(seconds)
+        self.now += seconds
+
+    def bucket(self, burst=3, interval=10):
+        return ratelimit.TokenBucket(self.path, burst=burst, interval=interval, clock=self.clock, sleep=self.sleep)
+
+    def test_burst_then_one_per_interval(self):
+        # Each bucket stands for another process sharing the file
+        for _ in range(3):
+            self.assertEqual(0, self.bucket().acquire())
+        self.assertEqual(10, self.bucket().acquire())
+        self.assertEqual(10, self.bucket().acquire())
+
+        self.now += 5
+        self.assertEqual(5, self.bucket().acquire())
+        self.assertEqual([10, 10, 5], self.sleeps)
+
+        # An idle bucket fills up again, but no further than the burst
+        self.now += 3600
+        for _ in range(3):
+            self.assertEqual(0, self.bucket().acquire())
+        self.assertEqual(10, self.bucket().acquire())
+
+    def test_bad_state_counts_as_full(self):
+        for state in ['not json', '{}', '{"tokens": "many", "updated": 0}']:
+            with open(self.path, 'w') as f:
+                f.write(state)
+            self.assertEqual(0, self.bucket().acquire())
+
+        # Values out of range are brought back in range
+        with open(self.path, 'w') as f:
+            json.dump({'tokens': -1000, 'updated': self.now + 3600}, f)
+        self.assertEqual(10, self.bucket().acquire())
+
+        with open(self.path, 'w') as f:
+            json.dump({'tokens': 1000, 'updated': self.now}, f)
+        for _ in range(3):
+            self.assertEqual(0, self.bucket().acquire())
+        self.assertEqual(10, self.bucket().acquire())
+
+    def test_unusable_file_does_not_block(self):
+        # Neither readable nor writable as a file
+        os.mkdir(self.path)
+        for _ in range(5):
+            self.assertEqual(0, self.bucket().acquire())
+
+    def test_login_limiter(self):
+        with patch.dict(os.environ, {ratelimit.FILE_VARIABLE: self.path,
+                                     ratelimit.BURST_VARIABLE: '2',
+                                     ratelimit.INTERVAL_VARIABLE: '30'}):
+            limiter = ratelimit.login_limiter()
+        self.assertEqual((self.path, 2, 30), (limiter.path, limiter.burst, limiter.interval))
+
+        with patch.dict(os.environ, {ratelimit.BURST_VARIABLE: '0'}):
+            self.assertIsNone(ratelimit.login_limiter())
+
+        # Bad values fall back to the defaults rather than stop the login
+        for burst, interval in (('five', '10s'), ('-1', '0'), ('2.5', 'nan'), ('', 'inf')):
+            with patch.dict(os.environ, {ratelimit.BURST_VARIABLE: burst, ratelimit.INTERVAL_VARIABLE: interval}):
+                limiter = ratelimit.login_limiter()
+            self.assertEqual((ratelimit.DEFAULT_BURST, ratelimit.DEFAULT_INTERVAL), (limiter.burst, limiter.interval))
+
+        with patch.dict(os.environ, {'AWS_SHARED_CREDENTIALS_FILE': os.path.join(self.directory, 'credentials')}):
+            os.environ.pop(ratelimit.FILE_VARIABLE, None)
+            self.assertEqual(self.path, ratelimit.default_path())
@@ -0,0 +1,187 @@
+#!/usr/bin/env python
+
+import gzip
+import json
+import os
+import tempfile
+import unittest
+from os import path
+
+from mock import Mock, patch
+from requests import HTTPError
+
+from aws_google_auth import errors
+from aws_google_auth import google
+from aws_google_auth import replay
+from aws_google_auth import timings
+
+
+FLOWS = path.join(path.abspath(path.dirname(__file__)), 'flows')
+
+
+class TestReplay(unittest.TestCase):
+
+    def setUp(self):
+        self.config = Mock()
+        self.config.idp_id = "C01abc23d"
+        self.config.sp_id = "123456789012"
+        self.config.username = "user@example.com"
+        self.config.password = "hunter2"
+        self.config.bg_response = None
+        self.config.totp_secret = None
+
+    def replay_login(self, name, run_timings=None):
+        flow_dir = path.join(FLOWS, name)
+        with open(path.join(flow_dir, 'answers.json')) as fp:
+            answers = json.load(fp)
+
+        with replay.StubIdP(replay.load_flow(flow_dir)) as stub, \
+                patch('aws_google_auth.google.input', side_effect=answers, create=True), \
+                patch('aws_google_auth.google.u2f', create=True) as mock_u2f:
+            mock_u2f.u2f_auth.return_value = {"keyHandle": "S0VZSEFORExFMQ"}
+
+            undertest = google.Google(self.config, save_failure=False,
+                                      base_url=stub.base_url, api_url=stub.base_url,
+                                      timings=run_timings)
+            undertest.do_login()
+            saml_xml = undertest.parse_saml()
+
+            self.assertEqual([], stub.mismatches)
+            self.assertTrue(stub.finished)
+
+        return saml_xml
+
+    def test_load_flow(self):
+        exchanges = replay.load_flow(path.join(FLOWS, 'totp'))
+
+        self.assertEqual([('GET', '/o/saml2/initsso'),
+                          ('POST', '/signin/v1/lookup'),
+                          ('POST', '/signin/challenge/sl/password'),
+                          ('POST', '/signin/challenge/totp/2')],
+                         [(e.method, e.path) for e in exchanges])
+        self.assertEqual('/signin/challenge/totp/2?hl=en', exchanges[2].response_path)
+
+    def test_replay_totp(self):
+        self.assertIn(b'https://aws.amazon.com/SAML/Attributes/Role', self.replay_login('totp'))
+
+    def test_replay_totp_generated(self):
+        self.config.totp_secret = 'GEZDGNBVGY3TQOJQGEZDGNBVGY3TQOJQ'
+        with replay.StubIdP(replay.load_flow(path.join(FLOWS, 'totp'))) as stub, \
+                patch('aws_google_auth.google.input', side_effect=AssertionError('prompted'), create=True):
+            undertest = google.Google(self.config, save_failure=False, base_url=stub.base_url)
+            undertest.do_login()
+
+            self.assertIn(b'https://aws.amazon.com/SAML/Attributes/Role', undertest.parse_saml())
+            self.assertTrue(stub.finished)
+
+    def test_non_interactive_challenges(self):
+        for name in ['totp', 'sk', 'az', 'selectchallenge']:
+            with replay.StubIdP(replay.load_flow(path.join(FLOWS, name))) as stub, \
+                    patch('aws_google_auth.google.input', side_effect=AssertionError('prompted'), create=True):
+                undertest = google.Google(self.config, save_failure=False, base_url=stub.base_url,
+                                          interactive=False)
+                with self.assertRaises(errors.MFARequired):
+                    undertest.do_login()
+
+        # Unless the codes can be generated
+        self.config.totp_secret = 'GEZDGNBVGY3TQOJQGEZDGNBVGY3TQOJQ'
+        with replay.StubIdP(replay.load_flow(path.join(FLOWS, 'totp'))) as stub:
+            undertest = google.Google(self.config, save_failure=False, base_url=stub.base_url, interactive=False)
+            undertest.do_login()
+            self.assertTrue(stub.finished)
+
+    def test_password_post_is_rate_limited(self):
+        limiter = Mock()
+        self.config.totp_secret = 'GEZDGNBVGY3TQOJQGEZDGNBVGY3TQOJQ'
+        with replay.StubIdP(replay.load_flow(path.join(FLOWS, 'totp'))) as stub:
+            undertest = google.Google(self.config, save_failure=False, base_url=stub.base_url, limiter=limiter)
+            undertest.prefetch()
+            self.assertFalse(limiter.acquire.called)
+
+            undertest.do_login()
+            limiter.acquire.assert_called_once_with()
+            self.assertTrue(stub.finished)
+
+    def test_replay_ipp(self):
+        self.assertIn(b'https://aws.amazon.com/SAML/Attributes/Role', self.replay_login('ipp'))
+
+    def test_replay_az(self):
+        self.assertIn(b'https://aws.amazon.com/SAML/Attributes/Role', self.replay_login('az'))
+
+    def test_replay_sk(self):
+        self.assertIn(b'https://aws.amazon.com/SAML/Attributes/Role', self.replay_login('sk'))
+
+    def test_replay_iap(self):
+        self.assertIn(b'https://aws.amazon.com/SAML/Attributes/Role', self.replay_login('iap'))
+
+    def test_replay_dp(self):
+        self.assertIn(b'https://aws.amazon.com/SAML/Attributes/Role', self.replay_login('dp'))
+
+    def test_replay_selectchallenge(self):
+        self.assertIn(b'https://aws.amazon.com/SAML/Attributes/Role', self.replay_login('selectchallenge'))
+
+    def test_replay_records_timings(self):
+        run_timings = timings.Timings()
+        self.replay_login('totp', run_timings)
+
+        phases = [(p['name'], p['depth']) for p in run_timings.as_dict()['phases']]
+        self.assertEqual(('GET /o/saml2/initsso', 0), phases[0])
+        self.assertIn(('challenge totp', 0), phases)
+        self.assertIn(('wait for user', 1), phases)
+        self.assertIn(('POST /signin/challenge/totp/2', 1), phases)
+
+    def test_prefetch_before_the_password(self):
+        self.config.password = None
+        run_timings = timings.Timings()
+        cwd = os.getcwd()
+        os.chdir(tempfile.mkdtemp())
+        try:
+            with replay.StubIdP(replay.load_flow(path.join(FLOWS, 'totp'))) as stub, \
+                    patch('aws_google_auth.google.input', side_effect=["123456"], create=True):
+                undertest = google.Google(self.config, save_failure=False, save_flow=True,
+                                          base_url=stub.base_url, api_url=stub.base_url, timings=run_timings)
+                undertest.prefetch()
+                self.config.password = "hunter2"
+                undertest.do_login()
+
+                self.assertEqual([], stub.mismatches)
+                self.assertTrue(stub.finished)
+
+            with gzip.open(undertest.capture.path, 'rt') as f:
+                recorded = [json.loads(line) for line in f]
+        finally:
+            os.chdir(cwd)
+
+        phases = [(p['name'], p['depth']) for p in run_timings.as_dict()['phases']]
+        self.assertIn(('prefetch login page', 0), phases)
+        self.assertIn(('POST /signin/v1/lookup', 1), phases)
+        self.assertEqual('<PASSWORD>', recorded[4]['data']['Passwd'])
+
+    def test_replay_out_of_order(self):
+        exchanges = replay.load_flow(path.join(FLOWS, 'totp'))
+
+        with replay.StubIdP(exchanges[1:]) as stub:
+            undertest = google.Google(self.config, save_failure=False, base_url=stub.base_url)
+            with self.assertRaises(HTTPError):
+                undertest.do_login()
+
+            self.assertEqual(["expected POST /signin/v1/lookup, got GET /o/saml2/initsso"], stub.mismatches)
+            self.assertFalse(stub.finished)
+
+    def test_saved_flow_is_replayable(self):
+        original = replay.load_flow(path.join(FLOWS, 'totp'))
+        cwd = os.getcwd()
+        os.chdir(tempfile.mkdtemp())
+        try:
+            with replay.StubIdP(original) as stub, \
+                    patch('aws_google_auth.google.input', side_effect=["123456"], create=True):
+                undertest = google.Google(self.config, save_failure=False, save_flow=True,
+                                          base_url=stub.base_url, api_url=stub.base_url)
+                undertest.do_login()
+
+            recorded = replay.load_flow(undertest.capture.path)
+        finally:
+            os.chdir(cwd)
+
+        self.assertEqual([(e.method, e.path, e.response_path) for e in original],
+                         [(e.method, e.path, e.response_path) for e in recorded])
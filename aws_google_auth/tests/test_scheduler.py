@@ -0,0 +1,143 @@
+#!/usr/bin/env python
+
+import os
+from datetime import datetime, timedelta
+
+import configparser
+from botocore.exceptions import ClientError
+from dateutil.tz import tzutc
+from mock import Mock
+
+from aws_google_auth import configuration
+from aws_google_auth import credentials
+from aws_google_auth import scheduler
+from aws_google_auth.tests import helpers
+
+CONFIG = helpers.CONFIG + helpers.CONFIG.replace('[profile dev]', '[profile prod]') + """
+[profile unmanaged]
+region = eu-west-1
+"""
+
+
+class TestScheduler(helpers.ProfileTestCase):
+
+    CONFIG = CONFIG
+    PROFILE = None
+
+    def read_local_file(self, filename):
+        here = os.path.abspath(os.path.dirname(__file__))
+        with open(os.path.join(here, filename)) as fp:
+            return fp.read().encode('utf-8')
+
+    def setUp(self):
+        super(TestScheduler, self).setUp()
+        with open(self.credentials_file, 'w') as f:
+            f.write('')
+
+        self.now = 1500000000.0
+        self.expiration = datetime.fromtimestamp(self.now, tzutc()) + timedelta(hours=1)
+        self.sts_client = Mock()
+        self.sts_client.assume_role_with_saml.return_value = {
+            'Credentials': {
+                'AccessKeyId': 'ASIAEXAMPLE',
+                'SecretAccessKey': 'secret',
+                'SessionToken': 'token',
+                'Expiration': self.expiration,
+            }
+        }
+
+    def login(self, config):
+        config.saml_cache = self.read_local_file('saml-response-no-expire.xml')
+
+    def scheduler(self, **kwargs):
+        kwargs.setdefault('login', Mock(side_effect=self.login))
+        return scheduler.Scheduler(sts_client=self.sts_client, quiet=True, clock=lambda: self.now,
+                                   sleep=Mock(), rand=lambda a, b: 0, **kwargs)
+
+    def write_expiration(self, profile, expiration):
+        with open(self.credentials_file, 'a') as f:
+            f.write('[{}]\naws_session_expiration = {}\n'.format(
+                profile, expiration.strftime(credentials.EXPIRATION_FORMAT)))
+
+    def test_managed_profiles(self):
+        self.assertEqual(['dev', 'prod'], scheduler.managed_profiles(self.config_file))
+
+    def test_refresh_at(self):
+        undertest = self.scheduler(fraction=0.5, jitter=300)
+        issued = self.now
+        self.assertEqual(issued + 1800, undertest.refresh_at(self.expiration, 3600))
+
+        undertest.rand = lambda a, b: b
+        self.assertEqual(issued + 2100, undertest.refresh_at(self.expiration, 3600))
+
+        # Never later than a minute before the credentials expire
+        undertest = self.scheduler(fraction=0.99, jitter=300)
+        undertest.rand = lambda a, b: b
+        self.assertEqual(issued + 3600 - scheduler.MINIMUM_MARGIN, undertest.refresh_at(self.expiration, 3600))
+
+    def test_refresh_shares_one_login(self):
+        undertest = self.scheduler()
+
+        undertest.run(once=True)
+
+        self.assertEqual(1, undertest.login.call_count)
+        self.assertEqual(2, self.sts_client.assume_role_with_saml.call_count)
+        credentials_parser = configparser.RawConfigParser()
+        credentials_parser.read(self.credentials_file)
+        self.assertEqual(['dev', 'prod'], credentials_parser.sections())
+        self.assertEqual('ASIAEXAMPLE', credentials_parser.get('prod', 'aws_access_key_id'))
+        self.assertTrue(os.path.exists(os.path.join(self.directory, 'saml_cache_idp.xml')))
+
+    def test_only_due_profiles_are_refreshed(self):
+        self.write_expiration('dev', self.expiration)
+        undertest = self.scheduler()
+
+        undertest.run(once=True)
+
+        # dev is only due half way through its lifetime
+        self.assertEqual(1, self.sts_client.assume_role_with_saml.call_count)
+        self.assertEqual(self.now + 1800, undertest.schedule['dev'][1])
+        undertest.update()
+        self.assertEqual([], undertest.due())
+
+    def test_failed_refresh_is_retried_later(self):
+        undertest = self.scheduler(profiles=['dev'], login=Mock(side_effect=Exception('captcha')))
+
+        undertest.run(once=True)
+
+        self.assertFalse(self.sts_client.assume_role_with_saml.called)
+        self.assertEqual(self.now + scheduler.RETRY_INTERVAL, undertest.schedule['dev'][1])
+        undertest.update()
+        self.assertEqual([], undertest.due())
+
+    def test_role_shorter_than_the_configured_duration(self):
+        # A profile set up for 12h with a role capped at 1h
+        with open(self.config_file, 'w') as f:
+            f.write(CONFIG.replace('google_config.duration = 3600', 'google_config.duration = 43200'))
+        self.write_expiration('dev', self.expiration)
+        undertest = self.scheduler(profiles=['dev'])
+
+        # Not due: the credentials were issued no later than now
+        undertest.run(once=True)
+        self.assertFalse(self.sts_client.assume_role_with_saml.called)
+        self.assertEqual(self.now + 1800, undertest.schedule['dev'][1])
+
+        # Once due, the role is assumed for as long as it allows
+        self.now += 1800
+        self.expiration += timedelta(seconds=1800)
+        error = ClientError({'Error': {'Code': 'ValidationError', 'Message': 'The requested DurationSeconds exceeds the '
+                                       'MaxSessionDuration set for this role. Member must have value less than or equal to 3600'}},
+                            'AssumeRoleWithSAML')
+        self.sts_client.assume_role_with_saml.side_effect = [error, self.sts_client.assume_role_with_saml.return_value]
+        self.sts_client.assume_role_with_saml.return_value['Credentials']['Expiration'] = self.expiration
+        undertest.run(once=True)
+
+        self.assertEqual([43200, 3600], [c[1]['DurationSeconds'] for c in self.sts_client.assume_role_with_saml.call_args_list])
+        undertest.update()
+        self.assertEqual(self.now + 1800, undertest.schedule['dev'][1])
+        self.assertEqual([], undertest.due())
+
+        # The profile keeps the duration it was set up with
+        config = configuration.Configuration()
+        config.read('dev')
+        self.assertEqual(43200, config.duration)
@@ -0,0 +1,78 @@
+#!/usr/bin/env python
+
+import json
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import unittest
+from datetime import datetime, timedelta
+
+from dateutil.tz import tzutc
+from mock import patch
+
+from aws_google_auth import status
+
+
+class TestStatus(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.credentials_file = os.path.join(self.directory, 'credentials')
+        self.now = 1500000000.0
+        self.expiration = datetime.fromtimestamp(self.now, tzutc()) + timedelta(hours=1, minutes=5)
+        with open(self.credentials_file, 'w') as f:
+            f.write('[dev]\naws_session_expiration = {}\n'.format(self.expiration.strftime(status.EXPIRATION_FORMAT)))
+            f.write('[old]\naws_session_expiration = 2017-07-14T02:00:00+0000\n')
+            f.write('[static]\naws_access_key_id = AKIAEXAMPLE\n')
+
+        environ = patch.dict(os.environ, {'AWS_SHARED_CREDENTIALS_FILE': self.credentials_file})
+        environ.start()
+        self.addCleanup(environ.stop)
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def test_read_expirations(self):
+        self.assertEqual(['dev', 'old'], sorted(status.read_expirations(self.credentials_file)))
+        self.assertEqual(self.expiration, status.read_expirations(self.credentials_file)['dev'])
+
+    def test_status(self):
+        entries = status.status(status.read_expirations(self.credentials_file), now=self.now)
+
+        self.assertEqual([{'profile': 'dev', 'expiration': self.expiration.strftime(status.EXPIRATION_FORMAT),
+                           'remaining': 3900, 'expired': False},
+                          {'profile': 'old', 'expiration': '2017-07-14T02:00:00+0000',
+                           'remaining': 0, 'expired': True}], entries)
+
+        entries = status.status(status.read_expirations(self.credentials_file), ['dev', 'missing'], now=self.now)
+        self.assertEqual(['dev', 'missing'], [entry['profile'] for entry in entries])
+        self.assertEqual({'profile': 'missing', 'expiration': None, 'remaining': None, 'expired': True}, entries[1])
+
+    def test_format_remaining(self):
+        self.assertEqual('expired', status.format_remaining(0))
+        self.assertEqual('59m', status.format_remaining(3599))
+        self.assertEqual('1h05m', status.format_remaining(3900))
+
+    @patch('aws_google_auth.status.time.time', return_value=1500000000.0)
+    @patch('aws_google_auth.status.print', create=True)
+    def test_main(self, mock_print, mock_time):
+        status.main(['dev', '--json'])
+        self.assertEqual('dev', json.loads(mock_print.call_args[0][0])[0]['profile'])
+
+        with self.assertRaises(SystemExit) as context:
+            status.main([])
+        self.assertEqual(1, context.exception.code)
+        self.assertIn('1h05m', mock_print.call_args_list[-2][0][0])
+
+    def test_status_skips_the_login_code(self):
+        script = ("import sys, aws_google_auth\n"
+                  "try:\n"
+                  "    aws_google_auth.cli(['status', 'dev'])\n"
+                  "except SystemExit:\n"
+                  "    pass\n"
+                  "print(' '.join(m for m in ('boto3', 'botocore', 'requests', 'bs4', 'keyring') if m in sys.modules))\n")
+        output = subprocess.check_output([sys.executable, '-c', script], env=dict(os.environ))
+
+        self.assertEqual('', output.decode('utf-8').splitlines()[-1].strip())
@@ -0,0 +1,190 @@
+#!/usr/bin/env python
+
+import os
+import subprocess
+import sys
+import unittest
+from datetime import datetime
+
+import requests
+from botocore.exceptions import ClientError
+from dateutil.tz import tzutc
+from mock import Mock, patch
+
+from aws_google_auth import sts
+
+ROLE = 'arn:aws:iam::123456789012:role/admin'
+PRINCIPAL = 'arn:aws:iam::123456789012:saml-provider/GoogleApps'
+
+RESPONSE = b"""<AssumeRoleWithSAMLResponse xmlns="https://sts.amazonaws.com/doc/2011-06-15/">
+  <AssumeRoleWithSAMLResult>
+    <Audience>https://signin.aws.amazon.com/saml</Audience>
+    <AssumedRoleUser>
+      <AssumedRoleId>AROAEXAMPLE:user@example.com</AssumedRoleId>
+      <Arn>arn:aws:sts::123456789012:assumed-role/admin/user@example.com</Arn>
+    </AssumedRoleUser>
+    <Credentials>
+      <AccessKeyId>ASIAEXAMPLE</AccessKeyId>
+      <SecretAccessKey>secret</SecretAccessKey>
+      <SessionToken>token</SessionToken>
+      <Expiration>2026-10-19T13:00:00Z</Expiration>
+    </Credentials>
+    <Subject>user@example.com</Subject>
+    <SubjectType>persistent</SubjectType>
+    <Issuer>https://accounts.google.com/o/saml2?idpid=IDPID</Issuer>
+    <NameQualifier>qualifier</NameQualifier>
+  </AssumeRoleWithSAMLResult>
+  <ResponseMetadata>
+    <RequestId>c6104cbe-af31-11e0-8154-cbc7ccf896c7</RequestId>
+  </ResponseMetadata>
+</AssumeRoleWithSAMLResponse>"""
+
+ERROR = b"""<ErrorResponse xmlns="https://sts.amazonaws.com/doc/2011-06-15/">
+  <Error>
+    <Type>Sender</Type>
+    <Code>ValidationError</Code>
+    <Message>1 validation error detected: Value '43200' at 'durationSeconds' failed to satisfy constraint: Member must have value less than or equal to 3600</Message>
+  </Error>
+  <RequestId>c6104cbe-af31-11e0-8154-cbc7ccf896c7</RequestId>
+</ErrorResponse>"""
+
+
+ASSUME_ROLE_RESPONSE = b"""<AssumeRoleResponse xmlns="https://sts.amazonaws.com/doc/2011-06-15/">
+  <AssumeRoleResult>
+    <AssumedRoleUser>
+      <AssumedRoleId>AROASPOKE:user@example.com</AssumedRoleId>
+      <Arn>arn:aws:sts::210987654321:assumed-role/deploy/user@example.com</Arn>
+    </AssumedRoleUser>
+    <Credentials>
+      <AccessKeyId>ASIASPOKE</AccessKeyId>
+      <SecretAccessKey>spoke-secret</SecretAccessKey>
+      <SessionToken>spoke-token</SessionToken>
+      <Expiration>2026-10-19T14:00:00Z</Expiration>
+    </Credentials>
+  </AssumeRoleResult>
+  <ResponseMetadata>
+    <RequestId>d7215dcf-af31-11e0-8154-cbc7ccf896c7</RequestId>
+  </ResponseMetadata>
+</AssumeRoleResponse>"""
+
+
+def http_response(status_code, content, reason='OK'):
+    return Mock(status_code=status_code, content=content, reason=reason)
+
+
+class TestSTSClient(unittest.TestCase):
+
+    @patch.dict(os.environ, {}, clear=True)
+    def test_endpoints(self):
+        self.assertEqual('https://sts.amazonaws.com', sts.endpoint_for_region(None))
+        self.assertEqual('https://sts.eu-west-1.amazonaws.com', sts.endpoint_for_region('eu-west-1'))
+        self.assertEqual('https://sts.cn-north-1.amazonaws.com.cn', sts.endpoint_for_region('cn-north-1'))
+
+        with patch.dict(os.environ, {'AWS_ENDPOINT_URL_STS': 'http://localhost:4566'}):
+            self.assertEqual('http://localhost:4566', sts.endpoint_for_region('eu-west-1'))
+
+    def test_assume_role_with_saml(self):
+        session = Mock()
+        session.post.return_value = http_response(200, RESPONSE)
+        client = sts.STSClient(region='ap-southeast-2', session=session)
+
+        response = client.assume_role_with_saml(RoleArn=ROLE, PrincipalArn=PRINCIPAL,
+                                                SAMLAssertion='c2FtbA==', DurationSeconds=3600)
+
+        self.assertEqual({'AccessKeyId': 'ASIAEXAMPLE',
+                          'SecretAccessKey': 'secret',
+                          'SessionToken': 'token',
+                          'Expiration': datetime(2026, 10, 19, 13, 0, 0, tzinfo=tzutc())},
+                         response['Credentials'])
+        self.assertEqual('arn:aws:sts::123456789012:assumed-role/admin/user@example.com',
+                         response['AssumedRoleUser']['Arn'])
+        self.assertEqual('user@example.com', response['Subject'])
+
+        args, kwargs = session.post.call_args
+        self.assertEqual(('https://sts.ap-southeast-2.amazonaws.com',), args)
+        self.assertEqual({'Action': 'AssumeRoleWithSAML',
+                          'Version': '2011-06-15',
+                          'RoleArn': ROLE,
+                          'PrincipalArn': PRINCIPAL,
+                          'SAMLAssertion': 'c2FtbA==',
+                          'DurationSeconds': '3600'}, kwargs['data'])
+
+    def test_assume_role(self):
+        session = Mock()
+        session.post.return_value = http_response(200, ASSUME_ROLE_RESPONSE)
+        client = sts.STSClient(region='ap-southeast-2', session=session)
+
+        response = client.assume_role(RoleArn='arn:aws:iam::210987654321:role/deploy', RoleSessionName='user@example.com',
+                                      Credentials={'AccessKeyId': 'ASIAHUB', 'SecretAccessKey': 'secret', 'SessionToken': 'token'},
+                                      DurationSeconds=3600)
+
+        self.assertEqual({'AccessKeyId': 'ASIASPOKE',
+                          'SecretAccessKey': 'spoke-secret',
+                          'SessionToken': 'spoke-token',
+                          'Expiration': datetime(2026, 10, 19, 14, 0, 0, tzinfo=tzutc())},
+                         response['Credentials'])
+        self.assertEqual('AROASPOKE:user@example.com', response['AssumedRoleUser']['AssumedRoleId'])
+
+        # Signed for the endpoint's region with the hub role's credentials
+        args, kwargs = session.post.call_args
+        self.assertEqual(('https://sts.ap-southeast-2.amazonaws.com',), args)
+        self.assertEqual(b'Action=AssumeRole&DurationSeconds=3600&RoleArn=arn%3Aaws%3Aiam%3A%3A210987654321%3Arole%2Fdeploy'
+                         b'&RoleSessionName=user%40example.com&Version=2011-06-15', kwargs['data'])
+        self.assertIn('Credential=ASIAHUB/', kwargs['headers']['Authorization'])
+        self.assertIn('/ap-southeast-2/sts/aws4_request', kwargs['headers']['Authorization'])
+        self.assertEqual('token', kwargs['headers']['X-Amz-Security-Token'])
+
+        # The global endpoint signs for us-east-1
+        sts.STSClient(session=session).assume_role(RoleArn='arn:aws:iam::210987654321:role/deploy', RoleSessionName='user',
+                                                   Credentials={'AccessKeyId': 'ASIAHUB', 'SecretAccessKey': 'secret'})
+        self.assertIn('/us-east-1/sts/aws4_request', session.post.call_args[1]['headers']['Authorization'])
+        self.assertNotIn('X-Amz-Security-Token', session.post.call_args[1]['headers'])
+
+    def test_signer_is_imported_for_chained_roles_only(self):
+        script = ("import sys\n"
+                  "from aws_google_auth import sts\n"
+                  "print(' '.join(m for m in ('botocore.auth', 'botocore.awsrequest', 'botocore.credentials') if m in sys.modules))\n")
+        self.assertEqual(b'', subprocess.check_output([sys.executable, '-c', script]).strip())
+
+    def test_errors_are_client_errors(self):
+        session = Mock()
+        session.post.return_value = http_response(400, ERROR, reason='Bad Request')
+        client = sts.STSClient(session=session)
+
+        with self.assertRaises(ClientError) as context:
+            client.assume_role_with_saml(RoleArn=ROLE, PrincipalArn=PRINCIPAL, SAMLAssertion='c2FtbA==')
+
+        error = context.exception.response['Error']
+        self.assertEqual('ValidationError', error['Code'])
+        self.assertIn('less than or equal to 3600', error['Message'])
+        self.assertEqual(400, context.exception.response['ResponseMetadata']['HTTPStatusCode'])
+
+        # Errors without an XML body (e.g. from a proxy) still carry the status
+        session.post.return_value = http_response(503, b'<html>Service Unavailable', reason='Service Unavailable')
+        with self.assertRaises(ClientError) as context:
+            client.assume_role_with_saml(RoleArn=ROLE, PrincipalArn=PRINCIPAL, SAMLAssertion='c2FtbA==')
+        self.assertEqual('503', context.exception.response['Error']['Code'])
+
+    def test_warm_up(self):
+        session = Mock()
+        client = sts.STSClient(session=session)
+        client.warm_up()
+        session.head.assert_called_once_with('https://sts.amazonaws.com', timeout=sts.TIMEOUT, verify=client.verify,
+                                             allow_redirects=False)
+
+        # A failed warm-up is left for the real call to report
+        session.head.side_effect = requests.exceptions.ConnectionError()
+        client.warm_up()
+
+    def test_auto_duration_retries_with_the_maximum(self):
+        from aws_google_auth import amazon
+
+        session = Mock()
+        session.post.side_effect = [http_response(400, ERROR, reason='Bad Request'), http_response(200, RESPONSE)]
+        config = Mock(auto_duration=True, max_duration=43200)
+
+        a = amazon.Amazon(config, b'<xml/>', sts_client=sts.STSClient(session=session))
+        token = a.assume_role(ROLE, PRINCIPAL, 'c2FtbA==')
+
+        self.assertEqual('ASIAEXAMPLE', token['Credentials']['AccessKeyId'])
+        self.assertEqual(['43200', '3600'], [c[1]['data']['DurationSeconds'] for c in session.post.call_args_list])
@@ -0,0 +1,60 @@
+#!/usr/bin/env python
+
+import json
+import unittest
+
+from aws_google_auth import timings
+
+
+class TestTimings(unittest.TestCase):
+
+    def test_nested_phases(self):
+        undertest = timings.Timings()
+
+        with undertest.phase('google login'):
+            with undertest.phase('GET /o/saml2/initsso'):
+                pass
+            with undertest.phase('parse html'):
+                pass
+        with undertest.phase('write config'):
+            pass
+
+        report = undertest.as_dict()
+        self.assertEqual([('google login', 0),
+                          ('GET /o/saml2/initsso', 1),
+                          ('parse html', 1),
+                          ('write config', 0)],
+                         [(p['name'], p['depth']) for p in report['phases']])
+        self.assertGreaterEqual(report['total_ms'], sum(p['duration_ms'] for p in report['phases'] if p['depth'] == 0))
+
+    def test_phase_recorded_on_exception(self):
+        undertest = timings.Timings()
+
+        with self.assertRaises(ValueError):
+            with undertest.phase('AssumeRoleWithSAML'):
+                raise ValueError()
+
+        self.assertEqual(['AssumeRoleWithSAML'], [p.name for p in undertest.phases])
+
+    def test_json_report(self):
+        undertest = timings.Timings()
+        with undertest.phase('read config'):
+            pass
+
+        report = json.loads(undertest.report('json'))
+
+        self.assertEqual(['phases', 'total_ms'], sorted(report.keys()))
+        self.assertEqual(['depth', 'duration_ms', 'name', 'start_ms'], sorted(report['phases'][0].keys()))
+
+    def test_text_report(self):
+        undertest = timings.Timings()
+        with undertest.phase('google login'):
+            with undertest.phase('POST /signin/v1/lookup'):
+                pass
+
+        report = undertest.report().splitlines()
+
+        self.assertIn('Duration (ms)', report[0])
+        self.assertTrue(report[2].startswith('google login'))
+        self.assertTrue(report[3].startswith('  POST /signin/v1/lookup'))
+        self.assertTrue(report[4].startswith('total'))
@@ -0,0 +1,48 @@
+#!/usr/bin/env python
+
+import unittest
+
+from mock import Mock, patch
+
+from aws_google_auth import google
+from aws_google_auth import totp
+
+# The RFC 6238 test key, "12345678901234567890", in base32
+SECRET = 'GEZDGNBVGY3TQOJQGEZDGNBVGY3TQOJQ'
+
+
+class TestTotp(unittest.TestCase):
+
+    def test_rfc6238_vectors(self):
+        for for_time, code in [(59, '94287082'),
+                               (1111111109, '07081804'),
+                               (1111111111, '14050471'),
+                               (1234567890, '89005924'),
+                               (2000000000, '69279037'),
+                               (20000000000, '65353130')]:
+            self.assertEqual(code, totp.totp(SECRET, for_time, digits=8))
+
+        self.assertEqual('287082', totp.totp(SECRET, 59))
+
+    def test_decode_secret(self):
+        self.assertEqual(b'12345678901234567890', totp.decode_secret('gezd gnbv gy3t qojq gezd gnbv gy3t qojq'))
+        self.assertEqual(b'hello', totp.decode_secret('NBSWY3DP'))
+        self.assertEqual(b'hi', totp.decode_secret('NBUQ'))
+
+        for invalid in ['', 'not base32!', '0189']:
+            with self.assertRaises(ValueError):
+                totp.decode_secret(invalid)
+
+    @patch('time.sleep')
+    @patch('time.time', return_value=59.0)
+    def test_codes_are_not_reused(self, mock_time, mock_sleep):
+        undertest = google.Google(Mock(totp_secret=SECRET), save_failure=False)
+
+        first = undertest._generate_totp()
+        second = undertest._generate_totp()
+
+        key = totp.decode_secret(SECRET)
+        self.assertEqual(totp.hotp(key, 1), first)
+        # The second code waits for the next time step
+        self.assertEqual(totp.hotp(key, 2), second)
+        mock_sleep.assert_called_once_with(1.0)
@@ -0,0 +1,114 @@
+#!/usr/bin/env python
+
+import re
+import sys
+import threading
+import time
+import types
+import unittest
+
+from mock import Mock, patch
+
+import aws_google_auth
+
+
+def import_with_stub_u2flib():
+    """aws_google_auth.u2f, imported against a minimal stand-in for the
+    optional u2flib_host package, so the polling logic is tested without it.
+
+    The stand-in is only visible to this module: neither it nor the u2f
+    module it was imported with stay in sys.modules or on the package, so
+    the rest of the suite still sees U2F as unavailable.
+    """
+    class APDUError(Exception):
+        def __init__(self, code):
+            super(APDUError, self).__init__(code)
+            self.code = code
+
+    class DeviceError(Exception):
+        def __init__(self, code):
+            super(DeviceError, self).__init__(code)
+            self.code = code
+
+    u2flib_host = types.ModuleType('u2flib_host')
+    u2flib_host.u2f = types.ModuleType('u2flib_host.u2f')
+    u2flib_host.u2f.list_devices = lambda: []
+    u2flib_host.u2f.authenticate = lambda device, data, facet: None
+    u2flib_host.exc = types.ModuleType('u2flib_host.exc')
+    u2flib_host.exc.APDUError = APDUError
+    u2flib_host.exc.DeviceError = DeviceError
+    u2flib_host.appid = types.ModuleType('u2flib_host.appid')
+    u2flib_host.appid.verifier = types.ModuleType('u2flib_host.appid.verifier')
+    u2flib_host.constants = types.ModuleType('u2flib_host.constants')
+    u2flib_host.constants.APDU_USE_NOT_SATISFIED = 0x6985
+
+    stubs = {'u2flib_host': u2flib_host}
+    stubs.update(('u2flib_host.' + name, getattr(u2flib_host, name)) for name in ('u2f', 'exc', 'appid', 'constants'))
+    with patch.dict(sys.modules, stubs):
+        from aws_google_auth import u2f
+    delattr(aws_google_auth, 'u2f')
+    return u2f
+
+
+try:
+    from aws_google_auth import u2f
+except ImportError:
+    # The U2F libraries are an optional dependency
+    u2f = import_with_stub_u2flib()
+
+
+class TestU2fAuth(unittest.TestCase):
+
+    def setUp(self):
+        self.challenges = [{'keyHandle': 'first'}, {'keyHandle': 'second'}]
+
+    def not_touched(self):
+        return u2f.exc.APDUError(u2f.APDU_USE_NOT_SATISFIED)
+
+    def test_first_device_touched_wins(self):
+        idle, touched, unknown = Mock(name='idle'), Mock(name='touched'), Mock(name='unknown')
+        touch = threading.Event()
+        threading.Timer(0.3, touch.set).start()
+
+        def authenticate(device, challenge, facet):
+            if device is touched and touch.is_set() and 'second' in challenge:
+                return {'keyHandle': 'second'}
+            if device is unknown:
+                raise u2f.exc.APDUError(0x6A80)
+            raise self.not_touched()
+
+        with patch.object(u2f.u2f, 'list_devices', return_value=[idle, touched, unknown]), \
+                patch.object(u2f.u2f, 'authenticate', side_effect=authenticate):
+            with patch.object(u2f, 'print', create=True) as mock_print:
+                started = time.time()
+                response = u2f.u2f_auth(self.challenges, 'https://accounts.google.com')
+
+        self.assertEqual({'keyHandle': 'second'}, response)
+        # How long the touch took is shown after the prompt
+        self.assertEqual('Touch the flashing U2F device to authenticate...', mock_print.call_args_list[0][0][0])
+        self.assertTrue(re.match(r'^U2F device touched after 0\.\ds$', mock_print.call_args_list[-1][0][0]))
+        self.assertLess(time.time() - started, 0.3 + 5 * u2f.POLL_INTERVAL)
+        # The other devices stop polling and are closed
+        time.sleep(2 * u2f.POLL_INTERVAL)
+        for device in (idle, touched, unknown):
+            self.assertTrue(device.close.called)
+
+    def test_no_device_can_sign(self):
+        device = Mock()
+
+        with patch.object(u2f.u2f, 'list_devices', return_value=[device]), \
+                patch.object(u2f.u2f, 'authenticate', side_effect=u2f.exc.DeviceError(1)):
+            with self.assertRaises(RuntimeWarning):
+                u2f.u2f_auth(self.challenges, 'https://accounts.google.com')
+
+        self.assertTrue(device.close.called)
+
+    def test_device_that_cannot_be_opened_is_skipped(self):
+        broken = Mock()
+        broken.open.side_effect = IOError('busy')
+
+        with patch.object(u2f.u2f, 'list_devices', return_value=[broken]):
+            with self.assertRaises(RuntimeWarning):
+                u2f.u2f_auth(self.challenges, 'https://accounts.google.com')
+
+        self.assertEqual(2, broken.open.call_count)
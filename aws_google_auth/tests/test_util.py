@@ -5,6 +5,7 @@ import unittest
 
 from mock import patch, MagicMock
 
+from aws_google_auth import errors
 from aws_google_auth import util
 
 
@@ -50,6 +51,14 @@ class TestUtilMethods(unittest.TestCase):
         self.assertEqual(util.Util.unicode_to_string_if_needed(1234), 1234)
         self.assertEqual(util.Util.unicode_to_string_if_needed("nop"), "nop")
 
+    def test_parse_bool(self):
+        self.assertIsNone(util.Util.parse_bool(None))
+        for value in ('1', 'true', 'True', 'yes', 'on '):
+            self.assertTrue(util.Util.parse_bool(value))
+        for value in ('0', 'false', 'FALSE', 'no', 'off', ''):
+            self.assertIs(util.Util.parse_bool(value), False)
+        self.assertIsNone(util.Util.parse_bool('maybe'))
+
     @patch('getpass.getpass', spec=True)
     @patch('sys.stdin', spec=True)
     def test_get_password_when_tty(self, mock_stdin, mock_getpass):
@@ -65,3 +74,20 @@ class TestUtilMethods(unittest.TestCase):
         mock_stdin.readline = MagicMock(return_value="pass")
 
         self.assertEqual(util.Util.get_password("Test: "), "pass")
+
+    def test_background(self):
+        self.assertEqual(3, util.Background(sum, [1, 2]).result())
+
+        failed = util.Background(sys.exit, 1)
+        with self.assertRaises(SystemExit):
+            failed.result()
+
+    @patch('aws_google_auth.util.input', side_effect=AssertionError('prompted'))
+    def test_no_prompts_when_not_interactive(self, mock_input):
+        with self.assertRaises(errors.InputRequired):
+            util.Util.get_input("AWS Region: ", interactive=False)
+        with self.assertRaises(errors.InputRequired):
+            util.Util.get_password("Google Password: ", interactive=False)
+        with self.assertRaises(errors.InputRequired):
+            util.Util.pick_a_role({'arn:aws:iam::123456789012:role/admin': 'provider',
+                                   'arn:aws:iam::123456789012:role/read': 'provider'}, interactive=False)
@@ -0,0 +1,84 @@
+#!/usr/bin/env python
+
+import json
+import threading
+import time
+from collections import namedtuple
+from contextlib import contextmanager
+
+from aws_google_auth import metrics
+
+
+Phase = namedtuple('Phase', ['name', 'depth', 'start', 'duration'])
+
+
+class Timings(object):
+    """Record how long each phase of a run takes.
+
+    Phases nest: a phase entered while another one is running (on the same
+    thread) is reported underneath it, so the time spent in the login can be
+    broken down into its HTTP requests, parsing and the time spent waiting
+    for the user.
+
+    Phases given a `metric` name, and counters passed to `incr`, are also
+    forwarded to the metrics `sink` (see aws_google_auth.metrics).
+    """
+
+    def __init__(self, sink=None):
+        self.started = time.time()
+        self.phases = []
+        self.sink = metrics.NullSink() if sink is None else sink
+        self._lock = threading.Lock()
+        self._local = threading.local()
+
+    @contextmanager
+    def phase(self, name, metric=None):
+        depth = getattr(self._local, 'depth', 0)
+        self._local.depth = depth + 1
+        start = time.time()
+        try:
+            yield
+        finally:
+            end = time.time()
+            self._local.depth = depth
+            with self._lock:
+                self.phases.append(Phase(name, depth, start - self.started, end - start))
+            if metric is not None:
+                self.sink.timing(metric, (end - start) * 1000)
+
+    def incr(self, metric, value=1):
+        self.sink.incr(metric, value)
+
+    def close(self):
+        self.sink.close()
+
+    @property
+    def total(self):
+        return time.time() - self.started
+
+    def as_dict(self):
+        with self._lock:
+            phases = sorted(self.phases, key=lambda p: p.start)
+        return {
+            'total_ms': round(self.total * 1000, 1),
+            'phases': [{'name': p.name,
+                        'depth': p.depth,
+                        'start_ms': round(p.start * 1000, 1),
+                        'duration_ms': round(p.duration * 1000, 1)} for p in phases],
+        }
+
+    def report(self, output_format='text'):
+        report = self.as_dict()
+        if output_format == 'json':
+            return json.dumps(report)
+
+        rows = [['  ' * p['depth'] + p['name'], p['start_ms'], p['duration_ms']] for p in report['phases']]
+        rows.append(['total', None, report['total_ms']])
+        # tabulate strips leading whitespace, which would flatten the nesting.
+        width = max(len(row[0]) for row in rows + [['Phase']])
+        lines = ['{:<{}}  {:>10}  {:>13}'.format('Phase', width, 'Start (ms)', 'Duration (ms)'),
+                 '{}  {}  {}'.format('-' * width, '-' * 10, '-' * 13)]
+        for name, start, duration in rows:
+            lines.append('{:<{}}  {:>10}  {:>13.1f}'.format(
+                name, width, '' if start is None else '{:.1f}'.format(start), duration))
+        return '\n'.join(lines)
@@ -0,0 +1,52 @@
+#!/usr/bin/env python
+
+import base64
+import binascii
+import hashlib
+import hmac
+import struct
+import time
+
+# Google Authenticator codes: six digits, a new one every 30 seconds (RFC 6238
+# defaults, HMAC-SHA1).
+DIGITS = 6
+PERIOD = 30
+
+# Keyring service the TOTP secrets are stored under, one per username, next
+# to the passwords stored under "aws-google-auth".
+KEYRING_SERVICE = 'aws-google-auth-totp'
+
+
+def decode_secret(secret):
+    """The key of a base32 TOTP secret, as shown when setting up an authenticator.
+
+    Spaces, dashes, lower case and missing padding are accepted. Raises
+    ValueError if `secret` is not base32.
+    """
+    secret = secret.replace(' ', '').replace('-', '').upper()
+    secret += '=' * (-len(secret) % 8)
+    try:
+        key = base64.b32decode(secret)
+    except (TypeError, binascii.Error) as ex:
+        raise ValueError("Invalid TOTP secret: {}".format(ex))
+    if not key:
+        raise ValueError("Invalid TOTP secret: it is empty")
+    return key
+
+
+def time_step(for_time=None, period=PERIOD):
+    """The RFC 6238 counter for `for_time` (now by default)."""
+    return int((time.time() if for_time is None else for_time) // period)
+
+
+def hotp(key, counter, digits=DIGITS):
+    """The RFC 4226 one-time password of `key` for `counter`."""
+    digest = bytearray(hmac.new(key, struct.pack('>Q', counter), hashlib.sha1).digest())
+    offset = digest[-1] & 0x0f
+    value = struct.unpack('>I', bytes(digest[offset:offset + 4]))[0] & 0x7fffffff
+    return str(value % 10 ** digits).zfill(digits)
+
+
+def totp(secret, for_time=None, digits=DIGITS, period=PERIOD):
+    """The current (or `for_time`'s) code of the base32 `secret`."""
+    return hotp(decode_secret(secret), time_step(for_time, period), digits)
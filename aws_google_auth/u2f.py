@@ -1,9 +1,11 @@
 #!/usr/bin/env python
 
 import json
+import threading
 import time
 
 import requests
+from six.moves import queue
 from u2flib_host import u2f, exc, appid
 from u2flib_host.constants import APDU_USE_NOT_SATISFIED
 
@@ -42,49 +44,92 @@ def __appid_verifier__valid_facets(app_id, facets):
     return facets
 
 
-def u2f_auth(challenges, facet):
-    devices = u2f.list_devices()
-    for device in devices[:]:
+# How often a device that is waiting for a touch is asked again
+POLL_INTERVAL = 0.1
+
+
+def open_device(device):
+    try:
+        device.open()
+    except:
+        # Some U2F devices fail on the first attempt to open but
+        # succeed on subsequent attempts. So retry once.
         try:
             device.open()
         except:
-            # Some U2F devices fail on the first attempt to open but
-            # succeed on subsequent attempts. So retry once.
+            return False
+    return True
+
+
+def u2f_auth(challenges, facet):
+    """Sign one of `challenges` with whichever U2F device is touched first.
+
+    Every device is polled on its own thread; as soon as one of them signs,
+    the others stop and are closed. Raises RuntimeWarning if no device can
+    sign any of the challenges.
+    """
+    devices = u2f.list_devices()
+    if not devices:
+        raise RuntimeWarning("U2F Device Not Found")
+
+    done = threading.Event()
+    prompt_lock = threading.Lock()
+    prompted = []
+    results = queue.Queue()
+
+    def prompt():
+        with prompt_lock:
+            if not prompted:
+                print('Touch the flashing U2F device to '
+                      'authenticate...')
+                prompted.append(time.time())
+
+    def poll(device):
+        response = None
+        try:
+            if not open_device(device):
+                return
             try:
-                device.open()
-            except:
-                devices.remove(device)
+                while not done.is_set():
+                    waiting = False
+                    for challenge in challenges:
+                        try:
+                            response = u2f.authenticate(device, json.dumps(challenge), facet)
+                            return
+                        except exc.APDUError as e:
+                            if e.code == APDU_USE_NOT_SATISFIED:
+                                waiting = True
+                                prompt()
+                        except exc.DeviceError:
+                            pass
+                    if not waiting:
+                        # This device holds none of the key handles
+                        return
+                    done.wait(POLL_INTERVAL)
+            finally:
+                device.close()
+        finally:
+            results.put(response)
+
+    threads = [threading.Thread(target=poll, args=(device,)) for device in devices]
+    for thread in threads:
+        thread.daemon = True
+        thread.start()
 
     try:
-        prompted = False
-        while devices:
-            removed = []
-            for device in devices:
-                remove = True
-                for challenge in challenges:
-                    try:
-                        return u2f.authenticate(device, json.dumps(challenge),
-                                                facet)
-                    except exc.APDUError as e:
-                        if e.code == APDU_USE_NOT_SATISFIED:
-                            remove = False
-                            if not prompted:
-                                print('Touch the flashing U2F device to '
-                                      'authenticate...')
-                                prompted = True
-                        else:
-                            pass
-                    except exc.DeviceError:
-                        pass
-                if remove:
-                    removed.append(device)
-            devices = [d for d in devices if d not in removed]
-            for d in removed:
-                d.close()
-            time.sleep(0.25)
+        for _ in threads:
+            while True:
+                try:
+                    response = results.get(timeout=0.5)
+                    break
+                except queue.Empty:
+                    continue
+            if response is not None:
+                if prompted:
+                    print('U2F device touched after {:.1f}s'.format(time.time() - prompted[0]))
+                return response
     finally:
-        for device in devices:
-            device.close()
+        done.set()
     raise RuntimeWarning("U2F Device Not Found")
 
 
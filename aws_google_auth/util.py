@@ -3,66 +3,99 @@
 from __future__ import print_function
 
 import getpass
+import logging
 import os
+import stat
 import sys
-from collections import OrderedDict
+import tempfile
+import threading
+from contextlib import contextmanager
 
 from six.moves import input
-from tabulate import tabulate
+
+from aws_google_auth import errors
+from aws_google_auth import picker
+
+
+class Background(object):
+    """Run `target(*args)` on a daemon thread.
+
+    `result()` waits for it to finish and returns what it returned, or raises
+    what it raised (e.g. the errors.NetworkError of a failed request), in the
+    calling thread. Nobody has to wait for it if the result is not needed.
+    """
+
+    def __init__(self, target, *args):
+        self._result = None
+        self._error = None
+        self._thread = threading.Thread(target=self._run, args=(target,) + args)
+        self._thread.daemon = True
+        self._thread.start()
+
+    def _run(self, target, *args):
+        try:
+            self._result = target(*args)
+        except BaseException as ex:
+            self._error = ex
+
+    def result(self):
+        self._thread.join()
+        if self._error is not None:
+            raise self._error
+        return self._result
+
+
+@contextmanager
+def atomic_write(file_name):
+    """Open a temporary file that replaces `file_name` when the block exits.
+
+    Readers that do not take the file's lock then see either the old or the
+    new contents, never a half written file. The permissions of the file
+    being replaced are kept (0600 for a new file). Nothing is replaced if the
+    block raises. A symlink is followed, so that the file it points to is
+    replaced rather than the link.
+    """
+    file_name = os.path.realpath(file_name)
+    directory = os.path.dirname(file_name)
+    fd, temp_name = tempfile.mkstemp(dir=directory, prefix='.' + os.path.basename(file_name) + '.')
+    try:
+        if os.path.exists(file_name):
+            os.chmod(temp_name, stat.S_IMODE(os.stat(file_name).st_mode))
+        with os.fdopen(fd, 'w') as f:
+            yield f
+        getattr(os, 'replace', os.rename)(temp_name, file_name)
+    except BaseException:
+        os.unlink(temp_name)
+        raise
 
 
 class Util:
 
+    # Prompts take `interactive`, False in --non-interactive runs: they then
+    # raise errors.InputRequired instead of waiting for an answer.
+
     @staticmethod
-    def get_input(prompt):
+    def get_input(prompt, interactive=True):
+        Util._raise_if_not_interactive(prompt, interactive)
         return input(prompt)
 
     @staticmethod
-    def pick_a_role(roles, aliases=None, account=None):
+    def _raise_if_not_interactive(prompt, interactive):
+        if not interactive:
+            raise errors.InputRequired("An answer to '{}' is needed, but prompts are disabled.".format(prompt.strip()))
+
+    @staticmethod
+    def pick_a_role(roles, aliases=None, account=None, history=None, interactive=True):
         if account:
             filtered_roles = {role: principal for role, principal in roles.items() if(account in role)}
         else:
             filtered_roles = roles
 
-        if aliases:
-            enriched_roles = {}
-            for role, principal in filtered_roles.items():
-                enriched_roles[role] = [
-                    aliases[role.split(':')[4]],
-                    role.split('role/')[1],
-                    principal
-                ]
-            enriched_roles = OrderedDict(sorted(enriched_roles.items(), key=lambda t: (t[1][0], t[1][1])))
-
-            ordered_roles = OrderedDict()
-            for role, role_property in enriched_roles.items():
-                ordered_roles[role] = role_property[2]
-
-            enriched_roles_tab = []
-            for i, (role, role_property) in enumerate(enriched_roles.items()):
-                enriched_roles_tab.append([i + 1, role_property[0], role_property[1]])
-
-            while True:
-                print(tabulate(enriched_roles_tab, headers=['No', 'AWS account', 'Role'], ))
-                prompt = 'Type the number (1 - {:d}) of the role to assume: '.format(len(enriched_roles))
-                choice = Util.get_input(prompt)
-
-                try:
-                    return list(ordered_roles.items())[int(choice) - 1]
-                except (IndexError, ValueError):
-                    print("Invalid choice, try again.")
-        else:
-            while True:
-                for i, role in enumerate(filtered_roles):
-                    print("[{:>3d}] {}".format(i + 1, role))
-
-                prompt = 'Type the number (1 - {:d}) of the role to assume: '.format(len(filtered_roles))
-                choice = Util.get_input(prompt)
-
-                try:
-                    return list(filtered_roles.items())[int(choice) - 1]
-                except (IndexError, ValueError):
-                    print("Invalid choice, try again.")
+        role, principal = picker.pick(picker.RoleIndex(filtered_roles, aliases, history),
+                                      lambda prompt: Util.get_input(prompt, interactive))
+        if history:
+            history.record(role)
+        return role, principal
 
     @staticmethod
     def touch(file_name, mode=0o600):
@@ -83,6 +116,20 @@ class Util:
                 return value
         return None
 
+    @staticmethod
+    def parse_bool(value):
+        """True or False from an environment variable's `value` (1/0,
+        true/false, yes/no, on/off), or None if it is unset or unrecognised."""
+        if value is None:
+            return None
+        value = value.strip().lower()
+        if value in ('1', 'true', 'yes', 'on'):
+            return True
+        if value in ('0', 'false', 'no', 'off', ''):
+            return False
+        logging.warning('%s: ignoring %r, expected true or false', __name__, value)
+        return None
+
     @staticmethod
     def unicode_to_string_if_needed(object):
         if "unicode" in str(object.__class__):
@@ -91,7 +138,8 @@ class Util:
             return object
 
     @staticmethod
-    def get_password(prompt):
+    def get_password(prompt, interactive=True):
+        Util._raise_if_not_interactive(prompt, interactive)
         if sys.stdin.isatty():
             password = getpass.getpass(prompt)
         else:
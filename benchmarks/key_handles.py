@@ -0,0 +1,116 @@
+#!/usr/bin/env python
+"""Time key handle extraction from security key challenge payloads.
+
+The payloads are taken from the recorded flows under aws_google_auth/tests/flows
+(or the flow directories given on the command line, as written by
+--save-saml-flow), plus a synthetic large one, and each is run through the
+current Google.find_key_handles and the recursive walk it replaced, which
+base64-decoded every string and dropped the failures with a bare except.
+
+    $ python benchmarks/key_handles.py [-n 200] [flow_dir ...]
+"""
+from __future__ import print_function
+
+import argparse
+import base64
+import json
+import os
+import sys
+import timeit
+
+from bs4 import BeautifulSoup
+from tabulate import tabulate
+
+from aws_google_auth import google
+from aws_google_auth import replay
+
+FLOWS = os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir,
+                     'aws_google_auth', 'tests', 'flows')
+
+
+def previous_find_key_handles(input, challengeTxt):
+    keyHandles = []
+    typeOfInput = type(input)
+    if typeOfInput == dict:
+        for item in input:
+            keyHandles.extend(previous_find_key_handles(input[item], challengeTxt))
+    elif typeOfInput == list:
+        array = list(filter(None, input))
+        for item in array:
+            typeValue = type(item)
+            if typeValue == list:
+                keyHandles.extend(previous_find_key_handles(item, challengeTxt))
+            elif typeValue == int or typeValue == bool:
+                continue
+            else:
+                try:
+                    base64UrlEncoded = base64.urlsafe_b64encode(base64.b64decode(item))
+                    if base64UrlEncoded != challengeTxt:
+                        keyHandles.append(base64UrlEncoded)
+                except:
+                    pass
+    return keyHandles
+
+
+def recorded_payloads(flow_dir):
+    """(name, payload, challenge) for every security key page of a recorded flow."""
+    payloads = []
+    for exchange in replay.load_flow(flow_dir):
+        if 'data-challenge-ui' not in exchange.body:
+            continue
+        page = BeautifulSoup(exchange.body, 'html.parser')
+        field = page.find('div', {'jsname': 'C0oDBd'})
+        challenge = page.find('input', {'name': 'id-challenge'})
+        if field is None or challenge is None:
+            continue
+        text = field.get('data-challenge-ui')
+        payload = json.loads(text[text.find('{'):text.rfind('}') + 1])
+        challenge_txt = base64.urlsafe_b64encode(base64.b64decode(challenge.get('value')))
+        payloads.append(('{} {}'.format(os.path.basename(os.path.normpath(flow_dir)), exchange.path),
+                         payload, challenge_txt))
+    return payloads
+
+
+def synthetic_payload(key_handles=20, filler=5000):
+    """A challenge page payload padded with the kind of strings large pages carry."""
+    challenge = base64.b64encode(b'C' * 32).decode()
+    handles = [[2, base64.b64encode(os.urandom(64)).decode(), [1, 2]] for _ in range(key_handles)]
+    noise = [[None, 'https://accounts.google.com/signin/challenge/sk/{}'.format(i), i, 'text {}'.format(i),
+              base64.b64encode(os.urandom(12)).decode()] for i in range(filler)]
+    payload = {'1010': noise,
+               '5010': [None, None, None, 'https://accounts.google.com/signin/challenge/sk/5', None,
+                        ['google.com', challenge, handles,
+                         '{"appid":"https://www.gstatic.com/securitykey/origins.json"}']]}
+    return ('synthetic ({} handles, {} filler entries)'.format(key_handles, filler), payload,
+            base64.urlsafe_b64encode(base64.b64decode(challenge)))
+
+
+def main(argv):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('-n', '--iterations', type=int, default=200)
+    parser.add_argument('flows', nargs='*')
+    args = parser.parse_args(argv)
+
+    flows = args.flows or sorted(os.path.join(FLOWS, name) for name in os.listdir(FLOWS))
+    payloads = [payload for flow_dir in flows for payload in recorded_payloads(flow_dir)]
+    payloads.append(synthetic_payload())
+
+    rows = []
+    for name, payload, challenge in payloads:
+        current = google.Google.find_key_handles(payload, challenge)
+        previous = previous_find_key_handles(payload, challenge)
+        if set(current) - set(previous):
+            raise RuntimeError("{}: unexpected key handles {}".format(name, set(current) - set(previous)))
+
+        timings = []
+        for function in (previous_find_key_handles, google.Google.find_key_handles):
+            best = min(timeit.repeat(lambda: function(payload, challenge), number=args.iterations, repeat=3))
+            timings.append(best / args.iterations * 1e6)
+        rows.append([name, len(current), timings[0], timings[1], timings[0] / timings[1]])
+
+    print(tabulate(rows, headers=['Payload', 'Handles', 'previous (us)', 'current (us)', 'speed-up'],
+                   floatfmt='.1f'))
+
+
+if __name__ == '__main__':
+    main(sys.argv[1:])
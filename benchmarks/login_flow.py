@@ -0,0 +1,91 @@
+#!/usr/bin/env python
+"""Time the full Google login for every recorded challenge type.
+
+Each flow under aws_google_auth/tests/flows (or the directories given on the
+command line, as written by --save-saml-flow) is replayed against a local
+stub IdP, so no network access is needed and the numbers only reflect the
+client side: HTTP round trips over loopback, HTML parsing and challenge
+handling.
+
+    $ python benchmarks/login_flow.py [-n 20] [flow_dir ...]
+"""
+from __future__ import print_function
+
+import argparse
+import json
+import os
+import sys
+import time
+
+from mock import Mock, patch
+from tabulate import tabulate
+
+from aws_google_auth import google
+from aws_google_auth import replay
+
+FLOWS = os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir,
+                     'aws_google_auth', 'tests', 'flows')
+
+
+def login_once(stub, answers):
+    config = Mock()
+    config.idp_id = "C01abc23d"
+    config.sp_id = "123456789012"
+    config.username = "user@example.com"
+    config.password = "hunter2"
+    config.bg_response = None
+    config.totp_secret = None
+
+    stub.reset()
+    with patch('aws_google_auth.google.input', side_effect=answers, create=True), \
+            patch('aws_google_auth.google.u2f', create=True) as mock_u2f, \
+            patch('aws_google_auth.google.print', create=True):
+        mock_u2f.u2f_auth.return_value = {"keyHandle": "S0VZSEFORExFMQ"}
+
+        start = time.time()
+        client = google.Google(config, save_failure=False,
+                               base_url=stub.base_url, api_url=stub.base_url)
+        client.do_login()
+        client.parse_saml()
+        elapsed = time.time() - start
+
+    if stub.mismatches or not stub.finished:
+        raise RuntimeError("Replay diverged from the recording: {}".format(stub.mismatches))
+    return elapsed
+
+
+def benchmark(flow_dir, iterations):
+    answers_file = os.path.join(flow_dir, 'answers.json')
+    answers = []
+    if os.path.exists(answers_file):
+        with open(answers_file) as fp:
+            answers = json.load(fp)
+
+    with replay.StubIdP(replay.load_flow(flow_dir)) as stub:
+        login_once(stub, list(answers))  # warm up
+        timings = sorted(login_once(stub, list(answers)) for _ in range(iterations))
+
+    return timings
+
+
+def main(argv):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('-n', '--iterations', type=int, default=20)
+    parser.add_argument('flows', nargs='*')
+    args = parser.parse_args(argv)
+
+    flows = args.flows or sorted(os.path.join(FLOWS, name) for name in os.listdir(FLOWS))
+
+    rows = []
+    for flow_dir in flows:
+        timings = benchmark(flow_dir, args.iterations)
+        rows.append([os.path.basename(os.path.normpath(flow_dir)),
+                     timings[0] * 1000,
+                     timings[len(timings) // 2] * 1000,
+                     timings[-1] * 1000])
+
+    print(tabulate(rows, headers=['Flow', 'min (ms)', 'median (ms)', 'max (ms)'], floatfmt='.1f'))
+
+
+if __name__ == '__main__':
+    main(sys.argv[1:])
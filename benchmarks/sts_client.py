@@ -0,0 +1,112 @@
+#!/usr/bin/env python
+"""Compare the cold start and memory use of the two AssumeRoleWithSAML paths.
+
+Each run is a fresh interpreter that imports aws_google_auth (as the command
+line tool does), then creates a client and calls AssumeRoleWithSAML once
+against a local stub STS endpoint: either a boto3 STS client (the previous
+path) or aws_google_auth.sts.STSClient. The client time covers importing
+boto3 where needed, creating the client and the call; the peak RSS is the
+child's maximum resident set size.
+
+    $ python benchmarks/sts_client.py [-n 10]
+"""
+from __future__ import print_function
+
+import argparse
+import json
+import os
+import subprocess
+import sys
+import threading
+
+from six.moves import BaseHTTPServer
+from tabulate import tabulate
+
+RESPONSE = b"""<AssumeRoleWithSAMLResponse xmlns="https://sts.amazonaws.com/doc/2011-06-15/">
+  <AssumeRoleWithSAMLResult>
+    <AssumedRoleUser>
+      <AssumedRoleId>AROAEXAMPLE:user@example.com</AssumedRoleId>
+      <Arn>arn:aws:sts::123456789012:assumed-role/admin/user@example.com</Arn>
+    </AssumedRoleUser>
+    <Credentials>
+      <AccessKeyId>ASIAEXAMPLE</AccessKeyId>
+      <SecretAccessKey>secret</SecretAccessKey>
+      <SessionToken>token</SessionToken>
+      <Expiration>2030-01-01T00:00:00Z</Expiration>
+    </Credentials>
+  </AssumeRoleWithSAMLResult>
+  <ResponseMetadata><RequestId>benchmark</RequestId></ResponseMetadata>
+</AssumeRoleWithSAMLResponse>"""
+
+CHILD = """
+import json, resource, sys, time
+start = time.time()
+import aws_google_auth
+ready = time.time()
+if sys.argv[1] == 'boto3':
+    import boto3
+    client = boto3.client('sts', region_name='us-east-1', endpoint_url=sys.argv[2])
+else:
+    from aws_google_auth import sts
+    client = sts.STSClient(endpoint=sys.argv[2])
+client.assume_role_with_saml(RoleArn='arn:aws:iam::123456789012:role/admin',
+                             PrincipalArn='arn:aws:iam::123456789012:saml-provider/GoogleApps',
+                             SAMLAssertion='c2FtbA==')
+end = time.time()
+rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+print(json.dumps({'package': ready - start, 'client': end - ready,
+                  'rss': rss / 1024.0 if sys.platform != 'darwin' else rss / 1048576.0}))
+"""
+
+
+class Handler(BaseHTTPServer.BaseHTTPRequestHandler):
+
+    def do_POST(self):
+        self.rfile.read(int(self.headers.get('Content-Length', 0)))
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/xml')
+        self.send_header('Content-Length', str(len(RESPONSE)))
+        self.end_headers()
+        self.wfile.write(RESPONSE)
+
+    def log_message(self, *args):
+        pass
+
+
+def run(path, endpoint):
+    env = dict(os.environ, AWS_ACCESS_KEY_ID='unused', AWS_SECRET_ACCESS_KEY='unused')
+    output = subprocess.check_output([sys.executable, '-c', CHILD, path, endpoint], env=env)
+    return json.loads(output.decode('utf-8'))
+
+
+def median(values):
+    values = sorted(values)
+    return values[len(values) // 2]
+
+
+def main(argv):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('-n', '--iterations', type=int, default=10)
+    args = parser.parse_args(argv)
+
+    server = BaseHTTPServer.HTTPServer(('127.0.0.1', 0), Handler)
+    thread = threading.Thread(target=server.serve_forever)
+    thread.daemon = True
+    thread.start()
+    endpoint = 'http://127.0.0.1:{}'.format(server.server_address[1])
+
+    rows = []
+    for path in ('boto3', 'requests'):
+        runs = [run(path, endpoint) for _ in range(args.iterations)]
+        rows.append([path,
+                     median(r['package'] for r in runs) * 1000,
+                     median(r['client'] for r in runs) * 1000,
+                     max(r['rss'] for r in runs)])
+    server.shutdown()
+
+    print(tabulate(rows, headers=['Client', 'import package (ms)', 'client + call (ms)', 'peak RSS (MB)'],
+                   floatfmt='.1f'))
+
+
+if __name__ == '__main__':
+    main(sys.argv[1:])